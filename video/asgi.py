@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'video.settings')
 
+# ASGI first: route the video list and API reads to the async views (set VIDEO_ASYNC_VIEWS=0 to use the sync ones)
+os.environ.setdefault('VIDEO_ASYNC_VIEWS', '1')
+
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Request timing, query counts and Server-Timing headers, off unless VIDEO_PERF_SAMPLE_RATE is set (see below)
+    'video_collection.middleware.PerformanceMiddleware',
+    # Reads on the default database for writes and for a few seconds after them, only with read replicas set up
+    'video_collection.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,12 +57,20 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'video.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
+        'APP_DIRS': False,
         'OPTIONS': {
+            # Outside DEBUG templates are compiled once per process and kept by the cached loader,
+            # in DEBUG they are read again on every request so changes show up straight away
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -74,13 +87,113 @@ WSGI_APPLICATION = 'video.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Pick the database with the VIDEO_DB_ENGINE environment variable: sqlite (default) or postgres
+# Connections are kept open between requests for VIDEO_DB_CONN_MAX_AGE seconds instead of reopened every request
+
+VIDEO_DB_ENGINE = os.environ.get('VIDEO_DB_ENGINE', 'sqlite')
+
+VIDEO_DB_CONN_MAX_AGE = int(os.environ.get('VIDEO_DB_CONN_MAX_AGE', '60'))
+
+if VIDEO_DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('VIDEO_DB_NAME', 'video'),
+            'USER': os.environ.get('VIDEO_DB_USER', 'video'),
+            'PASSWORD': os.environ.get('VIDEO_DB_PASSWORD', ''),
+            'HOST': os.environ.get('VIDEO_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('VIDEO_DB_PORT', '5432'),
+            'CONN_MAX_AGE': VIDEO_DB_CONN_MAX_AGE,
+            # Check a kept connection still works before using it for a new request
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+            # Set VIDEO_DB_PGBOUNCER=1 when connecting through PgBouncer in transaction pooling mode.
+            # Server side cursors (used by .iterator()) don't work across pooled transactions
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('VIDEO_DB_PGBOUNCER', '') == '1',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('VIDEO_DB_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': VIDEO_DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Seconds to wait for a lock before 'database is locked' (SQLite's busy timeout, the PRAGMAs
+                # in video_collection/db.py leave it alone)
+                'timeout': 20,
+            },
+            # Tests use a file too, not SQLite's shared in-memory database. Its table locks fail straight away
+            # with 'database table is locked' instead of waiting, which breaks the worker tests running jobs in threads
+            'TEST': {
+                'NAME': os.environ.get('VIDEO_TEST_DB_PATH', BASE_DIR / 'test_db.sqlite3'),
+            },
+        }
+    }
+
+# Read replicas, see video_collection/routers.py. Reads for the video pages, search and the API go to the replicas,
+# writes to the default database. Set VIDEO_DB_REPLICA_HOSTS (postgres) or VIDEO_DB_REPLICA_PATHS (sqlite) to
+# comma separated hosts or database files e.g( VIDEO_DB_REPLICA_PATHS=/srv/video/replica1.sqlite3 ), they get
+# the aliases replica1, replica2... and share the default database's other settings.
+# For SQLite replicas, python manage.py sync_sqlite_replicas copies the default database to them.
+if VIDEO_DB_ENGINE == 'postgres':
+    _replica_key, _replicas = 'HOST', os.environ.get('VIDEO_DB_REPLICA_HOSTS', '')
+else:
+    _replica_key, _replicas = 'NAME', os.environ.get('VIDEO_DB_REPLICA_PATHS', '')
+
+VIDEO_DB_REPLICAS = []
+for _number, _replica in enumerate(filter(None, (value.strip() for value in _replicas.split(','))), start=1):
+    DATABASES[f'replica{_number}'] = {
+        **DATABASES['default'],
+        _replica_key: _replica,
+        # Tests use the default test database for the replicas too
+        'TEST': {'MIRROR': 'default'},
     }
+    VIDEO_DB_REPLICAS.append(f'replica{_number}')
+
+DATABASE_ROUTERS = ['video_collection.routers.ReplicaRouter']
+
+# Seconds a browser's reads stay on the default database after it sent a POST (or other write), so users see
+# their own changes while the replicas catch up. Set it above the usual replica lag
+VIDEO_REPLICA_PIN_SECONDS = int(os.environ.get('VIDEO_REPLICA_PIN_SECONDS', '10'))
+# Seconds the replicas can be behind. Pages read from a replica this soon after a change aren't cached
+VIDEO_REPLICA_LAG = int(os.environ.get('VIDEO_REPLICA_LAG', '2'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Pick the backend with the VIDEO_CACHE_BACKEND environment variable: locmem (default), file or db
+# The db backend needs its table made first with: python manage.py createcachetable
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'video-collection',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('VIDEO_CACHE_LOCATION', str(BASE_DIR / '.cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'video_collection_cache',
+    },
 }
 
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('VIDEO_CACHE_BACKEND', 'locmem')],
+}
+
+# Cache alias and how long (seconds) to keep cached video list pages
+VIDEO_CACHE_ALIAS = 'default'
+
+VIDEO_LIST_CACHE_TIMEOUT = 300
+
+# Seconds a rendered video card is kept, cards are keyed on the video's updated_at so they never go out of date
+VIDEO_CARD_CACHE_TIMEOUT = 24 * 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -117,8 +230,79 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# In production (DEBUG off) `python manage.py collectstatic` writes content hashed, precompressed copies of the
+# static files (see video_collection/storage.py), served with a one year cache header by the static file view.
+# In DEBUG the files are served as they are from the app folders, so changes show up straight away
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'video_collection.storage.PrecompressedManifestStaticFilesStorage',
+    },
+}
+
+# Video thumbnails made by video_collection/thumbnails.py, kept in the static root next to the collected files.
+# Serve this folder at VIDEO_THUMBNAIL_URL from the web server in production (the thumbnail view does it otherwise).
+# Careful: collectstatic --clear deletes them, they are made again by the generate_thumbnail jobs
+VIDEO_THUMBNAIL_ROOT = Path(os.environ.get('VIDEO_THUMBNAIL_ROOT', STATIC_ROOT / 'thumbnails'))
+VIDEO_THUMBNAIL_URL = '/thumbnails/'
+# Where thumbnails come from: video_collection.thumbnails.YouTubeSource, or StubSource (offline)
+VIDEO_THUMBNAIL_SOURCE = os.environ.get('VIDEO_THUMBNAIL_SOURCE', 'video_collection.thumbnails.YouTubeSource')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Video list pagination
+# Number of videos on each page of the video list, users can pick their own with ?page_size= up to the max
+
+VIDEO_LIST_PAGE_SIZE = 25
+
+VIDEO_LIST_MAX_PAGE_SIZE = 200
+
+
+# Bulk import of videos (import_videos command and /import endpoint)
+# Rows checked and saved per transaction, and rows per INSERT statement
+
+VIDEO_IMPORT_BATCH_SIZE = 1000
+
+VIDEO_IMPORT_CHUNK_SIZE = 500
+
+# How many recent YT urls the url parser remembers
+VIDEO_URL_CACHE_SIZE = 4096
+
+
+# Serve the video list and API reads with the async views (video_collection.async_views)
+# video/asgi.py turns this on, so ASGI servers get the async views and WSGI servers the sync ones
+VIDEO_ASYNC_VIEWS = os.environ.get('VIDEO_ASYNC_VIEWS', '') == '1'
+
+
+# Share of requests (0 to 1) the performance middleware measures, 0 turns it off completely
+# Numbers are served in the Prometheus text format at /metrics
+VIDEO_PERF_SAMPLE_RATE = float(os.environ.get('VIDEO_PERF_SAMPLE_RATE', '0'))
+
+# YouTube metadata (title, channel, length) for the video detail page, see video_collection/metadata.py
+# Fetchers: video_collection.metadata.OEmbedFetcher (no key needed, no video length),
+# video_collection.metadata.DataAPIFetcher (needs VIDEO_YOUTUBE_API_KEY), video_collection.metadata.StubFetcher (offline)
+VIDEO_METADATA_FETCHER = os.environ.get('VIDEO_METADATA_FETCHER', 'video_collection.metadata.OEmbedFetcher')
+VIDEO_YOUTUBE_API_KEY = os.environ.get('VIDEO_YOUTUBE_API_KEY', '')
+# Seconds before metadata is fetched again, and before a failed fetch is tried again
+VIDEO_METADATA_TTL = 7 * 24 * 60 * 60
+VIDEO_METADATA_FAILURE_TTL = 60 * 60
+# Seconds before a page view looks at the table again for metadata that was missing or old (and queued to be fetched)
+VIDEO_METADATA_RECHECK_TIMEOUT = 60
+VIDEO_METADATA_TIMEOUT = 5
+
+# Background job queue (video_collection/jobs.py), jobs are run by `python manage.py run_worker`
+# Seconds a worker's claim on a job lasts, a job still running after that can be claimed by another worker
+VIDEO_JOBS_VISIBILITY_TIMEOUT = 300
+# Tries before a job is marked failed, and the retry delays (doubled every try, up to the max)
+VIDEO_JOBS_MAX_ATTEMPTS = 5
+VIDEO_JOBS_BACKOFF_BASE = 10
+VIDEO_JOBS_BACKOFF_MAX = 60 * 60
+# Jobs a worker runs at the same time
+VIDEO_JOBS_CONCURRENCY = 4
@@ -1,8 +1,207 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-from .models import Video
+from .forms import videoForm
+from .models import Playlist, PlaylistEntry, Tag, Video
+from .youtube import parse_video_id
+from . import caching, counters, duplicates, metadata, search, tagging, thumbnails
 
 # Register your models here.
 
-# Video class model
-admin.site.register(Video)
\ No newline at end of file
+# The video table can have millions of rows, so the video admin never counts or sorts the whole table:
+# the total comes from the maintained counter (counters.py), searches and filters are counted up to COUNT_LIMIT,
+# sorting is only offered on indexed columns, and the list only loads the columns it shows.
+# Bulk actions work through the selected videos BATCH_SIZE at a time, one transaction per batch,
+# so a long action never holds the database for the whole run.
+
+# Searches and filters are counted up to this many videos, pages after that can't be reached from the pager
+COUNT_LIMIT = getattr(settings, 'VIDEO_ADMIN_COUNT_LIMIT', 10_000)
+BATCH_SIZE = getattr(settings, 'VIDEO_ADMIN_BATCH_SIZE', 500)
+
+
+# The count without COUNT(*) over the whole table: the video counter for the unfiltered list,
+# a count that stops at COUNT_LIMIT for searches and filters
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        videos = self.object_list
+
+        if not videos.query.has_filters():
+            total = counters.total(videos.db)
+            if total is not None:
+                return total
+
+        return videos.order_by()[:COUNT_LIMIT].count()
+
+
+# Loads only the columns in list_display, the notes can be long
+class VideoChangeList(ChangeList):
+    def get_queryset(self, request):
+        return super().get_queryset(request).only('id', 'name', 'video_id', 'updated_at')
+
+
+# Selected videos in pk order, BATCH_SIZE at a time. Each batch is read after the last pk of the batch before,
+# so deleting or changing videos while going through them doesn't skip any
+def batches(queryset):
+    last_pk = 0
+
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE])
+        if not batch:
+            return
+
+        yield batch
+        last_pk = batch[-1].pk
+
+
+@admin.register(Video)
+class VideoAdmin(admin.ModelAdmin):
+    # Same checks as the add page (YouTube url, duplicates), and the tags field
+    form = videoForm
+    list_display = ['name', 'video_id', 'updated_at']
+    # Both have an index, name is only indexed as lower(name)
+    sortable_by = ['video_id', 'updated_at']
+    ordering = ['-updated_at']
+    # The real search is get_search_results(), this turns the search box on
+    search_fields = ['video_id']
+    search_help_text = 'Words in the name or notes (full text search), or a YouTube video id'
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ['revalidate_urls', 'delete_duplicates']
+
+    def get_changelist(self, request, **kwargs):
+        return VideoChangeList
+
+    # Full text index or the video_id index, never a LIKE '%term%' scan
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        matches = search.search(queryset, search_term).values('pk')
+        return queryset.filter(Q(pk__in=matches) | Q(video_id=search_term)), False
+
+    # The form's tags field isn't the model's tags field (a ManyToManyField through VideoTag),
+    # so it's kept out of the model fields and saved like the add page saves it
+    def get_form(self, request, obj=None, **kwargs):
+        kwargs['fields'] = videoForm._meta.fields
+        return super().get_form(request, obj, **kwargs)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        tagging.set_tags(form.instance, form.cleaned_data['tags'])
+
+    # Check every selected video's url again. Videos whose video_id doesn't match their url (e.g( changed with
+    # queryset.update() or raw SQL )) get the right one, unless another video already has it, then it's a duplicate
+    @admin.action(description='Re-validate YouTube URLs of selected videos')
+    def revalidate_urls(self, request, queryset):
+        invalid, duplicate, fixed = [], [], []
+
+        for batch in batches(queryset.only('id', 'url', 'video_id')):
+            with transaction.atomic():
+                changed = []
+
+                for video in batch:
+                    try:
+                        video_id = parse_video_id(video.url)
+                    except ValidationError:
+                        invalid.append(video.pk)
+                        continue
+
+                    if video_id == video.video_id:
+                        continue
+
+                    if Video.objects.filter(video_id=video_id).exclude(pk=video.pk).exists():
+                        duplicate.append(video.pk)
+                    else:
+                        video.video_id = video_id
+                        video.updated_at = timezone.now()
+                        changed.append(video)
+
+                Video.objects.bulk_update(changed, ['video_id', 'updated_at'])
+                fixed.extend(video.pk for video in changed)
+
+        if fixed:
+            # bulk_update() sends no signals: refresh the caches, duplicate check and YouTube details by hand
+            caching.bump_generation()
+            duplicates.known_ids.reset()
+            metadata.schedule_refresh_many(fixed)
+            thumbnails.schedule_many(fixed)
+
+        self.message_user(request, f'{len(fixed)} video ids fixed, {len(invalid)} invalid urls, '
+                                   f'{len(duplicate)} duplicates', messages.SUCCESS)
+        if invalid:
+            self.message_user(request, f'Invalid urls: video pks {_pk_list(invalid)}', messages.WARNING)
+        if duplicate:
+            self.message_user(request, f'Duplicates: video pks {_pk_list(duplicate)}', messages.WARNING)
+
+    # Delete selected videos whose url is for a YouTube video that an older video (lower pk) already has as its
+    # video_id, or that an older video in the same batch has the url of. The oldest one is kept
+    @admin.action(description='Delete selected videos that duplicate an older video')
+    def delete_duplicates(self, request, queryset):
+        deleted = 0
+
+        for batch in batches(queryset.only('id', 'name', 'url', 'video_id')):
+            parsed = {}
+            for video in batch:
+                try:
+                    parsed[video.pk] = parse_video_id(video.url)
+                except ValidationError:
+                    parsed[video.pk] = video.video_id
+
+            youtube_ids = set(parsed.values())
+            # The oldest video for every YouTube id in the batch, by video_id and by url
+            oldest = {}
+            for pk, video_id, url in (Video.objects.filter(Q(video_id__in=youtube_ids) | Q(pk__in=parsed))
+                                      .order_by('pk').values_list('pk', 'video_id', 'url')):
+                oldest.setdefault(video_id, pk)
+                try:
+                    oldest.setdefault(parse_video_id(url), pk)
+                except ValidationError:
+                    pass
+
+            duplicate_pks = [pk for pk, youtube_id in parsed.items() if oldest.get(youtube_id, pk) < pk]
+
+            with transaction.atomic():
+                # Through delete() so the counters, caches and tag counts are updated by the signals
+                deleted += Video.objects.filter(pk__in=duplicate_pks).delete()[1].get(Video._meta.label, 0)
+
+        self.message_user(request, f'{deleted} duplicate videos deleted', messages.SUCCESS)
+
+
+# The first few pks, the message would be too long with all of them
+def _pk_list(pks, limit=50):
+    shown = ', '.join(map(str, pks[:limit]))
+    return shown + (f' and {len(pks) - limit} more' if len(pks) > limit else '')
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug', 'video_count']
+    search_fields = ['slug']
+    prepopulated_fields = {'slug': ['name']}
+    # Kept up to date by the tag signals, fixed by `python manage.py reconcile_counters`
+    readonly_fields = ['video_count']
+
+
+# Videos in a playlist, picked by pk, a select of every video would load the whole table
+class PlaylistEntryInline(admin.TabularInline):
+    model = PlaylistEntry
+    raw_id_fields = ['video']
+    ordering = ['position']
+    extra = 1
+
+
+@admin.register(Playlist)
+class PlaylistAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug', 'updated_at']
+    search_fields = ['slug']
+    prepopulated_fields = {'slug': ['name']}
+    inlines = [PlaylistEntryInline]
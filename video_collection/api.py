@@ -0,0 +1,191 @@
+import json
+
+from django.db import IntegrityError
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from .forms import videoForm
+from .models import Video
+from .pagination import clean_page_size
+from . import autocomplete, counters, importers, listing
+
+# JSON API for other services, so they don't need to scrape the HTML pages
+#   GET  api/videos                 one page of videos, ?search_term= ?tag= ?cursor= ?page_size=
+#   POST api/videos                 add one video, body is {"name": ..., "url": ..., "notes": ..., "tags": [...]}
+#   GET  api/videos/all             every (matching) video, streamed as one JSON array
+#   POST api/videos/bulk            add many videos, body is a JSON array or JSON lines (application/x-ndjson)
+#   GET  api/videos/stats           number of videos, in total and by first letter of the name
+#   GET  api/videos/autocomplete    video names starting with ?q= for the search box, ?limit= up to 50
+#   GET  api/videos/<video_id>      one video
+
+# Rows fetched from the database at a time when streaming every video
+STREAM_CHUNK_SIZE = 2000
+
+# Columns sent for every video, streaming reads only these
+FIELDS = ['id', 'video_id', 'name', 'url', 'notes', 'updated_at']
+
+
+def video_to_dict(video):
+    return {
+        'id': video.pk,
+        'video_id': video.video_id,
+        'name': video.name,
+        'url': video.url,
+        'notes': video.notes,
+        'updated_at': video.updated_at.isoformat(),
+        # Prefetched for pages of videos (listing.with_tags())
+        'tags': [tag.name for tag in video.tags.all()],
+    }
+
+
+def row_to_dict(row):
+    row['updated_at'] = row['updated_at'].isoformat()
+    return row
+
+
+def error_response(message, status, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return request.build_absolute_uri(f'{reverse("api_videos")}?{query.urlencode()}')
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def videos(request):
+    if request.method == 'POST':
+        return _create_video(request)
+
+    # Same cached pages as the video list page
+    video_page = listing.load_page(*read_list_request(request))
+
+    return list_response(request, video_page)
+
+
+# Search term, order, cursor, page size, preview and tag for a list request (also used by the async API)
+def read_list_request(request):
+    return (request.GET.get('search_term') or None, None, request.GET.get('cursor'),
+            clean_page_size(request.GET.get('page_size')), False, request.GET.get('tag') or None)
+
+
+def list_response(request, video_page):
+    page = video_page.page
+
+    return JsonResponse({
+        'count': video_page.video_count,
+        'next': _page_url(request, page.next_cursor),
+        'previous': _page_url(request, page.previous_cursor),
+        'results': [video_to_dict(video) for video in page],
+    })
+
+
+def _create_video(request):
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return error_response('Invalid JSON', 400)
+
+    if not isinstance(data, dict):
+        return error_response('Expected a JSON object', 400)
+
+    # Same checks as the add page
+    form = videoForm(data)
+    if form.has_error('url', code='duplicate_video'):
+        return error_response('Duplicate video, video was already added before', 409)
+    if not form.is_valid():
+        return error_response('Invalid video', 400, errors=form.errors.get_json_data())
+
+    try:
+        video = form.save()
+    except IntegrityError:
+        return error_response('Duplicate video, video was already added before', 409)
+
+    return JsonResponse(video_to_dict(video), status=201)
+
+
+# Every video as one JSON array, written out while it's read from the database.
+# .iterator() reads the rows in chunks instead of loading the whole table, so memory stays flat for any table size
+@require_GET
+def all_videos(request):
+    rows = stream_query(request).iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+    return StreamingHttpResponse(_json_array(rows), content_type='application/json')
+
+
+# Every matching video in id order, only the columns the API sends
+def stream_query(request):
+    return listing.filtered_videos(request.GET.get('search_term') or None,
+                                   tag=request.GET.get('tag') or None).order_by('id').values(*FIELDS)
+
+
+def _json_array(rows):
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + json.dumps(row_to_dict(row))
+        separator = ','
+    yield ']'
+
+
+@csrf_exempt
+@require_POST
+def bulk_create_videos(request):
+    if request.content_type == 'application/x-ndjson':
+        # JSON lines are read from the request as they come in, a line that isn't UTF-8 is a row error
+        rows = importers.read_jsonl(request)
+    else:
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return error_response('Invalid JSON', 400)
+
+        if not isinstance(data, list):
+            return error_response('Expected a JSON array', 400)
+
+        # Number the rows from 1 so errors can point at them
+        rows = ((number, row if isinstance(row, dict) else 'Each item should be a JSON object')
+                for number, row in enumerate(data, start=1))
+
+    report = importers.import_rows(rows)
+
+    return JsonResponse(report.as_dict())
+
+
+# From the maintained counters, never counts the table
+@require_GET
+def video_stats(request):
+    return JsonResponse({'count': counters.total(), 'by_letter': counters.letter_counts()})
+
+
+# From the in-memory name index (autocomplete.py), no query. Browsers keep the answer for a minute,
+# so going back over the same letters doesn't ask again
+@require_GET
+@cache_control(max_age=60)
+def video_autocomplete(request):
+    query = request.GET.get('q', '')
+
+    try:
+        limit = int(request.GET.get('limit', autocomplete.DEFAULT_LIMIT))
+    except ValueError:
+        limit = autocomplete.DEFAULT_LIMIT
+
+    return JsonResponse({'query': query, 'suggestions': autocomplete.suggest(query, limit)})
+
+
+@require_GET
+def video_detail(request, video_id):
+    try:
+        video = Video.objects.prefetch_related('tags').get(video_id=video_id)
+    except Video.DoesNotExist:
+        return error_response('Video not found', 404)
+
+    return JsonResponse(video_to_dict(video))
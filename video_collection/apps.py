@@ -1,6 +1,34 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class VideoCollectionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'video_collection'
+
+    def ready(self):
+        # Connects the signal receivers for the Video model
+        from . import signals  # noqa: F401
+
+        # Tune every new SQLite connection (WAL, cache size...), see db.py
+        from .db import configure_sqlite_connection
+        connection_created.connect(configure_sqlite_connection)
+
+        # Lets the PerformanceMiddleware count and time each request's queries, see middleware.py
+        from .middleware import install_query_timer
+        connection_created.connect(install_query_timer)
+
+        # Make sure the full text search table and triggers exist after every migrate
+        post_migrate.connect(install_search_index, sender=self)
+
+
+def install_search_index(sender, using='default', **kwargs):
+    from django.db import router
+
+    from . import search
+    from .models import Video
+
+    # Not on read replicas, they get the index with the rest of the database
+    if router.allow_migrate_model(using, Video):
+        search.install(using)
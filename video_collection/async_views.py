@@ -0,0 +1,105 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Video
+from . import api, caching, listing, views
+
+# Async versions of the read-heavy views, for serving from an ASGI server (uvicorn, daphne...).
+# They use the async ORM (aiterator, acount, aget) and the cache's async methods, so the event loop
+# isn't handed to a thread for every request. They give back exactly the same pages and JSON as the sync views.
+# urls.py routes to these instead of the sync views when VIDEO_ASYNC_VIEWS is on (video/asgi.py turns it on).
+#
+# Note: on Django 4.2 the async ORM and most cache backends still run the database/cache call itself in a thread
+# (sync_to_async), the gain is in everything around it. Writes (add, import, create) stay sync.
+#
+# Django 4.2's view decorators (require_GET, condition...) don't work on async views, so their checks are done here.
+
+
+def _method_not_allowed(request, allowed):
+    if request.method not in allowed:
+        return HttpResponseNotAllowed(allowed)
+    return None
+
+
+async def video_list(request):
+    not_allowed = _method_not_allowed(request, ['GET', 'HEAD'])
+    if not_allowed:
+        return not_allowed
+
+    # Conditional GET, same as the @condition decorator on the sync video list
+    version = await listing.acatalogue_version()
+    etag = quote_etag(version.etag(request.GET.urlencode()))
+    last_modified = int(version.last_modified.timestamp()) if version.last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    if response is None:
+        search_form, search_term, order, cursor, page_size, tag = views.read_video_list_request(request)
+        video_page = await listing.aload_page(search_term, order, cursor, page_size, preview=True, tag=tag)
+        cards = await caching.aget_cards(video_page.page.items, views.render_video_card)
+
+        # Rendering is plain python, the page's videos, their tags and cards are already loaded
+        response = views.render_video_list(request, search_form, video_page, cards, tag)
+
+    response.headers.setdefault('ETag', etag)
+    if last_modified is not None:
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(response, no_cache=True)
+
+    return response
+
+
+async def api_videos(request):
+    # Creating videos stays on the sync view
+    if request.method == 'POST':
+        return await sync_to_async(api.videos)(request)
+
+    not_allowed = _method_not_allowed(request, ['GET', 'HEAD'])
+    if not_allowed:
+        return not_allowed
+
+    video_page = await listing.aload_page(*api.read_list_request(request))
+
+    return api.list_response(request, video_page)
+
+
+# Same as @csrf_exempt on the sync API (the decorator itself only works on sync views in Django 4.2)
+api_videos.csrf_exempt = True
+
+
+async def api_all_videos(request):
+    not_allowed = _method_not_allowed(request, ['GET', 'HEAD'])
+    if not_allowed:
+        return not_allowed
+
+    query = await sync_to_async(api.stream_query)(request)
+
+    # Django 4.2 streams async iterators, rows are read with aiterator() in chunks while they are sent
+    return StreamingHttpResponse(_json_array(query.aiterator(chunk_size=api.STREAM_CHUNK_SIZE)),
+                                 content_type='application/json')
+
+
+async def _json_array(rows):
+    yield '['
+    separator = ''
+    async for row in rows:
+        yield separator + json.dumps(api.row_to_dict(row))
+        separator = ','
+    yield ']'
+
+
+async def api_video_detail(request, video_id):
+    not_allowed = _method_not_allowed(request, ['GET', 'HEAD'])
+    if not_allowed:
+        return not_allowed
+
+    try:
+        video = await Video.objects.prefetch_related('tags').aget(video_id=video_id)
+    except Video.DoesNotExist:
+        return api.error_response('Video not found', 404)
+
+    return JsonResponse(api.video_to_dict(video))
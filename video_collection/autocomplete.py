@@ -0,0 +1,186 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+from django.conf import settings
+
+from .models import Video
+
+# Suggestions for the search box as users type, from video names in memory instead of a query per key press.
+# The index is a sorted list of lower-cased names. A lookup is a binary search to the first name starting with
+# what was typed, then a jump past each name's duplicates, so it costs the same for 100 or 1,000,000 videos
+# (python manage.py bench_autocomplete measures it).
+#
+# It's loaded from the video table the first time it's used in a process, then kept up to date by the Video signals
+# (see signals.py) once their transaction commits. Videos added by other processes are read every SYNC_INTERVAL
+# seconds (rows after the last pk read, like duplicates.py), and the whole index is loaded again every
+# REBUILD_INTERVAL seconds to drop names other processes renamed or deleted. A stale name only costs a search
+# with no results.
+#
+# Memory is bounded: at most MAX_NAMES names of at most KEY_LENGTH characters. Videos with the same name share
+# one string, so a duplicate costs one list slot. Past MAX_NAMES new names aren't suggested until a rebuild.
+
+MAX_NAMES = getattr(settings, 'VIDEO_AUTOCOMPLETE_MAX_NAMES', 1_000_000)
+KEY_LENGTH = getattr(settings, 'VIDEO_AUTOCOMPLETE_KEY_LENGTH', 100)
+SYNC_INTERVAL = getattr(settings, 'VIDEO_AUTOCOMPLETE_SYNC_INTERVAL', 5)
+REBUILD_INTERVAL = getattr(settings, 'VIDEO_AUTOCOMPLETE_REBUILD_INTERVAL', 15 * 60)
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+# Lower case, single spaces, cut to KEY_LENGTH e.g( '  Blinding   LIGHTS ' -> 'blinding lights' )
+def normalize_name(name):
+    return ' '.join((name or '').lower().split())[:KEY_LENGTH]
+
+
+# Same as normalize_name(), but a space at the end is kept, 'after ' shouldn't suggest 'afterlife'
+def normalize_query(query):
+    normalized = normalize_name(query)
+    if normalized and query[-1:].isspace():
+        normalized += ' '
+    return normalized
+
+
+class PrefixIndex:
+    def __init__(self, names=(), max_names=MAX_NAMES):
+        self.max_names = max_names
+        keys = sorted(normalize_name(name) for name in names)[:max_names]
+
+        # Duplicates point at the same string
+        for position in range(1, len(keys)):
+            if keys[position] == keys[position - 1]:
+                keys[position] = keys[position - 1]
+
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, name):
+        key = normalize_name(name)
+        position = bisect_left(self.keys, key)
+        return position < len(self.keys) and self.keys[position] == key
+
+    # Returns False when the index is full
+    def add(self, name):
+        key = normalize_name(name)
+        if not key:
+            return True
+        if len(self.keys) >= self.max_names:
+            return False
+
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            key = self.keys[position]
+
+        insort(self.keys, key)
+        return True
+
+    # Removes one video's name, the name stays if other videos have it too
+    def remove(self, name):
+        key = normalize_name(name)
+        position = bisect_left(self.keys, key)
+
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    # Up to limit different names starting with the query, in alphabetical order
+    def lookup(self, query, limit=DEFAULT_LIMIT):
+        prefix = normalize_query(query)
+        if not prefix:
+            return []
+
+        keys = self.keys
+        suggestions = []
+        position = bisect_left(keys, prefix)
+
+        while len(suggestions) < limit and position < len(keys) and keys[position].startswith(prefix):
+            suggestions.append(keys[position])
+            # Skip the other videos with the same name
+            position = bisect_right(keys, keys[position], position)
+
+        return suggestions
+
+
+class VideoNameIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        # Highest video pk read from the table, the next sync reads the rows after it
+        self.last_pk = 0
+        self.synced_at = 0.0
+        self.built_at = 0.0
+        self.rebuilding = False
+
+    def _build(self):
+        rows = Video.objects.order_by('pk').values_list('pk', 'name')[:MAX_NAMES]
+        names = []
+        last_pk = 0
+        for last_pk, name in rows.iterator(chunk_size=10000):
+            names.append(name)
+
+        return PrefixIndex(names), last_pk
+
+    # Videos other processes added since the last sync. This process' own videos are in the index already
+    def _read_since(self, pk):
+        rows = Video.objects.filter(pk__gt=pk).order_by('pk').values_list('pk', 'name')
+        for pk, name in rows.iterator(chunk_size=5000):
+            if name not in self.index:
+                self.index.add(name)
+            self.last_pk = pk
+
+        self.synced_at = time.monotonic()
+
+    def _sync(self):
+        if self.index is None:
+            self.index, self.last_pk = self._build()
+            self.built_at = self.synced_at = time.monotonic()
+        elif time.monotonic() - self.synced_at >= SYNC_INTERVAL:
+            self._read_since(self.last_pk)
+
+    # The periodic rebuild reads the table without holding the lock, other requests keep using the old index
+    # until the new one is swapped in. Videos added meanwhile are read by the next sync (they're after last_pk)
+    def _rebuild_if_due(self):
+        with self.lock:
+            if self.index is None or self.rebuilding or time.monotonic() - self.built_at < REBUILD_INTERVAL:
+                return
+            self.rebuilding = True
+
+        try:
+            index, last_pk = self._build()
+            with self.lock:
+                self.index, self.last_pk = index, last_pk
+                self.built_at = self.synced_at = time.monotonic()
+        finally:
+            self.rebuilding = False
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        self._rebuild_if_due()
+
+        with self.lock:
+            self._sync()
+            return self.index.lookup(query, limit)
+
+    # Called for this process' saved and deleted videos. Before the index is loaded there's nothing to do,
+    # loading it reads them from the table
+    def change(self, added=(), removed=()):
+        with self.lock:
+            if self.index is None:
+                return
+
+            for name in removed:
+                self.index.remove(name)
+            for name in added:
+                self.index.add(name)
+
+    def reset(self):
+        with self.lock:
+            self.index = None
+
+
+name_index = VideoNameIndex()
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    return name_index.suggest(query, max(1, min(limit, MAX_LIMIT)))
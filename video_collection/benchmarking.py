@@ -0,0 +1,50 @@
+import json
+import math
+import platform
+import time
+
+import django
+
+# Helpers shared by the bench_* management commands: latency percentiles, and saving results as JSON
+# so runs can be compared against each other later
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+
+    # Nearest rank
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# Latencies are in seconds, the summary is in milliseconds
+def summarize(latencies, elapsed=None):
+    latencies = sorted(latencies)
+
+    summary = {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+    if elapsed:
+        summary['per_second'] = round(len(latencies) / elapsed, 1)
+
+    return summary
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def write_results(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
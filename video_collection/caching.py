@@ -0,0 +1,227 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from . import routers
+
+# Result cache for the video list and search pages.
+# Pages are cached under a key made from the search term, tag, cursor, page size, order and columns (preview or all),
+# plus a generation number.
+# Any change to the videos bumps the generation (one cache incr), so every cached page is out of date at once
+# without having to find and delete them, the old entries just expire.
+#
+# With read replicas (routers.py) a page read from a replica just after a change may not have the change yet.
+# Those pages aren't cached until VIDEO_REPLICA_LAG seconds after the last change, so a stale page can't stay
+# cached under the new generation (and be shown to the users who made the change).
+
+CACHE_ALIAS = getattr(settings, 'VIDEO_CACHE_ALIAS', 'default')
+TIMEOUT = getattr(settings, 'VIDEO_LIST_CACHE_TIMEOUT', 300)
+
+GENERATION_KEY = 'video_list:generation'
+DELETED_AT_KEY = 'video_list:deleted_at'
+BUMPED_AT_KEY = 'video_list:bumped_at'
+
+REPLICA_LAG = getattr(settings, 'VIDEO_REPLICA_LAG', 2)
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+# Hit and miss counters for this process, shown by the cache_stats view
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
+
+    def reset(self):
+        with self.lock:
+            self.hits = self.misses = self.invalidations = 0
+
+
+stats = CacheStats()
+
+
+def get_generation():
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+
+    if generation is None:
+        # First request, or the cache was cleared. add() so two requests starting together agree on one number
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY, 1)
+
+    return generation
+
+
+# Async versions use the cache's own async methods (aget, aadd), so async views never block on the cache
+async def aget_generation():
+    cache = get_cache()
+    generation = await cache.aget(GENERATION_KEY)
+
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, 1, timeout=None)
+        generation = await cache.aget(GENERATION_KEY, 1)
+
+    return generation
+
+
+# Called when any video is added, changed or deleted
+def bump_generation():
+    cache = get_cache()
+
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Key is missing, nothing can be cached under the old generation then, start again
+        cache.add(GENERATION_KEY, 1, timeout=None)
+
+    if routers.replicas():
+        cache.set(BUMPED_AT_KEY, time.time(), timeout=None)
+
+    stats.count('invalidations')
+
+
+# True when the replicas may not have the last change yet
+def replicas_may_lag():
+    bumped_at = get_cache().get(BUMPED_AT_KEY)
+    return bumped_at is not None and time.time() - bumped_at < REPLICA_LAG
+
+
+async def areplicas_may_lag():
+    bumped_at = await get_cache().aget(BUMPED_AT_KEY)
+    return bumped_at is not None and time.time() - bumped_at < REPLICA_LAG
+
+
+# Deleting a video doesn't change the newest updated_at, so the time of the last delete is kept here for Last-Modified
+def record_delete():
+    get_cache().set(DELETED_AT_KEY, timezone.now(), timeout=None)
+
+
+def last_deleted_at():
+    cache = get_cache()
+    deleted_at = cache.get(DELETED_AT_KEY)
+
+    if deleted_at is None:
+        # We don't know if anything was deleted before the cache started (or was cleared), so say it was just now.
+        # Clients download the page once more, instead of keeping a page that could be out of date
+        cache.add(DELETED_AT_KEY, timezone.now(), timeout=None)
+        deleted_at = cache.get(DELETED_AT_KEY)
+
+    return deleted_at
+
+
+async def alast_deleted_at():
+    cache = get_cache()
+    deleted_at = await cache.aget(DELETED_AT_KEY)
+
+    if deleted_at is None:
+        await cache.aadd(DELETED_AT_KEY, timezone.now(), timeout=None)
+        deleted_at = await cache.aget(DELETED_AT_KEY)
+
+    return deleted_at
+
+
+# Same key for searches that only differ in case or spaces e.g( ' Blinding  LIGHTS' and 'blinding lights' )
+def normalize_term(term):
+    return ' '.join(term.lower().split()) if term else ''
+
+
+def page_key(generation, search_term, cursor, page_size, order, preview=False, tag=None):
+    raw = json.dumps([normalize_term(search_term), cursor or '', page_size, order or '', preview, tag or ''])
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'video_list:{generation}:{digest}'
+
+
+# Cached result for a page, or work it out with compute() and cache it.
+# from_replica=True when compute() reads from a read replica
+def get_or_compute(search_term, cursor, page_size, order, compute, preview=False, tag=None, from_replica=False):
+    cache = get_cache()
+    key = page_key(get_generation(), search_term, cursor, page_size, order, preview, tag)
+
+    result = cache.get(key)
+    if result is not None:
+        stats.count('hits')
+        return result
+
+    stats.count('misses')
+    result = compute()
+    if not from_replica or not replicas_may_lag():
+        cache.set(key, result, TIMEOUT)
+
+    return result
+
+
+# Same as get_or_compute(), for async views. acompute is an async function
+async def aget_or_compute(search_term, cursor, page_size, order, acompute, preview=False, tag=None,
+                          from_replica=False):
+    cache = get_cache()
+    key = page_key(await aget_generation(), search_term, cursor, page_size, order, preview, tag)
+
+    result = await cache.aget(key)
+    if result is not None:
+        stats.count('hits')
+        return result
+
+    stats.count('misses')
+    result = await acompute()
+    if not from_replica or not await areplicas_may_lag():
+        await cache.aset(key, result, TIMEOUT)
+
+    return result
+
+
+# Rendered video cards for the video list page, one cache entry per video.
+# The key has the video's updated_at in it, so an edited video gets a new key and its old card just expires,
+# nothing needs invalidating. Change CARD_VERSION when _video_card.html changes, so old cards aren't used
+CARD_VERSION = 4
+CARD_TIMEOUT = getattr(settings, 'VIDEO_CARD_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def card_key(video):
+    return f'video_card:{CARD_VERSION}:{video.pk}:{video.updated_at.timestamp()}'
+
+
+# Cards for the videos in order, all looked up with one get_many(). Missing ones are made with render(video)
+# and stored with one set_many()
+def get_cards(videos, render):
+    cache = get_cache()
+    keys = [card_key(video) for video in videos]
+
+    cards = cache.get_many(keys) if keys else {}
+    missing = {key: render(video) for key, video in zip(keys, videos) if key not in cards}
+
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+        cards.update(missing)
+
+    return [cards[key] for key in keys]
+
+
+async def aget_cards(videos, render):
+    cache = get_cache()
+    keys = [card_key(video) for video in videos]
+
+    cards = await cache.aget_many(keys) if keys else {}
+    missing = {key: render(video) for key, video in zip(keys, videos) if key not in cards}
+
+    if missing:
+        await cache.aset_many(missing, CARD_TIMEOUT)
+        cards.update(missing)
+
+    return [cards[key] for key in keys]
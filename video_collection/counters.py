@@ -0,0 +1,84 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Lower, Substr
+
+from .models import CatalogueCounter, Video
+
+# Video counts kept in the CatalogueCounter table, so the video list header, the API count and the ETag never
+# need a COUNT(*) over the video table:
+#   videos      every video
+#   letter:a    videos whose name starts with a (letter:# for names starting with anything but a-z)
+# The signal receivers in signals.py change them in the same transaction as the video is saved or deleted.
+# queryset.update() and raw SQL don't send signals, `python manage.py reconcile_counters` counts everything again.
+
+TOTAL = 'videos'
+
+
+def letter_key(name):
+    first = (name or '')[:1].lower()
+    return f'letter:{first}' if 'a' <= first <= 'z' else 'letter:#'
+
+
+# Changes for a video being added (change=1) or deleted (change=-1)
+def video_changes(name, change):
+    return {TOTAL: change, letter_key(name): change}
+
+
+# Add the changes to the counters e.g( {'videos': 2, 'letter:a': 1, 'letter:b': 1} ). Every counter is one UPDATE
+def apply(changes, using='default'):
+    counters = CatalogueCounter.objects.using(using)
+
+    for key, change in changes.items():
+        if not change:
+            continue
+
+        if not counters.filter(key=key).update(value=F('value') + change):
+            # First video starting with this letter
+            counters.bulk_create([CatalogueCounter(key=key, value=0)], ignore_conflicts=True)
+            counters.filter(key=key).update(value=F('value') + change)
+
+
+def get(key, using='default'):
+    return CatalogueCounter.objects.using(using).filter(key=key).values_list('value', flat=True).first()
+
+
+# Number of videos, None if the counters are missing (reconcile_counters puts them back)
+def total(using='default'):
+    return get(TOTAL, using)
+
+
+async def atotal(using='default'):
+    return await CatalogueCounter.objects.using(using).filter(key=TOTAL).values_list('value', flat=True).afirst()
+
+
+def letter_counts(using='default'):
+    rows = CatalogueCounter.objects.using(using).filter(key__startswith='letter:').values_list('key', 'value')
+    return {key.split(':', 1)[1]: value for key, value in rows}
+
+
+# Every counter worked out from the video table, the slow way
+def compute(using='default'):
+    videos = Video.objects.using(using)
+    counts = Counter({TOTAL: videos.count()})
+
+    first_letters = videos.values(first=Lower(Substr('name', 1, 1))).annotate(count=Count('id'))
+    for row in first_letters:
+        counts[letter_key(row['first'])] += row['count']
+
+    return dict(counts)
+
+
+# Replace the counters with freshly computed ones, returns the counters that were wrong as key -> (was, now)
+def reconcile(using='default'):
+    with transaction.atomic(using=using):
+        correct = compute(using)
+        counters = CatalogueCounter.objects.using(using)
+
+        stored = dict(counters.select_for_update().values_list('key', 'value'))
+        counters.all().delete()
+        counters.bulk_create([CatalogueCounter(key=key, value=value) for key, value in correct.items()])
+
+    return {key: (stored.get(key), correct.get(key, 0))
+            for key in stored.keys() | correct.keys() if stored.get(key) != correct.get(key, 0)}
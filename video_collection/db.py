@@ -0,0 +1,64 @@
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+# SQLite connection tuning. Every new SQLite connection runs the PRAGMAs below, or settings.VIDEO_SQLITE_PRAGMAS
+# when it's set (connected to the connection_created signal in apps.py). With journal_mode=WAL readers don't wait
+# for the writer, and the other settings keep more of the database in memory.
+# How long to wait for a lock is the 'timeout' option in settings.DATABASES, not a PRAGMA here.
+
+DEFAULT_PRAGMAS = {
+    # Write ahead log: readers keep reading while a video is being added
+    'journal_mode': 'WAL',
+    # Safe with WAL, only the last commits can be lost on a power cut (never corrupted), and much faster commits
+    'synchronous': 'NORMAL',
+    # Read the database file through memory mapping, up to 256MB
+    'mmap_size': 256 * 1024 * 1024,
+    # Page cache size, negative is in KB, so about 64MB
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+}
+
+PRAGMA_NAME = re.compile(r'[a-z_]+')
+PRAGMA_VALUE = re.compile(r'-?\d+|[A-Za-z]+')
+
+
+def get_pragmas():
+    return getattr(settings, 'VIDEO_SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+
+# Works with a Django cursor or a plain sqlite3 cursor (the concurrency benchmark uses plain ones)
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        # PRAGMA can't take query parameters, so only allow plain names and values
+        if not PRAGMA_NAME.fullmatch(name) or not PRAGMA_VALUE.fullmatch(str(value)):
+            raise ValueError(f'Invalid SQLite PRAGMA {name} = {value}')
+
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, get_pragmas())
+
+
+# Same as Model.objects.update_or_create(), for rows found by a unique lookup e.g( video=video ), for background
+# jobs that write at the same time as other threads. update_or_create() reads then writes in one transaction, and
+# SQLite can't make a transaction that has read wait for the write lock: when another connection commits in between
+# it fails straight away with 'database is locked'. Here each write is a statement of its own, which waits for
+# the lock (the 'timeout' option)
+def update_or_create(model, defaults, **lookup):
+    if not model.objects.filter(**lookup).update(**defaults):
+        try:
+            with transaction.atomic():
+                return model.objects.create(**lookup, **defaults)
+        except IntegrityError:
+            # Made by another thread since
+            model.objects.filter(**lookup).update(**defaults)
+
+    return model.objects.get(**lookup)
+
@@ -0,0 +1,105 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Video
+
+# Duplicate check for the add form and the API, done before anything is written to the database.
+# A bloom filter of every saved video id answers "definitely not saved" without a query, which is the answer
+# for almost every new video. Only when the filter says "maybe" is there an indexed exists() query to be sure.
+#
+# The filter is filled from the video table the first time it's used in a process, then kept up to date
+# by the post_save and videos_bulk_created signals (see signals.py). Videos saved by other processes are picked up
+# every SYNC_INTERVAL seconds by reading the rows added since (by id). A video added by another process within that
+# window can still get past the check, the unique index on video_id still stops it then (IntegrityError).
+# Deleted videos stay in the filter, they just cost the exists() query.
+
+# Video ids the filter is sized for (it grows to twice the table size if that's bigger), and its false positive rate
+CAPACITY = getattr(settings, 'VIDEO_BLOOM_CAPACITY', 1_000_000)
+ERROR_RATE = getattr(settings, 'VIDEO_BLOOM_ERROR_RATE', 0.01)
+# Seconds between reading videos added by other processes
+SYNC_INTERVAL = getattr(settings, 'VIDEO_BLOOM_SYNC_INTERVAL', 5)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        # Standard sizing: bits = -n ln(p) / ln(2)^2, hashes = bits / n ln(2)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    # Bit positions for a value, from two halves of one hash (double hashing)
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+
+        return [(first + number * second) % self.size for number in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class KnownVideoIds:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        # Highest video pk read from the table, the next sync reads the rows after it
+        self.last_pk = 0
+        self.synced_at = 0.0
+
+    def _read_since(self, pk):
+        rows = Video.objects.filter(pk__gt=pk).order_by('pk').values_list('pk', 'video_id')
+        for pk, video_id in rows.iterator(chunk_size=5000):
+            self.bloom.add(video_id)
+            self.last_pk = pk
+
+        self.synced_at = time.monotonic()
+
+    def _sync(self):
+        if self.bloom is None:
+            self.bloom = BloomFilter(max(CAPACITY, Video.objects.count() * 2), ERROR_RATE)
+            self.last_pk = 0
+            self._read_since(0)
+        elif time.monotonic() - self.synced_at >= SYNC_INTERVAL:
+            self._read_since(self.last_pk)
+
+    # False means the video id is definitely not saved, True means it may be
+    def might_exist(self, video_id):
+        with self.lock:
+            self._sync()
+            return video_id in self.bloom
+
+    # Called for videos saved by this process. Before the filter is loaded there's nothing to do,
+    # loading it reads them from the table
+    def add(self, video_ids):
+        with self.lock:
+            if self.bloom is not None:
+                for video_id in video_ids:
+                    self.bloom.add(video_id)
+
+    def reset(self):
+        with self.lock:
+            self.bloom = None
+
+
+known_ids = KnownVideoIds()
+
+
+# Is a video with this YT video id already saved (not counting the video being edited, exclude_pk)
+def is_duplicate(video_id, exclude_pk=None):
+    if not known_ids.might_exist(video_id):
+        return False
+
+    videos = Video.objects.filter(video_id=video_id)
+    if exclude_pk is not None:
+        videos = videos.exclude(pk=exclude_pk)
+
+    return videos.exists()
@@ -0,0 +1,107 @@
+import csv
+import json
+import zlib
+
+from django.conf import settings
+
+from . import listing
+
+# Export of the whole catalogue (or the videos matching a search and/or with a tag) as CSV or JSONL, the same formats the
+# importer reads, so an export can be imported again somewhere else.
+# Everything is a generator: rows are read from the database in chunks with .iterator() and written out
+# as they come, so memory stays flat however many videos there are.
+
+# Rows read from the database at a time
+DEFAULT_CHUNK_SIZE = getattr(settings, 'VIDEO_EXPORT_CHUNK_SIZE', 2000)
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# Columns in the export, in this order
+FIELDS = ['id', 'video_id', 'name', 'url', 'notes', 'updated_at']
+
+# Output is handed on in pieces of about this many bytes, instead of one tiny piece per row
+BUFFER_SIZE = 64 * 1024
+
+
+# Matching videos, from the using database or the one the router picks (a read replica when they're set up).
+# The database is picked now, not when the rows are read: a streamed response is read after the view has returned,
+# when the request's replica or pin (ReplicaPinningMiddleware) is gone
+def exported_videos(search_term=None, using=None, tag=None):
+    videos = listing.filtered_videos(search_term, tag=tag)
+    return videos.using(using or videos.db)
+
+
+# Matching videos in id order as tuples of FIELDS, read in chunks
+def export_rows(search_term=None, chunk_size=DEFAULT_CHUNK_SIZE, using=None, tag=None):
+    videos = exported_videos(search_term, using, tag)
+    return videos.order_by('id').values_list(*FIELDS).iterator(chunk_size=chunk_size)
+
+
+# csv.writer wants a file, this one just gives back what's written to it
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+
+    updated_at = FIELDS.index('updated_at')
+    for row in rows:
+        row = list(row)
+        row[updated_at] = row[updated_at].isoformat()
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        video = dict(zip(FIELDS, row))
+        video['updated_at'] = video['updated_at'].isoformat()
+        yield json.dumps(video) + '\n'
+
+
+WRITERS = {'csv': csv_lines, 'jsonl': jsonl_lines}
+
+
+# Join the lines into pieces of about BUFFER_SIZE bytes
+def buffered(lines):
+    buffer = []
+    size = 0
+
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+
+        if size >= BUFFER_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+
+    if buffer:
+        yield b''.join(buffer)
+
+
+# gzip the pieces as they go past, the whole file is never in memory
+def gzipped(chunks):
+    # wbits=31 writes a gzip header and trailer, so the output is a normal .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+# The export as an iterator of bytes
+def export(file_format, search_term=None, compress=False, chunk_size=DEFAULT_CHUNK_SIZE, using=None, tag=None):
+    chunks = buffered(WRITERS[file_format](export_rows(search_term, chunk_size, using, tag)))
+    return gzipped(chunks) if compress else chunks
+
+
+def filename(file_format, compress=False):
+    return f'videos.{file_format}' + ('.gz' if compress else '')
@@ -1,5 +1,10 @@
 from django import forms
+from django.db import transaction
+from django.urls import reverse_lazy
 from .models import Video
+from .youtube import parse_video_id
+from .duplicates import is_duplicate
+from .tagging import InvalidTag, parse_tag_names, set_tags
 
 
 # These are your models form
@@ -8,7 +13,65 @@ class videoForm(forms.ModelForm):
        model = Video
        
        fields = ['name','url','notes'] 
+
+    # Not a model field, the tags are saved after the video (see save())
+    tags = forms.CharField(required=False, help_text='Comma separated e.g( pop, 80s )')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Editing a video starts from its tags
+        if self.instance.pk is not None:
+            self.initial.setdefault('tags', ', '.join(tag.name for tag in self.instance.tags.order_by('name')))
+
+    # Check the YT url when the form is validated, before anything is saved
+    # Raises InvalidYouTubeURL, a validation error with the 'invalid_youtube_url' code,
+    # or a 'duplicate_video' validation error when the video is already saved (under any url for the same video)
+    def clean_url(self):
+        url = self.cleaned_data['url']
+        video_id = parse_video_id(url)
+
+        if is_duplicate(video_id, exclude_pk=self.instance.pk):
+            raise forms.ValidationError('Duplicate video, video was already added before', code='duplicate_video')
+
+        self.instance.video_id = video_id
+        return url
+
+    # Tag names, comma separated text or (from the JSON API) a list of names
+    def clean_tags(self):
+        tags = self.data.get('tags')
+        if isinstance(tags, list) and all(isinstance(tag, str) for tag in tags):
+            tags = ','.join(tags)
+        elif tags is not None and not isinstance(tags, str):
+            raise forms.ValidationError('Tags should be text or a list of names', code='invalid_tag')
+
+        try:
+            return parse_tag_names(tags)
+        except InvalidTag as error:
+            raise forms.ValidationError(f'Invalid tag {error}', code='invalid_tag')
+
+    # The video and its tags are saved together or not at all
+    def save(self, commit=True):
+        if not commit:
+            return super().save(commit=False)
+
+        # A new video without tags has none to save
+        editing = self.instance.pk is not None
+
+        with transaction.atomic():
+            video = super().save()
+            if self.cleaned_data['tags'] or editing:
+                set_tags(video, self.cleaned_data['tags'])
+
+        return video
        
        
 class SearchForm(forms.Form):
-    search_term = forms.CharField()
\ No newline at end of file
+    # Suggestions come from the autocomplete API as users type (static/js/autocomplete.js fills the datalist)
+    search_term = forms.CharField(widget=forms.TextInput(attrs={
+        'list': 'search-suggestions', 'autocomplete': 'off',
+        'data-autocomplete-url': reverse_lazy('api_video_autocomplete')}))
+    # Searches stay within the tag the video list is filtered by
+    tag = forms.SlugField(required=False, widget=forms.HiddenInput)
+    # Name order pages through every match, best match shows the top ranked matches
+    order = forms.ChoiceField(choices=[('name', 'Name'), ('relevance', 'Best match')], required=False)
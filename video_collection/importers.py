@@ -0,0 +1,228 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .models import NOTES_MAX_LENGTH, Video
+from .signals import videos_bulk_created
+from . import youtube
+
+# Bulk import of videos from CSV or JSONL files.
+# Rows are read one at a time with generators and handled in batches: every batch is validated, checked
+# for duplicates with one `video_id IN (...)` query, and inserted with bulk_create inside one transaction.
+# Memory stays flat no matter how big the file is, only one batch is ever held at once.
+
+# Rows checked and inserted per transaction, and rows per INSERT statement inside it
+DEFAULT_BATCH_SIZE = getattr(settings, 'VIDEO_IMPORT_BATCH_SIZE', 1000)
+DEFAULT_CHUNK_SIZE = getattr(settings, 'VIDEO_IMPORT_CHUNK_SIZE', 500)
+
+# Only keep this many error messages in the report, the rest are counted
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ('csv', 'jsonl')
+
+NAME_MAX_LENGTH = Video._meta.get_field('name').max_length
+URL_MAX_LENGTH = Video._meta.get_field('url').max_length
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors = []  # (line number, message)
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'error_count': self.error_count,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors],
+        }
+
+
+# Readers give back (line number, row dict) one at a time.
+# A row that can't be read at all comes back as (line number, error message string) instead of a dict
+
+def read_csv(text_file):
+    reader = csv.DictReader(text_file)
+    for row in reader:
+        # line_num is the line the row ended on, the header is line 1
+        yield reader.line_num, row
+
+
+# Lines can also be bytes e.g( a request body read line by line ), each one is decoded on its own
+def read_jsonl(text_file):
+    for line_number, line in enumerate(text_file, start=1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                yield line_number, 'Line is not UTF-8 text'
+                continue
+
+        if not line.strip():
+            continue
+
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, f'Invalid JSON: {e}'
+            continue
+
+        if not isinstance(row, dict):
+            yield line_number, 'Each line should be a JSON object'
+            continue
+
+        yield line_number, row
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+# Files are read as UTF-8 (open_text()). A file in another encoding e.g( a Latin-1 CSV from a spreadsheet ) stops
+# at the first bad byte, reported as an error for the line after the last one read. Rows read before it are
+# imported (text is decoded a few KB at a time, so rows just before the bad byte may not have been read)
+def stop_at_decode_error(rows):
+    line_number = 0
+    try:
+        for line_number, row in rows:
+            yield line_number, row
+    except UnicodeDecodeError:
+        yield line_number + 1, 'File is not UTF-8 text, the rest of it was not imported'
+
+
+# Guess the format from the file name e.g( videos.jsonl -> jsonl ), csv if we can't tell
+def guess_format(filename):
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+# Open a binary file (an upload, stdin) as text, so it's read as a stream instead of all at once
+def open_text(binary_file):
+    return io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# Check one row and build the (unsaved) Video for it, video_id is what the parser got from the url (None if invalid).
+# Raises ValidationError if the row is not valid
+def build_video(row, video_id):
+    name = _text(row, 'name')
+    url = _text(row, 'url')
+    notes = row.get('notes') or None
+
+    if not name:
+        raise ValidationError('Missing name')
+    if len(name) > NAME_MAX_LENGTH:
+        raise ValidationError(f'Name is longer than {NAME_MAX_LENGTH} characters')
+    if not url:
+        raise ValidationError('Missing url')
+    if len(url) > URL_MAX_LENGTH:
+        raise ValidationError(f'URL is longer than {URL_MAX_LENGTH} characters')
+    if notes is not None and not isinstance(notes, str):
+        raise ValidationError('Notes should be text')
+    if notes is not None and len(notes) > NOTES_MAX_LENGTH:
+        raise ValidationError(f'Notes are longer than {NOTES_MAX_LENGTH} characters')
+
+    if video_id is None:
+        raise youtube.InvalidYouTubeURL(url)
+
+    # bulk_create doesn't call Video.save(), so the video id is worked out here
+    return Video(name=name, url=url, notes=notes, video_id=video_id)
+
+
+# Stripped text value of a row column, '' if it's missing or not text (JSON rows can hold numbers, lists...)
+def _text(row, key):
+    value = row.get(key)
+    return value.strip() if isinstance(value, str) else ''
+
+
+def _error_message(error):
+    return '; '.join(error.messages)
+
+
+def import_rows(rows, batch_size=DEFAULT_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, using='default'):
+    report = ImportReport()
+
+    for batch in batched(rows, batch_size):
+        # video id -> Video, only the first row for each video id in the batch is kept
+        new_videos = {}
+
+        # Parse the whole batch of urls in one go
+        video_ids = youtube.parse_many(_text(row, 'url') if isinstance(row, dict) else '' for line, row in batch)
+
+        for (line, row), video_id in zip(batch, video_ids):
+            if isinstance(row, str):
+                report.add_error(line, row)
+                continue
+
+            try:
+                video = build_video(row, video_id)
+            except ValidationError as e:
+                report.add_error(line, _error_message(e))
+                continue
+
+            if video.video_id in new_videos:
+                report.duplicates += 1
+                continue
+
+            new_videos[video.video_id] = video
+
+        if not new_videos:
+            continue
+
+        report.created += _insert_batch(new_videos, report, chunk_size, dry_run, using)
+
+    return report
+
+
+def _insert_batch(new_videos, report, chunk_size, dry_run, using):
+    # Two tries: if another request adds one of our videos between the check and the insert, the insert fails with an
+    # IntegrityError, and the second try's check will find it
+    for attempt in range(2):
+        try:
+            with transaction.atomic(using=using):
+                # One query to find every video in this batch that is already saved
+                existing = set(Video.objects.using(using).filter(
+                    video_id__in=list(new_videos)).values_list('video_id', flat=True))
+
+                videos = [video for video_id, video in new_videos.items() if video_id not in existing]
+
+                if videos and not dry_run:
+                    Video.objects.using(using).bulk_create(videos, batch_size=chunk_size)
+                    # bulk_create doesn't send post_save, tell the rest of the app about the new videos. The
+                    # receivers' changes (counters, background jobs) are saved in the same transaction as the batch
+                    videos_bulk_created.send(sender=Video, videos=videos, using=using)
+
+            report.duplicates += len(existing)
+
+            return len(videos)
+
+        except IntegrityError:
+            if attempt:
+                raise
+
+
+def import_file(text_file, file_format, **kwargs):
+    if file_format not in READERS:
+        raise ValueError(f'Unknown import format {file_format}, should be one of {", ".join(FORMATS)}')
+
+    return import_rows(stop_at_decode_error(READERS[file_format](text_file)), **kwargs)
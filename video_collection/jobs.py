@@ -0,0 +1,163 @@
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import routers
+from .models import Job
+
+# A small job queue kept in the database, for slow work that shouldn't happen while a request waits
+# (fetching metadata, thumbnails...).
+#
+#   @jobs.task('fetch_video_metadata')
+#   def fetch_video_metadata(video_pk): ...
+#
+#   jobs.enqueue('fetch_video_metadata', key=f'metadata:{video.pk}', video_pk=video.pk)
+#
+# Jobs are rows in the Job table, added in the same transaction as the change that needs them, so a rolled back
+# request doesn't leave jobs behind. `python manage.py run_worker` claims due jobs and runs them in a pool.
+# A claim lasts VISIBILITY_TIMEOUT seconds, if the worker dies the job is claimed again by another worker after that.
+# Failed jobs are tried again after a growing delay (backoff), up to their max_attempts.
+# Tasks may run more than once (a slow job outliving its claim, a crash after the work but before it's marked done),
+# so they should be safe to run again.
+
+logger = logging.getLogger(__name__)
+
+VISIBILITY_TIMEOUT = getattr(settings, 'VIDEO_JOBS_VISIBILITY_TIMEOUT', 300)
+MAX_ATTEMPTS = getattr(settings, 'VIDEO_JOBS_MAX_ATTEMPTS', 5)
+# Seconds before the first retry, doubled for every attempt after that, up to BACKOFF_MAX
+BACKOFF_BASE = getattr(settings, 'VIDEO_JOBS_BACKOFF_BASE', 10)
+BACKOFF_MAX = getattr(settings, 'VIDEO_JOBS_BACKOFF_MAX', 60 * 60)
+
+# Task name -> function
+registry = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+# Registers a function as a task. Its keyword arguments come from the job payload, so they must be JSON values
+def task(name):
+    def register(function):
+        registry[name] = function
+        return function
+
+    return register
+
+
+def _new_job(task_name, key, delay, max_attempts, payload):
+    if task_name not in registry:
+        raise UnknownTask(task_name)
+
+    return Job(task=task_name, key=key, payload=payload, max_attempts=max_attempts or MAX_ATTEMPTS,
+               run_after=timezone.now() + timedelta(seconds=delay))
+
+
+# Queue a job, one INSERT. With a key, nothing is added (None is returned) while a job with the same key is waiting
+# or running. The job_active_key_unique constraint makes sure of that, even when two requests queue it together
+def enqueue(task_name, key='', delay=0, max_attempts=None, **payload):
+    job = _new_job(task_name, key, delay, max_attempts, payload)
+
+    if not key:
+        job.save()
+        return job
+
+    try:
+        # Savepoint, so the caller's transaction carries on after a duplicate
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return None
+
+    return job
+
+
+# Queue many jobs of one task with one bulk INSERT, payloads is a list of dicts and key(payload) gives each job's key.
+# Jobs whose key is already waiting or running are left out by the database
+def enqueue_many(task_name, payloads, key=None, delay=0, max_attempts=None, using='default'):
+    jobs = [_new_job(task_name, key(payload) if key else '', delay, max_attempts, payload) for payload in payloads]
+    return Job.objects.using(using).bulk_create(jobs, ignore_conflicts=bool(key))
+
+
+def _due():
+    now = timezone.now()
+    # Waiting jobs that are due, and running jobs whose worker's claim ran out
+    return (Q(status=Job.QUEUED, run_after__lte=now)
+            | Q(status=Job.RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts')))
+
+
+# Claim up to limit due jobs for this worker, returns the claim token and the claimed jobs.
+# The UPDATE checks the jobs are still due, so two workers can't claim the same job
+# (each one gets back only the rows its own UPDATE changed, found by the token)
+def claim(worker_id, limit=1):
+    # Jobs whose worker died on their last attempt aren't tried again
+    Job.objects.filter(status=Job.RUNNING, locked_until__lt=timezone.now(), attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, last_error='Worker stopped before the job finished', locked_until=None,
+        finished_at=timezone.now())
+
+    ids = list(Job.objects.filter(_due()).order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return None, []
+
+    token = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    Job.objects.filter(_due(), pk__in=ids).update(
+        status=Job.RUNNING, locked_by=token, attempts=F('attempts') + 1,
+        locked_until=timezone.now() + timedelta(seconds=VISIBILITY_TIMEOUT))
+
+    return token, list(Job.objects.filter(locked_by=token, status=Job.RUNNING))
+
+
+# Seconds to wait before trying a job again after its attempts so far, with some jitter
+# so jobs that failed together don't all come back at once
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+# Run one claimed job, then mark it done, or queue it again/fail it if the task raised.
+# Returns True if the task worked
+def run(job):
+    claimed = Job.objects.filter(pk=job.pk, locked_by=job.locked_by, status=Job.RUNNING)
+
+    try:
+        function = registry.get(job.task)
+        if function is None:
+            raise UnknownTask(job.task)
+
+        # Tasks read what the request that queued them just wrote, the replicas might not have it yet
+        with routers.use_primary():
+            function(**job.payload)
+
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s (%s) failed, attempt %s of %s', job.pk, job.task, job.attempts, job.max_attempts)
+
+        if job.attempts >= job.max_attempts:
+            claimed.update(status=Job.FAILED, last_error=error, locked_until=None, finished_at=timezone.now())
+        else:
+            claimed.update(status=Job.QUEUED, last_error=error, locked_until=None,
+                           run_after=timezone.now() + timedelta(seconds=backoff(job.attempts)))
+        return False
+
+    # Only if this worker still holds the claim, otherwise another worker has taken it over
+    claimed.update(status=Job.DONE, locked_until=None, finished_at=timezone.now())
+    return True
+
+
+# Run a claimed job by id, for worker threads and processes. Closes this thread's database connection
+# when it's too old, threads don't go through the request cycle that does that
+def run_claimed(pk, token):
+    try:
+        job = Job.objects.filter(pk=pk, locked_by=token, status=Job.RUNNING).first()
+        return run(job) if job is not None else False
+    finally:
+        # Not when called inside a transaction e.g( from a test ), closing the connection would end it
+        if not transaction.get_connection().in_atomic_block:
+            close_old_connections()
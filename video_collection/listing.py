@@ -0,0 +1,165 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.db import router
+from django.db.models import Count, Exists, Max, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Length, Substr
+from django.db.models.lookups import GreaterThan
+
+from .models import NOTES_PREVIEW_LENGTH, CatalogueCounter, Tag, Video, VideoTag
+from .pagination import apaginate, paginate, InvalidCursor, Page
+from . import caching, counters, routers, search, tagging
+
+# Loading one page of the video list (with or without a search), shared by the video list page and the API.
+# Results go through the result cache, so repeated requests for the same page don't touch the database.
+
+
+class VideoPage:
+    def __init__(self, page, video_count):
+        self.page = page
+        self.video_count = video_count
+
+
+# Videos matching the search term and tagged with the tag (a tag slug), or all of them when there is neither
+def filtered_videos(search_term=None, preview=False, tag=None):
+    videos = Video.objects.all()
+
+    if preview:
+        videos = preview_columns(videos)
+
+    if tag:
+        # A check per video (EXISTS, one lookup in the (video, tag) index) rather than a join, so the page is still
+        # read in order from the (lower(name), id) index and stops after page_size videos. A join reads all the
+        # tag's videos and sorts them for every page. Pages of a tag on few videos read further along the index
+        videos = videos.filter(Exists(VideoTag.objects.filter(video=OuterRef('pk'), tag__slug=tag)))
+
+    if search_term:
+        # Match all videos with words starting with the search words in the name or notes, using the full text index
+        videos = search.search(videos, search_term)
+
+    return videos
+
+
+# Only the columns the video list shows, and the thumbnail's files in the same query.
+# Notes can be long, so the database sends just the first NOTES_PREVIEW_LENGTH characters as notes_preview,
+# and notes_truncated says if there is more. The full notes are only loaded by the detail page
+def preview_columns(videos):
+    return videos.select_related('thumbnail').only(
+        'id', 'name', 'url', 'video_id', 'updated_at', 'thumbnail__youtube_id', 'thumbnail__files').annotate(
+        notes_preview=Substr('notes', 1, NOTES_PREVIEW_LENGTH),
+        notes_truncated=GreaterThan(Length('notes'), NOTES_PREVIEW_LENGTH))
+
+
+# Every video's tags with one more query for the whole page (prefetch_related), in name order.
+# The cards and the API show them without a query per video
+def with_tags(videos):
+    return videos.prefetch_related(Prefetch('tags', queryset=Tag.objects.only('name', 'slug').order_by('name')))
+
+
+# Number of videos for the header. Without a search it's the maintained counter (counters.py), or the tag's
+# video count, no COUNT(*) at all. Searches are counted (and the page with the count is cached)
+def video_count(videos, search_term, tag=None):
+    count = None
+    if not search_term:
+        count = tagging.tag_count(tag, videos.db) if tag else counters.total(videos.db)
+
+    return videos.count() if count is None else count
+
+
+async def avideo_count(videos, search_term, tag=None):
+    count = None
+    if not search_term:
+        count = await tagging.atag_count(tag, videos.db) if tag else await counters.atotal(videos.db)
+
+    return await videos.acount() if count is None else count
+
+
+# True when this request's video reads go to a read replica, see routers.py
+def from_replica():
+    return router.db_for_read(Video) != routers.PRIMARY
+
+
+# preview=True loads the videos with preview_columns(), for the video list page. The API sends the full notes
+def load_page(search_term=None, order=None, cursor=None, page_size=None, preview=False, tag=None):
+    def compute():
+        videos = with_tags(filtered_videos(search_term, preview, tag))
+
+        if search_term and order == 'relevance':
+            # Best matches first. Ranked results are only the top page of matches, there are no next/previous pages
+            page = Page(search.ranked_search(videos, search_term, page_size, filtered=bool(tag)), None, None, page_size)
+        else:
+            try:
+                page = paginate(videos, cursor, page_size)
+            except InvalidCursor:
+                # Bad or old cursor, just start again from the first page
+                page = paginate(videos, None, page_size)
+
+        return VideoPage(page, video_count(videos, search_term, tag))
+
+    return caching.get_or_compute(search_term, cursor, page_size, order, compute, preview, tag, from_replica())
+
+
+# Same as load_page(), with the async ORM and async cache calls
+async def aload_page(search_term=None, order=None, cursor=None, page_size=None, preview=False, tag=None):
+    async def acompute():
+        # The first search in a process checks if the full text index exists, which is a sync query
+        videos = with_tags(await sync_to_async(filtered_videos)(search_term, preview, tag))
+
+        if search_term and order == 'relevance':
+            # The bm25 ranking is a raw SQL query, there is no async version of it
+            items = await sync_to_async(search.ranked_search)(videos, search_term, page_size, filtered=bool(tag))
+            page = Page(items, None, None, page_size)
+        else:
+            try:
+                page = await apaginate(videos, cursor, page_size)
+            except InvalidCursor:
+                page = await apaginate(videos, None, page_size)
+
+        return VideoPage(page, await avideo_count(videos, search_term, tag))
+
+    return await caching.aget_or_compute(search_term, cursor, page_size, order, acompute, preview, tag,
+                                         from_replica())
+
+
+# A cheap version of the whole video list, one query that never loads any rows or counts the table.
+# Adding or editing a video changes the newest updated_at, deleting one changes the count
+class CatalogueVersion:
+    def __init__(self, last_updated, video_count, last_deleted):
+        self.last_updated = last_updated
+        self.video_count = video_count
+        self.last_deleted = last_deleted
+
+    @property
+    def last_modified(self):
+        return max(filter(None, [self.last_updated, self.last_deleted]), default=None)
+
+    # ETag for one page, the query string is part of it because every search and page is different
+    def etag(self, query_string=''):
+        last_updated = self.last_updated.isoformat() if self.last_updated else ''
+        raw = f'{last_updated}|{self.video_count}|{query_string}'
+        return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+# The video counter, with the newest updated_at (read from its index) as a subquery
+def _version_query():
+    newest = Video.objects.order_by('-updated_at').values('updated_at')[:1]
+    return CatalogueCounter.objects.filter(key=counters.TOTAL).values_list('value', Subquery(newest))
+
+
+def catalogue_version():
+    version = _version_query().first()
+    if version is None:
+        # Counters missing, count the table
+        version = Video.objects.aggregate(video_count=Count('id'), last_updated=Max('updated_at')).values()
+
+    video_count, last_updated = version
+    return CatalogueVersion(last_updated, video_count, caching.last_deleted_at())
+
+
+async def acatalogue_version():
+    version = await _version_query().afirst()
+    if version is None:
+        version = (await Video.objects.aaggregate(video_count=Count('id'), last_updated=Max('updated_at'))).values()
+
+    video_count, last_updated = version
+    return CatalogueVersion(last_updated, video_count, await caching.alast_deleted_at())
@@ -0,0 +1,97 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from video_collection import autocomplete, benchmarking, synthetic
+from video_collection.models import Video
+
+
+# python manage.py bench_autocomplete --sizes 100000,1000000 --output autocomplete.json
+# For each size: builds the autocomplete prefix index from that many made up video names (the same names
+# generate_videos makes, kept in memory, the database isn't touched), then reports the build time, the memory
+# the index holds, and p50/p95/p99 latency of lookups for prefixes of 1 to 8 characters of random names,
+# and of adding and removing names. --from-db builds the index from the video table instead.
+class Command(BaseCommand):
+    help = 'Benchmark the autocomplete prefix index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000000', help='Comma separated numbers of names e.g( 10000,1000000 )')
+        parser.add_argument('--lookups', type=int, default=10000, help='Timed lookups per size')
+        parser.add_argument('--limit', type=int, default=autocomplete.DEFAULT_LIMIT, help='Suggestions per lookup')
+        parser.add_argument('--from-db', action='store_true', help='Use the names in the video table')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Save the results to this JSON file')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes should be numbers separated by commas')
+
+        if options['from_db']:
+            sizes = [Video.objects.count()]
+
+        rng = random.Random(options['seed'])
+        results = {}
+
+        for size in sizes:
+            names = self.names(size, options)
+
+            changed = [f'{rng.choice(synthetic.WORDS)} new {number}' for number in range(min(1000, options['lookups']))]
+            # Room for the added names
+            max_names = len(names) + len(changed)
+
+            start = time.perf_counter()
+            index = autocomplete.PrefixIndex(names, max_names)
+            build_seconds = time.perf_counter() - start
+
+            # Built again while tracing memory, tracing makes it slower. Held is what the index keeps afterwards
+            del index
+            tracemalloc.start()
+            index = autocomplete.PrefixIndex(names, max_names)
+            held, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            queries = [rng.choice(names)[:rng.randint(1, 8)] for _ in range(options['lookups'])] if names else []
+            lookups = self.timed(lambda query: index.lookup(query, options['limit']), queries)
+
+            adds = self.timed(index.add, changed)
+            removes = self.timed(index.remove, changed)
+
+            results[str(size)] = {
+                'build_seconds': round(build_seconds, 3),
+                'index_memory_mb': round(held / 1024 / 1024, 1),
+                'build_peak_memory_mb': round(peak / 1024 / 1024, 1),
+                'lookup': lookups,
+                'add': adds,
+                'remove': removes,
+            }
+
+            self.stdout.write(f'--- {size:,} names: built in {build_seconds:.2f}s, '
+                              f'{held / 1024 / 1024:.1f} MB held')
+            for label in ('lookup', 'add', 'remove'):
+                summary = results[str(size)][label]
+                self.stdout.write(f'{label:<8} p50 {summary["p50_ms"] * 1000:8.1f}us  '
+                                  f'p99 {summary["p99_ms"] * 1000:8.1f}us  max {summary["max_ms"] * 1000:8.1f}us')
+
+        if options['output']:
+            benchmarking.write_results(options['output'], results)
+            self.stdout.write(f'Results saved to {options["output"]}')
+
+    def names(self, size, options):
+        if options['from_db']:
+            return list(Video.objects.values_list('name', flat=True).iterator(chunk_size=10000))
+
+        rng = random.Random(f'{options["seed"]}-names')
+        return [synthetic.synthetic_video(number, rng).name for number in range(size)]
+
+    def timed(self, func, values):
+        latencies = []
+        for value in values:
+            start = time.perf_counter()
+            func(value)
+            latencies.append(time.perf_counter() - start)
+
+        return benchmarking.summarize(latencies)
@@ -0,0 +1,155 @@
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from video_collection import benchmarking
+
+
+# python manage.py bench_serving --requests 2000 --concurrency 50 --path /video_list --path "/api/videos?search_term=abc"
+# Load test of the read views, WSGI (sync views, a thread per request) against ASGI (async views on one event loop).
+# Each mode runs in its own process, because the sync or async views are picked when urls.py is loaded.
+# Requests go straight into Django's WSGI/ASGI handlers in-process, so the numbers are Django's own cost without a
+# server in front. Run it against a database with realistic data in it (see generate_videos).
+class Command(BaseCommand):
+    help = 'Compare WSGI and ASGI throughput and latency of the video list and API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request, can be given more than once (default /video_list and /api/videos)')
+        parser.add_argument('--output', help='Save the results to this JSON file')
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], help='Run one mode in this process (used internally)')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/video_list', '/api/videos']
+
+        if options['mode']:
+            result = self.run_mode(options['mode'], paths, options['requests'], options['concurrency'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        results = {}
+        for mode in ('wsgi', 'asgi'):
+            results[mode] = self.run_child(mode, paths, options)
+
+            summary = results[mode]
+            self.stdout.write(
+                f'{mode.upper()}: {summary["per_second"]:>9,.1f} req/s  p50 {summary["p50_ms"]:.2f}ms  '
+                f'p95 {summary["p95_ms"]:.2f}ms  p99 {summary["p99_ms"]:.2f}ms  errors {summary["errors"]}')
+
+        if options['output']:
+            benchmarking.write_results(options['output'], {
+                'requests': options['requests'], 'concurrency': options['concurrency'], 'paths': paths, **results})
+
+    def run_child(self, mode, paths, options):
+        command = [sys.executable, sys.argv[0], 'bench_serving', '--mode', mode,
+                   '--requests', str(options['requests']), '--concurrency', str(options['concurrency'])]
+        for path in paths:
+            command += ['--path', path]
+
+        env = dict(os.environ, VIDEO_ASYNC_VIEWS='1' if mode == 'asgi' else '0')
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+
+        if completed.returncode:
+            raise CommandError(f'{mode} run failed:\n{completed.stderr}')
+
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def run_mode(self, mode, paths, total, concurrency):
+        # Every request goes to the next path in turn
+        requests = [paths[number % len(paths)] for number in range(total)]
+
+        if mode == 'wsgi':
+            latencies, errors, elapsed = self.run_wsgi(requests, concurrency)
+        else:
+            latencies, errors, elapsed = asyncio.run(self.run_asgi(requests, concurrency))
+
+        return {'async_views': settings.VIDEO_ASYNC_VIEWS, 'errors': errors,
+                **benchmarking.summarize(latencies, elapsed)}
+
+    def run_wsgi(self, requests, concurrency):
+        from django.core.wsgi import get_wsgi_application
+
+        application = get_wsgi_application()
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def one_request(full_path):
+            path, _, query = full_path.partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+                'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+                'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                'wsgi.run_once': False, 'wsgi.version': (1, 0),
+            }
+            statuses = []
+
+            start = time.perf_counter()
+            response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            for _ in response:
+                pass
+            response.close()
+            latency = time.perf_counter() - start
+
+            with lock:
+                latencies.append(latency)
+                if not statuses[0].startswith('200'):
+                    errors.append(statuses[0])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one_request, requests))
+        elapsed = time.perf_counter() - start
+
+        return latencies, len(errors), elapsed
+
+    async def run_asgi(self, requests, concurrency):
+        from django.core.asgi import get_asgi_application
+
+        application = get_asgi_application()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = []
+
+        async def one_request(full_path):
+            path, _, query = full_path.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'headers': [(b'host', b'localhost')],
+                'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+            }
+            statuses = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            async with semaphore:
+                start = time.perf_counter()
+                await application(scope, receive, send)
+                latencies.append(time.perf_counter() - start)
+
+            if statuses[0] != 200:
+                errors.append(statuses[0])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request(path) for path in requests))
+        elapsed = time.perf_counter() - start
+
+        return latencies, len(errors), elapsed
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from video_collection import benchmarking, db
+
+# The list page query shape: one page ordered by lower(name)
+READ_QUERY = 'SELECT id, name, url, video_id FROM video ORDER BY lower(name), id LIMIT 25'
+
+
+# python manage.py bench_sqlite_concurrency --readers 8 --seconds 5
+# Readers run the list page query over and over while one writer keeps adding videos, first with SQLite's default
+# rollback journal and then with the PRAGMAs from settings (WAL...). Shows how long readers wait on the writer.
+# Uses its own temporary database file, the app's database isn't touched.
+class Command(BaseCommand):
+    help = 'Benchmark SQLite readers while a writer inserts, default journal against the configured PRAGMAs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--rows', type=int, default=20000, help='Videos in the table before starting')
+        parser.add_argument('--batch', type=int, default=200, help='Videos the writer adds per transaction')
+        parser.add_argument('--output', help='Save the results to this JSON file')
+
+    def handle(self, *args, **options):
+        profiles = {
+            'default journal': {'journal_mode': 'DELETE'},
+            'configured pragmas': db.get_pragmas(),
+        }
+
+        results = {}
+        for label, pragmas in profiles.items():
+            results[label] = self.run_profile(pragmas, options)
+
+            reads, writes = results[label]['reads'], results[label]['writes']
+            self.stdout.write(
+                f'{label:<20} reads {reads["per_second"]:>9,.1f}/s  p50 {reads["p50_ms"]:.2f}ms  '
+                f'p99 {reads["p99_ms"]:.2f}ms  max {reads["max_ms"]:.2f}ms  locked errors {results[label]["locked"]}  '
+                f'| writes {writes["per_second"]:,.1f} batches/s')
+
+        if options['output']:
+            benchmarking.write_results(options['output'], results)
+
+    def run_profile(self, pragmas, options):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'bench.sqlite3')
+
+            def connect():
+                connection = sqlite3.connect(path, timeout=20, check_same_thread=False, isolation_level=None)
+                db.apply_pragmas(connection.cursor(), pragmas)
+                return connection
+
+            setup = connect()
+            setup.execute('CREATE TABLE video (id INTEGER PRIMARY KEY, name TEXT, url TEXT, notes TEXT, video_id TEXT UNIQUE)')
+            setup.execute('BEGIN')
+            setup.executemany('INSERT INTO video (name, url, notes, video_id) VALUES (?, ?, ?, ?)',
+                              (self.row(number) for number in range(options['rows'])))
+            setup.execute('COMMIT')
+            setup.close()
+
+            stop = threading.Event()
+            read_latencies, write_latencies = [], []
+            locked = []
+            lock = threading.Lock()
+
+            def reader():
+                connection = connect()
+                latencies = []
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        connection.execute(READ_QUERY).fetchall()
+                    except sqlite3.OperationalError:
+                        locked.append(1)
+                        continue
+                    latencies.append(time.perf_counter() - start)
+                connection.close()
+                with lock:
+                    read_latencies.extend(latencies)
+
+            def writer():
+                connection = connect()
+                number = options['rows']
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        connection.execute('BEGIN IMMEDIATE')
+                        connection.executemany('INSERT INTO video (name, url, notes, video_id) VALUES (?, ?, ?, ?)',
+                                               (self.row(n) for n in range(number, number + options['batch'])))
+                        connection.execute('COMMIT')
+                    except sqlite3.OperationalError:
+                        locked.append(1)
+                        if connection.in_transaction:
+                            connection.execute('ROLLBACK')
+                        continue
+                    number += options['batch']
+                    write_latencies.append(time.perf_counter() - start)
+                connection.close()
+
+            threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+            threads.append(threading.Thread(target=writer))
+
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            time.sleep(options['seconds'])
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        return {
+            'pragmas': pragmas,
+            'reads': benchmarking.summarize(read_latencies, elapsed),
+            'writes': benchmarking.summarize(write_latencies, elapsed),
+            'locked': len(locked),
+        }
+
+    def row(self, number):
+        return (f'Video {number:08d}', f'https://www.youtube.com/watch?v={number:011d}', 'example notes ' * 10,
+                f'{number:011d}')
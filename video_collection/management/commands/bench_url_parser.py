@@ -0,0 +1,100 @@
+import random
+import string
+import time
+from urllib import parse
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+
+from video_collection import youtube
+
+
+# The url parsing Video.save() used to do inline, kept here to compare against
+def legacy_extract_video_id(url):
+    url_components = parse.urlparse(url)
+
+    if url_components.scheme != 'https' or url_components.netloc != 'www.youtube.com' \
+            or url_components.path != '/watch' or not url_components.query:
+        raise ValidationError(f'Invalid YT Video URL {url}')
+
+    parameters = parse.parse_qs(url_components.query, strict_parsing=True)
+    v_parameters_list = parameters.get('v')
+
+    if not v_parameters_list:
+        raise ValidationError(f'Invalid YT Video URL, missing valid key parameters {url}')
+
+    return v_parameters_list[0]
+
+
+def random_video_id(rng):
+    return ''.join(rng.choice(string.ascii_letters + string.digits + '-_') for _ in range(11))
+
+
+# python manage.py bench_url_parser --rows 200000 --repeat-ratio 0.5
+# Times the old inline parser against youtube.parse_video_id (cold and warm LRU cache) and youtube.parse_many,
+# with the share of urls found in the LRU cache
+class Command(BaseCommand):
+    help = 'Benchmark YouTube url parsing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--repeat-ratio', type=float, default=0.0,
+                            help='Fraction of urls that repeat an earlier url, like re-imports of the same file')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rows = options['rows']
+
+        # Only https://www.youtube.com/watch?v= urls, the one shape the old parser accepts
+        urls = []
+        for _ in range(rows):
+            if urls and rng.random() < options['repeat_ratio']:
+                urls.append(rng.choice(urls))
+            else:
+                urls.append(f'https://www.youtube.com/watch?v={random_video_id(rng)}&t={rng.randint(0, 600)}s')
+
+        # The warm cache row parses the same number of urls, but from a working set that fits in the LRU cache
+        # (youtube.CACHE_SIZE), read once before timing. Replaying all the urls would evict every one before it
+        # comes round again, and measure a cold cache twice
+        working_set = urls[:youtube.CACHE_SIZE]
+        hot_urls = [working_set[i % len(working_set)] for i in range(rows)]
+
+        def legacy():
+            for url in urls:
+                legacy_extract_video_id(url)
+
+        def per_row(urls):
+            for url in urls:
+                youtube.parse_video_id(url)
+
+        def batch():
+            youtube.parse_many(urls)
+
+        youtube.clear_cache()
+        results = [('legacy urlparse + parse_qs', self.timed(legacy), None),
+                   ('parse_video_id, cold cache', *self.timed_with_hits(per_row, urls))]
+
+        youtube.clear_cache()
+        per_row(working_set)
+        results.append(('parse_video_id, warm cache', *self.timed_with_hits(per_row, hot_urls)))
+
+        youtube.clear_cache()
+        results.append(('parse_many, cold cache', *self.timed_with_hits(batch)))
+
+        for label, seconds, hits in results:
+            hit_rate = f'  {hits / rows:6.1%} cache hits' if hits is not None else ''
+            self.stdout.write(f'{label:<30} {seconds:8.3f}s  {rows / seconds:>12,.0f} urls/s{hit_rate}')
+
+        self.stdout.write(f'LRU cache: {youtube.cache_info()}')
+
+    # Seconds, and LRU cache hits while it ran
+    def timed_with_hits(self, func, *args):
+        hits = youtube.cache_info().hits
+        seconds = self.timed(func, *args)
+        return seconds, youtube.cache_info().hits - hits
+
+    def timed(self, func, *args):
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
@@ -0,0 +1,188 @@
+import json
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from video_collection.models import Video
+from video_collection import benchmarking, pagination, synthetic, youtube
+
+
+class Rollback(Exception):
+    pass
+
+
+# Counts the queries run on a connection, used with connection.execute_wrapper()
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+# python manage.py bench_views --sizes 10000,100000,1000000 --output bench.json
+# python manage.py bench_views --sizes 100000 --compare bench.json
+# For each table size: fills the table up to that many made up videos, then times the URL parsing and Video.save(),
+# and requests to home, add and video_list (first page, a deep page and searches), reporting p50/p95/p99 latency,
+# queries per request and peak Python memory per request.
+# The table only grows, so run it against a scratch database (VIDEO_DB_PATH=/tmp/bench.sqlite3).
+class Command(BaseCommand):
+    help = 'Benchmark the video_collection views and Video model at different table sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000', help='Comma separated table sizes e.g( 10000,100000 )')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per view')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the result cache between requests (default clears it before every request)')
+        parser.add_argument('--output', help='Save the results to this JSON file')
+        parser.add_argument('--compare', help='Earlier results JSON file to compare p95 latencies with')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes should be numbers separated by commas')
+
+        # Requests come in for the first allowed host, or localhost which DEBUG allows when ALLOWED_HOSTS is empty
+        self.client = Client(SERVER_NAME=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+        self.options = options
+
+        results = {}
+        for size in sorted(sizes):
+            self.fill_table(size)
+            self.stdout.write(f'--- {size:,} videos')
+            results[str(size)] = self.run_size()
+
+        if options['output']:
+            benchmarking.write_results(options['output'], results)
+
+        if options['compare']:
+            self.compare(results, options['compare'])
+
+    def fill_table(self, size):
+        existing = Video.objects.count()
+        if existing < size:
+            synthetic.generate_videos(size - existing, start=existing)
+
+    def run_size(self):
+        scenarios = {}
+
+        scenarios['parse_video_id'] = self.micro_parse()
+        scenarios['video_save'] = self.micro_save()
+
+        # A video in the middle of the table, for a deep page cursor and a search word from its name
+        middle = Video.objects.order_by('id')[Video.objects.count() // 2]
+        word = middle.name.split()[0]
+        deep_cursor = pagination.encode_cursor(pagination.NEXT, middle.name.lower(), middle.pk)
+
+        requests = {
+            'home': lambda: self.client.get(reverse('home')),
+            'video_list': lambda: self.client.get(reverse('video_list')),
+            'video_list_deep_page': lambda: self.client.get(reverse('video_list') + f'?cursor={deep_cursor}'),
+            'video_list_search': lambda: self.client.get(reverse('video_list') + f'?search_term={word}'),
+            'video_list_search_miss': lambda: self.client.get(reverse('video_list') + '?search_term=zzzznothing'),
+            'add': self.add_request(),
+        }
+
+        for name, request in requests.items():
+            scenarios[name] = self.time_requests(request)
+
+            summary = scenarios[name]
+            self.stdout.write(
+                f'{name:<24} p50 {summary["p50_ms"]:>8.2f}ms  p95 {summary["p95_ms"]:>8.2f}ms  '
+                f'p99 {summary["p99_ms"]:>8.2f}ms  queries {summary["queries"]:>3}  '
+                f'peak {summary["peak_memory_kb"]:>8,.0f}KB')
+
+        return scenarios
+
+    # Each add posts a new made up video, numbered from the current time so runs don't repeat each other's videos
+    def add_request(self):
+        next_number = [time.time_ns() // 1000]
+
+        def request():
+            next_number[0] += 1
+            video_id = synthetic.video_id_for(next_number[0])
+            return self.client.post(reverse('add_video'), {
+                'name': f'Benchmark video {next_number[0]}', 'url': f'https://youtu.be/{video_id}', 'notes': ''})
+
+        return request
+
+    def time_requests(self, request):
+        latencies = []
+
+        for _ in range(self.options['requests']):
+            if not self.options['warm_cache']:
+                cache.clear()
+
+            queries = QueryCounter()
+            start = time.perf_counter()
+            with connection.execute_wrapper(queries):
+                response = request()
+            latencies.append(time.perf_counter() - start)
+
+            if response.status_code not in (200, 302):
+                raise CommandError(f'Request failed with status {response.status_code}')
+
+        # Memory is measured on one more request, tracemalloc slows everything down so it's kept out of the timings
+        if not self.options['warm_cache']:
+            cache.clear()
+        tracemalloc.start()
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {**benchmarking.summarize(latencies), 'queries': queries.count, 'peak_memory_kb': peak / 1024}
+
+    def micro_parse(self):
+        urls = [f'https://www.youtube.com/watch?v={synthetic.video_id_for(10 ** 12 + number)}&t=1s'
+                for number in range(10000)]
+        youtube.clear_cache()
+
+        start = time.perf_counter()
+        for url in urls:
+            youtube.parse_video_id(url)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f'{"parse_video_id":<24} {elapsed / len(urls) * 1e6:>8.2f}us per url')
+        return {'count': len(urls), 'us_per_call': round(elapsed / len(urls) * 1e6, 3)}
+
+    # Video.save() including the INSERT, rolled back afterwards so the table doesn't change
+    def micro_save(self):
+        count = 200
+        latencies = []
+
+        try:
+            with transaction.atomic():
+                for number in range(count):
+                    video = Video(name=f'Save benchmark {number}', notes='',
+                                  url=f'https://youtu.be/{synthetic.video_id_for(2 * 10 ** 12 + number)}')
+                    start = time.perf_counter()
+                    video.save()
+                    latencies.append(time.perf_counter() - start)
+                raise Rollback()
+        except Rollback:
+            pass
+
+        summary = benchmarking.summarize(latencies)
+        self.stdout.write(f'{"video_save":<24} p50 {summary["p50_ms"]:>8.2f}ms  p95 {summary["p95_ms"]:>8.2f}ms')
+        return summary
+
+    def compare(self, results, path):
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)['results']
+
+        self.stdout.write(f'--- p95 compared to {path}')
+        for size, scenarios in results.items():
+            for name, summary in scenarios.items():
+                before = previous.get(size, {}).get(name, {}).get('p95_ms')
+                if before and 'p95_ms' in summary:
+                    change = (summary['p95_ms'] - before) / before * 100
+                    self.stdout.write(f'{size:>8} {name:<24} {before:>8.2f}ms -> {summary["p95_ms"]:>8.2f}ms '
+                                      f'({change:+.1f}%)')
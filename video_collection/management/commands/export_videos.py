@@ -0,0 +1,59 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from video_collection import exporters
+
+
+# python manage.py export_videos videos.csv
+# python manage.py export_videos videos.jsonl.gz --search-term weeknd
+# python manage.py export_videos 80s.csv --tag 80s
+# python manage.py export_videos - --format jsonl | gzip > videos.jsonl.gz
+# Writes every video (or the ones matching the search and/or with the tag) to a file as CSV or JSONL, the format import_videos reads.
+# The format and gzip are guessed from the file name when they aren't given
+class Command(BaseCommand):
+    help = 'Export videos to a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write, or - to write to stdout')
+        parser.add_argument('--format', choices=exporters.FORMATS, help='File format')
+        parser.add_argument('--gzip', action='store_true', help='gzip the output')
+        parser.add_argument('--search-term', help='Only export videos matching this search, like the video list')
+        parser.add_argument('--tag', help='Only export videos with this tag (its slug), like the tag pages')
+        parser.add_argument('--chunk-size', type=int, default=exporters.DEFAULT_CHUNK_SIZE,
+                            help='Rows read from the database at a time')
+        parser.add_argument('--database', help='Database to read from, by default a read replica when they are set up')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        name = path[:-3] if path.endswith('.gz') else path
+        compress = options['gzip'] or path.endswith('.gz')
+        file_format = options['format'] or name.rsplit('.', 1)[-1].lower()
+
+        if file_format not in exporters.FORMATS:
+            raise CommandError(f'Unknown format {file_format}, use --format')
+        if options['chunk_size'] < 1:
+            raise CommandError('Chunk size should be at least 1')
+
+        chunks = exporters.export(file_format, options['search_term'], compress,
+                                  chunk_size=options['chunk_size'], using=options['database'], tag=options['tag'])
+
+        if path == '-':
+            output = sys.stdout.buffer
+        else:
+            try:
+                output = open(path, 'wb')
+            except OSError as e:
+                raise CommandError(f'Could not open {path}: {e}')
+
+        written = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        if path != '-':
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written:,} bytes to {path}'))
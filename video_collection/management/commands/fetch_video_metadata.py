@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from video_collection.models import Video, VideoMetadata
+from video_collection import metadata
+
+
+# python manage.py fetch_video_metadata
+# python manage.py fetch_video_metadata --all --limit 100
+# Fetches YouTube metadata for videos that have none, or old metadata, without waiting for someone to open their page
+class Command(BaseCommand):
+    help = 'Fetch YouTube metadata for videos with missing or old metadata'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Fetch again for every video, even up to date ones')
+        parser.add_argument('--limit', type=int, help='Fetch at most this many videos')
+
+    def handle(self, *args, **options):
+        stored = {row.pk: row for row in VideoMetadata.objects.only('youtube_id', 'error', 'fetched_at')}
+        fetched = failed = 0
+
+        for video in Video.objects.only('id', 'video_id').iterator():
+            if options['limit'] is not None and fetched + failed >= options['limit']:
+                break
+
+            current = stored.get(video.pk)
+            if not options['all'] and current is not None and not metadata.is_stale(current, video):
+                continue
+
+            if metadata.refresh(video).error:
+                failed += 1
+            else:
+                fetched += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Fetched metadata for {fetched} videos, {failed} failed'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from video_collection.models import Video
+from video_collection import synthetic
+
+
+# python manage.py generate_videos 100000
+# Fills the database with made up videos for benchmarks. Point VIDEO_DB_PATH at a scratch database first,
+# e.g( VIDEO_DB_PATH=/tmp/bench.sqlite3 python manage.py migrate && VIDEO_DB_PATH=/tmp/bench.sqlite3 python manage.py generate_videos 100000 )
+class Command(BaseCommand):
+    help = 'Add made up videos to the database, for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='How many videos the table should have')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='Delete every video first')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+
+        if options['count'] < 0:
+            raise CommandError('Count should be 0 or more')
+
+        if options['clear']:
+            Video.objects.using(using).all().delete()
+
+        # Only add what's missing, so 10k then 100k reuses the first 10k
+        existing = Video.objects.using(using).count()
+        missing = options['count'] - existing
+
+        if missing > 0:
+            synthetic.generate_videos(missing, start=existing, batch_size=options['batch_size'],
+                                      seed=options['seed'], using=using)
+
+        self.stdout.write(self.style.SUCCESS(f'{max(existing, options["count"])} videos in the database'))
@@ -0,0 +1,56 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from video_collection import importers
+
+
+# python manage.py import_videos videos.csv
+# python manage.py import_videos videos.jsonl --batch-size 5000
+# cat videos.jsonl | python manage.py import_videos - --format jsonl
+# CSV files need a header row with name, url and (optional) notes columns, JSONL lines are objects with the same keys
+class Command(BaseCommand):
+    help = 'Bulk import videos from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - to read from stdin')
+        parser.add_argument('--format', choices=importers.FORMATS,
+                            help='File format, guessed from the file name when missing')
+        parser.add_argument('--batch-size', type=int, default=importers.DEFAULT_BATCH_SIZE,
+                            help='Rows validated, checked for duplicates and saved in each transaction')
+        parser.add_argument('--chunk-size', type=int, default=importers.DEFAULT_CHUNK_SIZE,
+                            help='Rows in each INSERT statement')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Check the file and report, without saving anything')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or importers.guess_format(path)
+
+        if options['batch_size'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('Batch and chunk sizes should be at least 1')
+
+        if path == '-':
+            text_file = importers.open_text(sys.stdin.buffer)
+        else:
+            try:
+                text_file = open(path, encoding='utf-8-sig', newline='')
+            except OSError as e:
+                raise CommandError(f'Could not open {path}: {e}')
+
+        with text_file:
+            report = importers.import_file(
+                text_file, file_format,
+                batch_size=options['batch_size'], chunk_size=options['chunk_size'],
+                dry_run=options['dry_run'], using=options['database'])
+
+        for line, message in report.errors:
+            self.stderr.write(f'Line {line}: {message}')
+
+        if report.error_count > len(report.errors):
+            self.stderr.write(f'... and {report.error_count - len(report.errors)} more errors')
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {report.created} videos, skipped {report.duplicates} duplicates, {report.error_count} errors'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from video_collection import search
+
+
+# python manage.py rebuild_search_index
+# Rebuilds the full text search index for the video name and notes from the video table
+class Command(BaseCommand):
+    help = 'Rebuild the full text search index of video names and notes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help='Database alias to rebuild the index in')
+
+    def handle(self, *args, **options):
+        using = options['database']
+
+        # Creates the table and triggers if they are missing
+        if not search.install(using):
+            raise CommandError(
+                f'Full text search (FTS5) is not available on database "{using}", searches use icontains instead')
+
+        search.rebuild(using)
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from video_collection import counters, tagging
+
+
+# python manage.py reconcile_counters
+# Counts the videos again and fixes the stored counters (see counters.py) and the tags' video counts (see tagging.py),
+# e.g( after changing videos with raw SQL )
+class Command(BaseCommand):
+    help = 'Recount the videos and fix the stored video counters and tag counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        wrong = counters.reconcile(options['database'])
+        wrong.update({f'tag:{slug}': counts for slug, counts in tagging.reconcile(options['database']).items()})
+
+        for key, (was, now) in sorted(wrong.items()):
+            self.stdout.write(f'{key}: {was} -> {now}')
+
+        self.stdout.write(self.style.SUCCESS(f'Counters reconciled, {len(wrong)} were wrong'))
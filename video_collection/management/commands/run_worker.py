@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from video_collection import jobs
+
+
+# python manage.py run_worker
+# python manage.py run_worker --concurrency 8 --pool process
+# python manage.py run_worker --once
+# Runs queued background jobs (see jobs.py). Any number of workers can run at once, on any machine using the database.
+# Threads suit jobs that wait on the network (metadata, thumbnails), processes suit jobs that use the CPU.
+class Command(BaseCommand):
+    help = 'Run queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'VIDEO_JOBS_CONCURRENCY', 4),
+                            help='Jobs run at the same time')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run jobs in threads (default) or processes')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait before looking again when there are no jobs')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due now, then stop')
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+        if options['pool'] == 'process':
+            # Started fresh (spawn, not fork) so they don't share this process' database connections
+            pool = ProcessPoolExecutor(max_workers=concurrency, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+        else:
+            pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='video-worker')
+
+        self.stdout.write(f'Worker {worker_id} running {concurrency} jobs at a time ({options["pool"]} pool)')
+
+        running = set()
+        done = failed = 0
+
+        try:
+            while True:
+                # Only claim as many jobs as there are free slots, claimed jobs are invisible to other workers
+                if len(running) < concurrency:
+                    token, claimed = jobs.claim(worker_id, concurrency - len(running))
+                    running |= {pool.submit(jobs.run_claimed, job.pk, token) for job in claimed}
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                # Until a job finishes, or the poll interval passes and there may be new jobs for the free slots
+                finished, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future.result():
+                        done += 1
+                    else:
+                        failed += 1
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping, waiting for the running jobs to finish')
+        finally:
+            pool.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f'{done} jobs done, {failed} failed'))
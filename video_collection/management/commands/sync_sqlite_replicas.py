@@ -0,0 +1,47 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from video_collection import routers
+
+
+# python manage.py sync_sqlite_replicas [--every 5]
+# Stands in for replication when trying read replicas locally with SQLite files: copies the default database to
+# every replica in settings.VIDEO_DB_REPLICAS (VIDEO_DB_REPLICA_PATHS=replica.sqlite3) with SQLite's online backup,
+# which is safe while the server is running. --every copies again every few seconds, so the replicas lag behind
+# like real ones.
+class Command(BaseCommand):
+    help = 'Copy the default SQLite database to the SQLite read replicas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, help='Keep copying, every this many seconds')
+
+    def handle(self, *args, **options):
+        primary = connections[routers.PRIMARY]
+        aliases = routers.replicas()
+
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be copied, other databases have their own replication')
+        if not aliases:
+            raise CommandError('No replicas set up, set VIDEO_DB_REPLICA_PATHS')
+
+        while True:
+            start = time.perf_counter()
+            for alias in aliases:
+                self.copy(primary.settings_dict['NAME'], connections[alias].settings_dict['NAME'])
+            self.stdout.write(f'Copied to {", ".join(aliases)} in {time.perf_counter() - start:.2f}s')
+
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def copy(self, source_path, replica_path):
+        source = sqlite3.connect(source_path)
+        replica = sqlite3.connect(replica_path)
+        try:
+            source.backup(replica)
+        finally:
+            replica.close()
+            source.close()
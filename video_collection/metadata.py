@@ -0,0 +1,202 @@
+import json
+import re
+from datetime import timedelta
+from functools import lru_cache
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Video, VideoMetadata
+from . import caching, db, jobs, youtube
+
+# YouTube metadata for the video detail page (title, channel, length, thumbnail).
+# It's fetched by a pluggable fetcher (VIDEO_METADATA_FETCHER) and kept in the VideoMetadata table,
+# with a copy in the cache so a page view is one cache get. Whether it's old comes from the row's fetched_at.
+# Page views never wait for YouTube: missing or old metadata is fetched by a background job (jobs.py),
+# and the page shows what we have (or nothing) until it's there. New videos are queued when they are saved.
+
+CACHE_KEY = 'video_metadata:{pk}:{video_id}'
+FETCH_TASK = 'fetch_video_metadata'
+
+# Fetched metadata is fetched again after this many seconds, failed fetches are tried again sooner
+TTL = getattr(settings, 'VIDEO_METADATA_TTL', 7 * 24 * 60 * 60)
+FAILURE_TTL = getattr(settings, 'VIDEO_METADATA_FAILURE_TTL', 60 * 60)
+# Seconds before a page view looks at the table again for metadata that was missing or old, by then the
+# background fetch has usually saved it
+RECHECK_TIMEOUT = getattr(settings, 'VIDEO_METADATA_RECHECK_TIMEOUT', 60)
+
+# Seconds to wait for YouTube before giving up
+FETCH_TIMEOUT = getattr(settings, 'VIDEO_METADATA_TIMEOUT', 5)
+
+
+class MetadataError(Exception):
+    pass
+
+
+# Fetchers take the video id and return a dict with any of title, author_name, duration_seconds and thumbnail_url.
+# They raise MetadataError when the video can't be fetched.
+
+# YouTube's oEmbed endpoint, no API key needed. oEmbed doesn't say how long the video is
+class OEmbedFetcher:
+    endpoint = 'https://www.youtube.com/oembed'
+
+    def __call__(self, video_id):
+        data = _get_json(f'{self.endpoint}?{urlencode({"url": youtube.canonical_url(video_id), "format": "json"})}')
+
+        return {
+            'title': data.get('title', ''),
+            'author_name': data.get('author_name', ''),
+            'thumbnail_url': data.get('thumbnail_url', ''),
+        }
+
+
+# YouTube Data API v3, needs an API key in VIDEO_YOUTUBE_API_KEY. Gives the length of the video too
+class DataAPIFetcher:
+    endpoint = 'https://www.googleapis.com/youtube/v3/videos'
+
+    def __call__(self, video_id):
+        api_key = getattr(settings, 'VIDEO_YOUTUBE_API_KEY', '')
+        if not api_key:
+            raise MetadataError('VIDEO_YOUTUBE_API_KEY is not set')
+
+        query = urlencode({'id': video_id, 'part': 'snippet,contentDetails', 'key': api_key})
+        items = _get_json(f'{self.endpoint}?{query}').get('items') or []
+        if not items:
+            raise MetadataError('Video not found')
+
+        snippet = items[0].get('snippet', {})
+        thumbnails = snippet.get('thumbnails', {})
+        thumbnail = thumbnails.get('high') or thumbnails.get('default') or {}
+
+        return {
+            'title': snippet.get('title', ''),
+            'author_name': snippet.get('channelTitle', ''),
+            'duration_seconds': parse_duration(items[0].get('contentDetails', {}).get('duration', '')),
+            'thumbnail_url': thumbnail.get('url', ''),
+        }
+
+
+# Made up metadata without any network calls, for tests and offline development
+class StubFetcher:
+    def __call__(self, video_id):
+        return {
+            'title': f'Video {video_id}',
+            'author_name': 'Stub channel',
+            'duration_seconds': 60 + sum(map(ord, video_id)) % 600,
+            'thumbnail_url': f'https://i.ytimg.com/vi/{video_id}/hqdefault.jpg',
+        }
+
+
+def _get_json(url):
+    try:
+        with urlopen(url, timeout=FETCH_TIMEOUT) as response:
+            return json.load(response)
+    except (URLError, OSError, ValueError) as error:
+        raise MetadataError(str(error)) from error
+
+
+# ISO 8601 durations from the Data API e.g( PT1H2M3S -> 3723 )
+DURATION_PATTERN = re.compile(r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?')
+
+
+def parse_duration(value):
+    match = DURATION_PATTERN.fullmatch(value or '')
+    if not match or not any(match.groups()):
+        return None
+
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+@lru_cache(maxsize=None)
+def _load_fetcher(path):
+    return import_string(path)()
+
+
+def get_fetcher():
+    return _load_fetcher(getattr(settings, 'VIDEO_METADATA_FETCHER', 'video_collection.metadata.OEmbedFetcher'))
+
+
+def stale_at(metadata):
+    return metadata.fetched_at + timedelta(seconds=FAILURE_TTL if metadata.error else TTL)
+
+
+def is_stale(metadata, video):
+    # The url was changed to another video since, unless fetching that one failed a moment ago
+    if metadata.youtube_id != video.video_id and not metadata.error:
+        return True
+
+    return stale_at(metadata) < timezone.now()
+
+
+# Fresh metadata is cached until it gets old. Missing or old metadata (a fetch is queued) only for RECHECK_TIMEOUT:
+# the worker saves what it fetches to the table, and its cache isn't this process' cache with the default locmem one.
+# The key has the video id, so a changed url looks at the table again straight away
+def _cache(video, metadata):
+    if metadata is None or is_stale(metadata, video):
+        timeout = RECHECK_TIMEOUT
+    else:
+        timeout = max(1, int((stale_at(metadata) - timezone.now()).total_seconds()))
+
+    caching.get_cache().set(CACHE_KEY.format(pk=video.pk, video_id=video.video_id), metadata or False, timeout)
+
+
+# Metadata we have for the video (maybe old, or None), without any outbound calls.
+# Missing or old metadata is fetched in the background for a later page view
+def get_metadata(video):
+    # False is cached for videos without metadata yet, so they don't query the table every time either
+    metadata = caching.get_cache().get(CACHE_KEY.format(pk=video.pk, video_id=video.video_id))
+
+    if metadata is None:
+        metadata = VideoMetadata.objects.filter(video=video).first()
+        if metadata is None or is_stale(metadata, video):
+            schedule_refresh(video.pk)
+        _cache(video, metadata)
+
+    # Metadata for the video's old url isn't shown
+    if metadata and metadata.youtube_id == video.video_id:
+        return metadata
+    return None
+
+
+# Fetch the video's metadata now and save it, returns the VideoMetadata row.
+# A failed fetch keeps what was fetched before and saves the error, so it's tried again after FAILURE_TTL
+def refresh(video):
+    try:
+        fields = get_fetcher()(video.video_id)
+        fields.update(youtube_id=video.video_id, error='')
+    except MetadataError as error:
+        fields = {'error': str(error)[:400]}
+
+    metadata = db.update_or_create(VideoMetadata, {**fields, 'fetched_at': timezone.now()}, video=video)
+
+    _cache(video, metadata)
+
+    return metadata
+
+
+# Fetch the video's metadata in the background, with the job queue. Nothing is added if it's already queued or running
+def schedule_refresh(pk):
+    jobs.enqueue(FETCH_TASK, key=f'metadata:{pk}', video_pk=pk)
+
+
+def schedule_refresh_many(pks, using='default'):
+    jobs.enqueue_many(FETCH_TASK, [{'video_pk': pk} for pk in pks],
+                      key=lambda payload: f'metadata:{payload["video_pk"]}', using=using)
+
+
+@jobs.task(FETCH_TASK)
+def fetch_video_metadata(video_pk):
+    video = Video.objects.filter(pk=video_pk).first()
+    # Deleted since it was queued
+    if video is None:
+        return
+
+    # Failures are saved by refresh(), raising as well makes the job queue try again later
+    metadata = refresh(video)
+    if metadata.error:
+        raise MetadataError(metadata.error)
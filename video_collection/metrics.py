@@ -0,0 +1,89 @@
+import threading
+from bisect import bisect_left
+
+from . import caching
+
+# In-process metrics for the performance middleware, shown in the Prometheus text format by the metrics view.
+# Every process keeps its own numbers, Prometheus scrapes each process.
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # view name -> [count per bucket (plus one for +Inf), sum, count]
+        self.series = {}
+
+    def observe(self, view, value):
+        with self.lock:
+            series = self.series.get(view)
+            if series is None:
+                series = self.series[view] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+            # Only the first bucket that fits is counted here, the buckets add up when they are written out
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+
+    def prometheus_lines(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+
+        with self.lock:
+            series = {view: (list(counts), total, count) for view, (counts, total, count) in self.series.items()}
+
+        for view, (counts, total, count) in sorted(series.items()):
+            label = _label_value(view)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {count}')
+
+        return lines
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_duration = Histogram('video_request_duration_seconds', 'Time spent in the view and middleware below it',
+                             SECONDS_BUCKETS)
+db_duration = Histogram('video_db_duration_seconds', 'Time spent running database queries per request',
+                        SECONDS_BUCKETS)
+db_queries = Histogram('video_db_queries', 'Database queries per request', QUERY_COUNT_BUCKETS)
+template_duration = Histogram('video_template_duration_seconds', 'Time spent rendering the template per request',
+                              SECONDS_BUCKETS)
+response_size = Histogram('video_response_size_bytes', 'Response body size', BYTES_BUCKETS)
+
+HISTOGRAMS = [request_duration, db_duration, db_queries, template_duration, response_size]
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+def prometheus_text():
+    lines = []
+
+    for histogram in HISTOGRAMS:
+        lines += histogram.prometheus_lines()
+
+    # Video list result cache counters
+    for name, value in caching.stats.as_dict().items():
+        metric = f'video_list_cache_{name}_total'
+        lines += [f'# HELP {metric} Video list result cache {name}', f'# TYPE {metric} counter', f'{metric} {value}']
+
+    return '\n'.join(lines) + '\n'
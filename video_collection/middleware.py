@@ -0,0 +1,186 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics, routers
+
+
+# Times each database query, while it's the request's timer (timed_queries())
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+# The timer of the request being measured. A context variable, so it's seen by the queries of async views too,
+# which run on other threads' connections (sync_to_async copies the context)
+_timer = ContextVar('video_collection_query_timer', default=None)
+
+
+@contextmanager
+def timed_queries(timer):
+    token = _timer.set(timer)
+    try:
+        yield
+    finally:
+        _timer.reset(token)
+
+
+# Execute wrapper on every connection (install_query_timer), passes queries to the request's timer if there is one
+def time_query(execute, sql, params, many, context):
+    timer = _timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+# connection_created receiver. First in the list: connection.execute_wrapper() blocks remove the last wrapper
+# when they end, even when the connection was opened inside them
+def install_query_timer(sender, connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+# Per-request performance numbers: view time, database query count and time, template render time and response size.
+# They are added to the response as a Server-Timing header (shown in the browser dev tools) and to the histograms
+# served by the metrics view.
+#
+# Only a sample of requests is measured: VIDEO_PERF_SAMPLE_RATE between 0 (off, the default) and 1 (every request).
+# When it's 0 the middleware takes itself out of the middleware list at startup, what's left is one context variable
+# lookup per query (time_query()).
+# Template time is measured for views that return a TemplateResponse.
+class PerformanceMiddleware:
+    # Runs in sync and async (ASGI) stacks, without a thread switch in front of async views
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'VIDEO_PERF_SAMPLE_RATE', 0)
+
+        if not self.sample_rate:
+            raise MiddlewareNotUsed()
+
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not self.sampled():
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        request._template_seconds = 0.0
+
+        start = time.perf_counter()
+        with timed_queries(timer):
+            response = self.get_response(request)
+        return self.record(request, response, timer, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        request._template_seconds = 0.0
+
+        start = time.perf_counter()
+        with timed_queries(timer):
+            response = await self.get_response(request)
+        return self.record(request, response, timer, time.perf_counter() - start)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, request, response, timer, total):
+        view = request.resolver_match.view_name if request.resolver_match else 'unknown'
+        template = request._template_seconds
+
+        metrics.request_duration.observe(view, total)
+        metrics.db_duration.observe(view, timer.seconds)
+        metrics.db_queries.observe(view, timer.count)
+        metrics.template_duration.observe(view, template)
+
+        if not response.streaming:
+            metrics.response_size.observe(view, len(response.content))
+
+        response.headers['Server-Timing'] = (
+            f'total;dur={total * 1000:.2f}, db;dur={timer.seconds * 1000:.2f};desc="{timer.count} queries", '
+            f'tpl;dur={template * 1000:.2f}')
+
+        return response
+
+    # Render the TemplateResponse here (instead of later in the handler) so it can be timed
+    def process_template_response(self, request, response):
+        # Not a sampled request
+        if not hasattr(request, '_template_seconds'):
+            return response
+
+        start = time.perf_counter()
+        response.render()
+        request._template_seconds += time.perf_counter() - start
+        return response
+
+
+# Read-your-writes with read replicas (see routers.py). A request that writes (POST, PUT...) reads from the default
+# database, and gets a cookie so the same browser's requests for the next VIDEO_REPLICA_PIN_SECONDS read from it
+# too. Users see the video they just added, even when the replicas haven't caught up yet.
+# Other requests read from one replica, picked for the request.
+# Without replicas the middleware takes itself out at startup.
+PIN_COOKIE = 'video_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class ReplicaPinningMiddleware:
+    # Runs in sync and async (ASGI) stacks. The pin and the replica are context variables, so async views and
+    # their sync_to_async() calls see them
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'VIDEO_REPLICA_PIN_SECONDS', 10)
+
+        if not routers.replicas():
+            raise MiddlewareNotUsed()
+
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with self.databases(request):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        with self.databases(request):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def databases(self, request):
+        if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+            return routers.use_primary()
+        return routers.use_replica()
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:04
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0003_video_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(django.db.models.functions.text.Lower('name'), models.F('id'), name='video_name_lower_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:09
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0004_video_name_lower_id_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='video',
+            name='notes',
+            field=models.TextField(blank=True, null=True, validators=[django.core.validators.MaxLengthValidator(5000)]),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0005_video_notes_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoMetadata',
+            fields=[
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metadata', serialize=False, to='video_collection.video')),
+                ('youtube_id', models.CharField(max_length=40)),
+                ('title', models.CharField(blank=True, max_length=400)),
+                ('author_name', models.CharField(blank=True, max_length=200)),
+                ('duration_seconds', models.PositiveIntegerField(blank=True, null=True)),
+                ('thumbnail_url', models.CharField(blank=True, max_length=400)),
+                ('error', models.CharField(blank=True, max_length=400)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0007_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Thumbnail',
+            fields=[
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='thumbnail', serialize=False, to='video_collection.video')),
+                ('youtube_id', models.CharField(max_length=40)),
+                ('files', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
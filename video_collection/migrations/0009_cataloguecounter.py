@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+# Start the counters from the videos already saved
+def count_videos(apps, schema_editor):
+    from video_collection.counters import letter_key
+
+    Video = apps.get_model('video_collection', 'Video')
+    CatalogueCounter = apps.get_model('video_collection', 'CatalogueCounter')
+    using = schema_editor.connection.alias
+
+    counts = {'videos': 0}
+    for name in Video.objects.using(using).values_list('name', flat=True).iterator(chunk_size=5000):
+        counts['videos'] += 1
+        counts[letter_key(name)] = counts.get(letter_key(name), 0) + 1
+
+    CatalogueCounter.objects.using(using).bulk_create(
+        [CatalogueCounter(key=key, value=value) for key, value in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0008_thumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueCounter',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_videos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0009_cataloguecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Playlist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=120, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('slug', models.SlugField(max_length=60, unique=True)),
+                ('video_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VideoTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='video_tags', to='video_collection.tag')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='video_tags', to='video_collection.video')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlaylistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('playlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='video_collection.playlist')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='playlist_entries', to='video_collection.video')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='videos', through='video_collection.VideoTag', to='video_collection.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='videotag',
+            index=models.Index(fields=['tag', 'video'], name='videotag_tag_video_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='videotag',
+            constraint=models.UniqueConstraint(fields=('video', 'tag'), name='videotag_video_tag_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='playlistentry',
+            constraint=models.UniqueConstraint(fields=('playlist', 'position'), name='playlistentry_playlist_position_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='playlistentry',
+            constraint=models.UniqueConstraint(fields=('playlist', 'video'), name='playlistentry_playlist_video_unique'),
+        ),
+    ]
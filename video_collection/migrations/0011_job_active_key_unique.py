@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:42
+
+from django.db import migrations, models
+
+
+# Before the constraint, keep one waiting or running job per key. Running ones are kept, they may be half done
+def remove_duplicate_jobs(apps, schema_editor):
+    Job = apps.get_model('video_collection', 'Job')
+    using = schema_editor.connection.alias
+
+    active = Job.objects.using(using).filter(status__in=['queued', 'running']).exclude(key='')
+    seen = set()
+    duplicates = []
+    # 'running' sorts before 'queued'
+    for pk, key in active.order_by('key', '-status', 'id').values_list('pk', 'key').iterator(chunk_size=5000):
+        if key in seen:
+            duplicates.append(pk)
+        seen.add(key)
+
+    for start in range(0, len(duplicates), 500):
+        Job.objects.using(using).filter(pk__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_collection', '0010_tags_playlists'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running']), models.Q(('key', ''), _negated=True)), fields=('key',), name='job_active_key_unique'),
+        ),
+    ]
@@ -1,9 +1,11 @@
-from django.db import models
+from django.conf import settings
+from django.core.validators import MaxLengthValidator
+from django.db import models, router, transaction
+from django.db.models import F
+from django.db.models.functions import Lower
 
-from urllib import parse
-
-from django.core.exceptions import ValidationError
-# A library that allows to parse. This will help parse the YT video ID for you
+# Parses and checks YT video urls, and gives back the video ID
+from .youtube import parse_video_id
 
 # Create your models here.
 
@@ -11,63 +13,228 @@ from django.core.exceptions import ValidationError
 # What goes in a video class?
 # Name, YTVidURL, and optional Note
 
+# Longest notes that can be saved. Checked by the add form, the API and imports (the database column isn't limited)
+NOTES_MAX_LENGTH = 5000
+# How much of the notes the video list shows, the detail page shows all of them
+NOTES_PREVIEW_LENGTH = 200
+
 
 class Video(models.Model):
     name = models.CharField(max_length=200)
     url = models.CharField(max_length=400)
-    notes = models.TextField(blank=True, null=True)
+    notes = models.TextField(blank=True, null=True, validators=[MaxLengthValidator(NOTES_MAX_LENGTH)])
     # This is for the YT video id field
     # With unique value to be true for no replicate vid
     video_id = models.CharField(max_length=40, unique=True)
+    # When the video was last added or changed, the newest one tells us when the video list last changed
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Tags for finding videos e.g( pop, 80s ), see tagging.py
+    tags = models.ManyToManyField('Tag', through='VideoTag', related_name='videos', blank=True)
+
+    class Meta:
+        indexes = [
+            # The video list is always ordered by (lower(name), id), and pages start after a (lower(name), id) cursor.
+            # With this index a page is a short walk through the index instead of sorting the whole table
+            models.Index(Lower('name'), F('id'), name='video_name_lower_id_idx'),
+        ]
 
     # Override built in save method for model objects from django, and then add code we would want to run before the actual built in save function from django
 
     # The args and kwargs is django's save method arguments
 
     def save(self, *args, **kwargs):
-        # Check if the video id from yt url starts with the base url (https://www.youtube.com/watch), if it doesn't, then raise a validation error
-        # if not self.url.startswith('https://www.youtube.com/watch'):
-        #     raise ValidationError(f'Not a Youtube URL {self.url}')
+        # Check the url and get the video id out of it, raises a validation error if it's not a valid YT video url
+        # e.g( https://www.youtube.com/watch?v=4fsdfsa11dX, https://youtu.be/4fsdfsa11dX -> 4fsdfsa11dX )
+        self.video_id = parse_video_id(self.url)
 
-        # extract the video id from users passed in object of the yt video url
-        url_components = parse.urlparse(self.url)
+        # Original Save function from django that actually saves to the db needs to run after.
+        # In a transaction with the post_save receivers, so the counters and queued jobs are saved with the video or not at all
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Video, instance=self)):
+            super().save(*args, **kwargs)
+
+    # Formatted way to display the information strings
+    # Truncate to the first 200 letters, notes can be empty (None)
+    def __str__(self):
+        notes = (self.notes or '')[:NOTES_PREVIEW_LENGTH]
+        return f'ID: {self.pk}, Name: {self.name}, URL: {self.url}, Video ID: {self.video_id}, Notes: {notes}'
+
+
+# Details about a video from YouTube (title, channel, length, thumbnail), fetched in the background by metadata.py.
+# One row per video, fetched_at says when it was last fetched so old rows can be fetched again
+class VideoMetadata(models.Model):
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, primary_key=True, related_name='metadata')
+    # The YT video id it was fetched for, the video's url can be changed afterwards
+    youtube_id = models.CharField(max_length=40)
+    title = models.CharField(max_length=400, blank=True)
+    author_name = models.CharField(max_length=200, blank=True)
+    duration_seconds = models.PositiveIntegerField(blank=True, null=True)
+    thumbnail_url = models.CharField(max_length=400, blank=True)
+    # Why the last fetch failed, empty if it worked
+    error = models.CharField(max_length=400, blank=True)
+    fetched_at = models.DateTimeField()
+
+    # Length as shown on YouTube e.g( 3:05, 1:02:03 ), '' when we don't know it
+    @property
+    def duration_display(self):
+        if self.duration_seconds is None:
+            return ''
+
+        hours, rest = divmod(self.duration_seconds, 3600)
+        minutes, seconds = divmod(rest, 60)
+        return f'{hours}:{minutes:02}:{seconds:02}' if hours else f'{minutes}:{seconds:02}'
 
-        # for security reasons, we want to check each component url and make sure each pattern matches with expected individual url component. If users' url does not match the patterns, then raise validation error
-        if url_components.scheme != 'https':
-            raise ValidationError(f'Invalid YT Video URL {self.url}')
+    def __str__(self):
+        return f'Video ID: {self.youtube_id}, Title: {self.title}, Fetched: {self.fetched_at}'
+
+
+# Background job queue table, see jobs.py. Workers (python manage.py run_worker) claim due jobs, run them,
+# and mark them done, or queue them again with a delay when they fail
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    # Registered task name e.g( fetch_video_metadata ), and its keyword arguments
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    # Optional name for the work, so the same work isn't queued twice e.g( metadata:12 )
+    key = models.CharField(max_length=200, blank=True, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Not run before this time, failed jobs wait longer after every attempt
+    run_after = models.DateTimeField()
+    # The worker claim running the job, and when the claim runs out. A job whose worker died is claimed again then
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for due jobs by status and time
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+        constraints = [
+            # One waiting or running job per key, so the same work can't be queued twice (see jobs.enqueue())
+            models.UniqueConstraint(fields=['key'], name='job_active_key_unique',
+                                    condition=models.Q(status__in=['queued', 'running']) & ~models.Q(key='')),
+        ]
 
-        if url_components.netloc != 'www.youtube.com':
-            raise ValidationError(f'Invalid YT Video URL {self.url}')
+    def __str__(self):
+        return f'ID: {self.pk}, Task: {self.task}, Status: {self.status}, Attempts: {self.attempts}'
 
-        if url_components.path != '/watch':
-            raise ValidationError(f'Invalid YT Video URL {self.url}')
 
-        query_string = url_components.query  # ID would be like 'v=4fsdfsa11d'
+# Resized copies of a video's YouTube thumbnail, made once by thumbnails.py and kept as files on disk.
+# files maps each variant to its file path, under VIDEO_THUMBNAIL_ROOT e.g( {'160.webp': 'ab/ab12....webp'} ).
+# File names are a hash of the file's bytes, so a file never changes once it's written and can be cached forever
+class Thumbnail(models.Model):
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, primary_key=True, related_name='thumbnail')
+    # The YT video id it was made for, the video's url can be changed afterwards
+    youtube_id = models.CharField(max_length=40)
+    files = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now=True)
 
-        # If the query string is not valid, then raise a validation error with invalid message and the url's payload
-        if not query_string:
-            raise ValidationError(f'Invalid YT Video URL {self.url}')
+    def url(self, name):
+        return settings.VIDEO_THUMBNAIL_URL + self.files[name]
 
-        # Parse qs basically converts the query string into a dictionary or object, which essentially separates the query  string'v=4fsdfsa11d' into -> {v: '4fsdfsa11d'}
-        # Strict passing makes sure it is a valid string
-        parameters = parse.parse_qs(query_string, strict_parsing=True)
+    # Widths of the resized variants in one format e.g( [160, 320] ), none when Pillow wasn't installed
+    def widths(self, extension):
+        return sorted(int(name.split('.')[0]) for name in self.files
+                      if name.endswith(f'.{extension}') and name.split('.')[0].isdigit())
 
-        v_parameters_list = parameters.get('v')
-        # get value for key,'v', which is from the string query params of the yt vid url. We can do this method because it is a dictionary
-        # If the key has no 'V' it will return None, no key found e.g (abc: '324fdfd')
+    def srcset(self, extension):
+        return ', '.join(f'{self.url(f"{width}.{extension}")} {width}w' for width in self.widths(extension))
 
-        # v_parameters_list is a python list
-        if not v_parameters_list:  # Check of none or empty list, then raise validationerror
-            raise ValidationError(
-                f'Invalid YT Video URL, missing valid key parameters {self.url}')
+    # For <source srcset> and <img srcset>, the browser picks the size it needs
+    @property
+    def webp_srcset(self):
+        return self.srcset('webp')
 
-        # Else we will make video_id from the Video class to be the first of the list of v_parameters_list
-        self.video_id = v_parameters_list[0]  # String
+    @property
+    def jpeg_srcset(self):
+        return self.srcset('jpg')
 
-        # Original Save function from django that actually saves to the db needs to run after
-        super().save(*args, **kwargs)
+    # Smallest JPEG, or the original image when it couldn't be resized
+    @property
+    def jpeg_url(self):
+        widths = self.widths('jpg')
+        return self.url(f'{widths[0]}.jpg' if widths else 'original.jpg')
+
+    def __str__(self):
+        return f'Video ID: {self.youtube_id}, Files: {", ".join(sorted(self.files))}'
+
+
+# Counts kept up to date as videos are added and deleted (see counters.py), so pages never need COUNT(*) on the table
+# e.g( videos -> 1520, letter:b -> 87 )
+class CatalogueCounter(models.Model):
+    key = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.key}: {self.value}'
+
+
+# A word videos are tagged with e.g( Hip Hop ). The slug is the tag in urls e.g( video_list?tag=hip-hop ),
+# tags whose names only differ in case or punctuation are the same tag
+class Tag(models.Model):
+    name = models.CharField(max_length=50)
+    slug = models.SlugField(max_length=60, unique=True)
+    # Number of videos with the tag, changed by the m2m_changed receivers (signals.py) in the same transaction
+    # as the videos are tagged, so the tag list and tag filtered video list never count the link table
+    video_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name} ({self.video_count})'
+
+
+# Link table between videos and tags
+class VideoTag(models.Model):
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='video_tags')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='video_tags')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['video', 'tag'], name='videotag_video_tag_unique'),
+        ]
+        indexes = [
+            # Filtering the video list by a tag reads the tag's videos from this index
+            models.Index(fields=['tag', 'video'], name='videotag_tag_video_idx'),
+        ]
+
+    def __str__(self):
+        return f'Video: {self.video_id}, Tag: {self.tag_id}'
+
+
+# A named list of videos in the order they were added to it
+class Playlist(models.Model):
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=120, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When videos were last added to or removed from the playlist
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'ID: {self.pk}, Name: {self.name}'
+
+
+# One video in a playlist. Positions go up as videos are added, removing a video leaves a gap,
+# which doesn't matter because pages are read after a position, never at an offset
+class PlaylistEntry(models.Model):
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='entries')
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='playlist_entries')
+    position = models.PositiveIntegerField()
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Also the index a playlist page is read from, in position order
+            models.UniqueConstraint(fields=['playlist', 'position'], name='playlistentry_playlist_position_unique'),
+            models.UniqueConstraint(fields=['playlist', 'video'], name='playlistentry_playlist_video_unique'),
+        ]
 
-    # Formatted way to display the information strings
-    # Truncate to the first 200 letters
     def __str__(self):
-        return f'ID: {self.pk}, Name: {self.name}, URL: {self.url}, Video ID: {self.video_id}, Notes: {self.notes[:200]}'
+        return f'Playlist: {self.playlist_id}, Position: {self.position}, Video: {self.video_id}'
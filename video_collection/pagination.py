@@ -0,0 +1,139 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+# Keyset (cursor) pagination for the video list.
+# Instead of OFFSET, every page remembers the sort key of its first and last row, (lower(name), id),
+# and the next query starts right after that key. The database only ever reads one page worth of rows,
+# so page 1 and page 10,000 cost the same.
+
+# Default and max number of videos per page, can be changed in settings.py
+DEFAULT_PAGE_SIZE = getattr(settings, 'VIDEO_LIST_PAGE_SIZE', 25)
+MAX_PAGE_SIZE = getattr(settings, 'VIDEO_LIST_MAX_PAGE_SIZE', 200)
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# Cursor tokens are url-safe base64 json of [direction, lower name, id] e.g( ["n", "abc", 12] -> WyJuIiwgImFiYyIsIDEyXQ )
+def encode_cursor(direction, name_lower, pk):
+    raw = json.dumps([direction, name_lower, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        # Put back the '=' padding we stripped when encoding
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, name_lower, pk = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(f'Invalid cursor {token}')
+
+    if direction not in (NEXT, PREVIOUS) or not isinstance(name_lower, str) or not isinstance(pk, int):
+        raise InvalidCursor(f'Invalid cursor {token}')
+
+    return direction, name_lower, pk
+
+
+# Read the page size from the users' request, falling back to the default when missing or not a number
+def clean_page_size(value):
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+    # Keep it between 1 and the max page size
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+class Page:
+    def __init__(self, items, next_cursor, previous_cursor, page_size):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.page_size = page_size
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+# Order any Video queryset by the pagination key, (lower(name), id). The id breaks ties between
+# names that are the same ignoring case, which makes the order (and the cursors) stable
+def order_for_keyset(queryset):
+    return queryset.annotate(name_lower=Lower('name')).order_by('name_lower', 'id')
+
+
+# The query for one page, with one extra row to know if there is another page without a COUNT query
+def keyset_query(queryset, cursor, page_size):
+    queryset = order_for_keyset(queryset)
+
+    direction = NEXT
+    if cursor:
+        direction, name_lower, pk = decode_cursor(cursor)
+
+        # The first condition on its own (name_lower >= cursor) is a range the (lower(name), id) index can jump to,
+        # the second one drops the rows with the same name up to and including the cursor row
+        if direction == NEXT:
+            # Rows that come strictly after the last row of the previous page
+            queryset = queryset.filter(
+                Q(name_lower__gte=name_lower), Q(name_lower__gt=name_lower) | Q(id__gt=pk))
+        else:
+            # Rows strictly before the first row of the next page, walked backwards so LIMIT takes the closest ones
+            queryset = queryset.filter(
+                Q(name_lower__lte=name_lower), Q(name_lower__lt=name_lower) | Q(id__lt=pk)
+            ).order_by('-name_lower', '-id')
+
+    return queryset[:page_size + 1], direction
+
+
+# Turn the rows from keyset_query() into a Page with its next and previous cursors
+def build_page(rows, direction, cursor, page_size):
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if direction == PREVIOUS:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+
+    if rows:
+        first, last = rows[0], rows[-1]
+
+        # Going forward: there is a next page if we got the extra row, and a previous page if we started from a cursor
+        # Going backwards it's the other way around
+        if (direction == NEXT and has_more) or (direction == PREVIOUS and cursor):
+            next_cursor = encode_cursor(NEXT, last.name_lower, last.pk)
+        if (direction == NEXT and cursor) or (direction == PREVIOUS and has_more):
+            previous_cursor = encode_cursor(PREVIOUS, first.name_lower, first.pk)
+
+    return Page(rows, next_cursor, previous_cursor, page_size)
+
+
+def paginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    query, direction = keyset_query(queryset, cursor, page_size)
+    return build_page(list(query), direction, cursor, page_size)
+
+
+# Same as paginate(), with the async ORM
+async def apaginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    query, direction = keyset_query(queryset, cursor, page_size)
+    return build_page([video async for video in query], direction, cursor, page_size)
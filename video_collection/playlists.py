@@ -0,0 +1,65 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils.text import slugify
+
+from .models import Playlist, PlaylistEntry, Video
+from .pagination import DEFAULT_PAGE_SIZE
+from . import listing
+
+# Playlists: videos in the order they were added. A playlist page is read from the (playlist, position) index
+# after the last position of the page before, the same way the video list pages work, so every page costs the same.
+
+
+class PlaylistPage:
+    def __init__(self, videos, next_after, page_size):
+        self.videos = videos
+        self.next_after = next_after
+        self.page_size = page_size
+
+
+def create(name):
+    return Playlist.objects.create(name=name, slug=slugify(name))
+
+
+# Add the video at the end of the playlist, returns the entry (the one already there if the video is in it)
+def add_video(playlist, video):
+    entry = PlaylistEntry.objects.filter(playlist=playlist, video=video).first()
+    if entry is not None:
+        return entry
+
+    with transaction.atomic():
+        # Max() reads the last entry of the (playlist, position) index
+        last = PlaylistEntry.objects.filter(playlist=playlist).aggregate(last=Max('position'))['last']
+        try:
+            with transaction.atomic():
+                entry = PlaylistEntry.objects.create(playlist=playlist, video=video, position=(last or 0) + 1)
+        except IntegrityError:
+            # Someone else added a video (or this one) at the same time, try again after theirs
+            return add_video(playlist, video)
+
+        playlist.save(update_fields=['updated_at'])
+
+    return entry
+
+
+def remove_video(playlist, video):
+    with transaction.atomic():
+        removed, _ = PlaylistEntry.objects.filter(playlist=playlist, video=video).delete()
+        if removed:
+            playlist.save(update_fields=['updated_at'])
+
+    return bool(removed)
+
+
+# One page of the playlist's videos after position after, with the same columns, thumbnails and tags
+# as the video list. Two queries for any page size: the videos (with their thumbnails), and their tags
+def load_page(playlist, after=0, page_size=DEFAULT_PAGE_SIZE):
+    videos = listing.with_tags(listing.preview_columns(Video.objects.all())).filter(
+        playlist_entries__playlist=playlist, playlist_entries__position__gt=after
+    ).annotate(position=F('playlist_entries__position')).order_by('position')
+
+    # One extra row to know if there is a next page
+    videos = list(videos[:page_size + 1])
+    next_after = videos[page_size - 1].position if len(videos) > page_size else None
+
+    return PlaylistPage(videos[:page_size], next_after, page_size)
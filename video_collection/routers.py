@@ -0,0 +1,90 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+# Read replicas for the video pages. With replicas set up (settings.VIDEO_DB_REPLICAS, from the
+# VIDEO_DB_REPLICA_PATHS or VIDEO_DB_REPLICA_HOSTS environment variables) reads of the app's tables go to a
+# random replica, and every write goes to the primary ('default').
+#
+# Each request reads from one replica, picked at random when it starts (use_replica()).
+#
+# Reads stay on the primary:
+#   - inside a transaction on the primary (a save and its signal receivers read what they just wrote)
+#   - while pinned with use_primary(). The ReplicaPinningMiddleware pins requests that write (POST...), and the
+#     browser's next requests for VIDEO_REPLICA_PIN_SECONDS after that, so users see their own new video straight
+#     away even when the replicas are behind. Background jobs are pinned too (jobs.run())
+#   - for jobs, which are read back right after they're claimed, and for other apps' tables
+#     (sessions, users, admin log), which are read right after they're written
+#
+# Without replicas everything goes to the primary, same as without the router.
+
+PRIMARY = 'default'
+REPLICA_APP = 'video_collection'
+PRIMARY_ONLY_MODELS = {'job'}
+
+_pinned = ContextVar('video_collection_pinned_to_primary', default=False)
+# The replica this request reads from. Every read in a request goes to the same one, so its page, count, tags and
+# ETag agree with each other even when the replicas are behind by different amounts
+_replica = ContextVar('video_collection_replica', default=None)
+
+
+def replicas():
+    return getattr(settings, 'VIDEO_DB_REPLICAS', [])
+
+
+# Reads in the block go to the primary. A context variable, so it's per thread and per async task
+@contextmanager
+def use_primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+# Reads in the block go to one replica, a random one unless alias is given. Set for each request by the
+# ReplicaPinningMiddleware
+@contextmanager
+def use_replica(alias=None):
+    token = _replica.set(alias or random.choice(replicas()))
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+
+        if (not aliases or _pinned.get() or model._meta.app_label != REPLICA_APP
+                or model._meta.model_name in PRIMARY_ONLY_MODELS or connections[PRIMARY].in_atomic_block):
+            return PRIMARY
+
+        replica = _replica.get()
+        if replica not in aliases:
+            # Outside a request e.g( a management command ), the first read picks the replica for the ones after it
+            replica = random.choice(aliases)
+            _replica.set(replica)
+
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    # Replicas have the same rows as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # Replicas get their tables from the primary (replication, or sync_sqlite_replicas locally), never from migrate
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,166 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Full text search for videos, over the name and the notes.
+# On SQLite we keep an FTS5 virtual table next to the video table. Triggers keep it in sync on every
+# insert, update and delete (bulk_create and queryset.update() too, because it's done by the db, not django).
+# Lookups go through the FTS index instead of a LIKE '%term%' scan of every row.
+# Any other database, or SQLite built without FTS5, falls back to icontains on name and notes.
+
+VIDEO_TABLE = 'video_collection_video'
+FTS_TABLE = 'video_collection_video_fts'
+
+# Name matches count 10x more than notes matches when ranking with bm25
+NAME_WEIGHT = 10.0
+NOTES_WEIGHT = 1.0
+
+# External content table: the FTS table only stores the index, the text itself stays in the video table
+CREATE_FTS_TABLE = f'''
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    name, notes, content='{VIDEO_TABLE}', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+)
+'''
+
+CREATE_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {VIDEO_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, notes) VALUES (new.id, new.name, new.notes);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {VIDEO_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, notes) VALUES ('delete', old.id, old.name, old.notes);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, notes ON {VIDEO_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, notes) VALUES ('delete', old.id, old.name, old.notes);
+        INSERT INTO {FTS_TABLE}(rowid, name, notes) VALUES (new.id, new.name, new.notes);
+    END
+    ''',
+]
+
+# Remember per database if the FTS table is there, so we don't ask sqlite_master on every search
+_fts_available = {}
+
+
+def _cache_key(connection):
+    return (connection.alias, str(connection.settings_dict['NAME']))
+
+
+def fts_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        options = [row[0] for row in cursor.fetchall()]
+
+    return 'ENABLE_FTS5' in options
+
+
+def fts_available(using='default'):
+    connection = connections[using]
+    key = _cache_key(connection)
+
+    if key not in _fts_available:
+        if connection.vendor != 'sqlite':
+            _fts_available[key] = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                _fts_available[key] = cursor.fetchone() is not None
+
+    return _fts_available[key]
+
+
+# Create the FTS table and triggers if they are missing. Safe to run again and again, it is called after every migrate
+# because SQLite migrations that rebuild the video table drop its triggers
+def install(using='default'):
+    connection = connections[using]
+
+    if not fts_supported(connection):
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        existed = cursor.fetchone() is not None
+
+        cursor.execute(CREATE_FTS_TABLE)
+        for trigger in CREATE_TRIGGERS:
+            cursor.execute(trigger)
+
+    _fts_available[_cache_key(connection)] = True
+
+    # A brand new index on a table that already has videos needs to be filled in
+    if not existed:
+        rebuild(using)
+
+    return True
+
+
+# Throw away the FTS index and rebuild it from the video table
+def rebuild(using='default'):
+    if not fts_available(using):
+        return False
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    return True
+
+
+# Turn what users typed into an FTS5 query. Every word is quoted (so users can't write FTS syntax by accident)
+# and gets a * so it matches as a prefix e.g( 'Blinding lig' -> "blinding"* "lig"* )
+def build_match_query(term):
+    words = re.findall(r'\w+', term.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# Filter a Video queryset down to the videos matching the search term, keeping the queryset's own ordering
+def search(queryset, term):
+    using = queryset.db
+
+    if not fts_available(using):
+        return queryset.filter(Q(name__icontains=term) | Q(notes__icontains=term))
+
+    match_query = build_match_query(term)
+    if not match_query:
+        return queryset.none()
+
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match_query]))
+
+
+# Best matches first (bm25), for when users want relevance instead of name order. Returns the videos in rank order.
+# filtered=True when the queryset has filters of its own e.g( a tag ), so only the matches in it are ranked
+def ranked_search(queryset, term, limit, filtered=False):
+    using = queryset.db
+
+    if not fts_available(using):
+        return list(search(queryset, term).order_by('name', 'id')[:limit])
+
+    match_query = build_match_query(term)
+    if not match_query:
+        return []
+
+    within_sql, within_params = '', []
+    if filtered:
+        within_sql, within_params = queryset.order_by().values('pk').query.sql_with_params()
+        within_sql = f'AND rowid IN ({within_sql}) '
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s {within_sql}'
+            f'ORDER BY bm25({FTS_TABLE}, %s, %s), rowid LIMIT %s',
+            [match_query, *within_params, NAME_WEIGHT, NOTES_WEIGHT, limit])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    videos = queryset.in_bulk(ids)
+
+    return [videos[pk] for pk in ids if pk in videos]
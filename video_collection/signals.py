@@ -0,0 +1,144 @@
+from collections import Counter
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.db import transaction
+from django.dispatch import Signal, receiver
+
+from .models import Video, VideoTag
+from . import autocomplete, caching, counters, duplicates, metadata, tagging, thumbnails
+
+# bulk_create() doesn't send post_save, so the importer sends this after every saved batch instead,
+# with videos=the list of new Video objects, using=the database alias, and synthetic=True for made up videos
+videos_bulk_created = Signal()
+
+
+# Any change to the videos makes the cached video list pages out of date, once it's committed. Bumped before the
+# commit, a request in between would read the old rows and cache them under the new generation
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+@receiver(videos_bulk_created)
+def invalidate_video_list_cache(sender, using='default', **kwargs):
+    transaction.on_commit(caching.bump_generation, using=using)
+
+
+@receiver(post_delete, sender=Video)
+def record_video_delete(sender, using='default', **kwargs):
+    transaction.on_commit(caching.record_delete, using=using)
+
+
+# Fetch YouTube metadata and the thumbnail for new videos (and changed urls) in the background.
+# Name and notes edits don't need them, the video id before the save is looked up by remember_saved_fields()
+@receiver(post_save, sender=Video)
+def queue_background_fetches(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_saved_video_id', None) != instance.video_id:
+        metadata.schedule_refresh(instance.pk)
+        thumbnails.schedule(instance.pk)
+
+
+@receiver(videos_bulk_created)
+def queue_bulk_background_fetches(sender, videos, using='default', synthetic=False, **kwargs):
+    # Made up videos from generate_videos aren't on YouTube
+    if synthetic:
+        return
+
+    pks = [video.pk for video in videos if video.pk is not None]
+    metadata.schedule_refresh_many(pks, using)
+    thumbnails.schedule_many(pks, using)
+
+
+# Keep this process' duplicate check filter up to date
+@receiver(post_save, sender=Video)
+def add_known_video_id(sender, instance, **kwargs):
+    duplicates.known_ids.add([instance.video_id])
+
+
+@receiver(videos_bulk_created)
+def add_known_video_ids(sender, videos, **kwargs):
+    duplicates.known_ids.add(video.video_id for video in videos)
+
+
+# Keep this process' autocomplete index up to date, once the change is committed.
+# A renamed video's old name is looked up before the save (remember_saved_fields() below)
+@receiver(post_save, sender=Video)
+def index_saved_video_name(sender, instance, created, using='default', **kwargs):
+    saved_name = getattr(instance, '_saved_name', None)
+
+    if created:
+        transaction.on_commit(lambda: autocomplete.name_index.change(added=[instance.name]), using=using)
+    elif saved_name is not None and saved_name != instance.name:
+        name = instance.name
+        transaction.on_commit(lambda: autocomplete.name_index.change(added=[name], removed=[saved_name]), using=using)
+
+
+@receiver(post_delete, sender=Video)
+def unindex_deleted_video_name(sender, instance, using='default', **kwargs):
+    transaction.on_commit(lambda: autocomplete.name_index.change(removed=[instance.name]), using=using)
+
+
+@receiver(videos_bulk_created)
+def index_bulk_created_video_names(sender, videos, using='default', **kwargs):
+    names = [video.name for video in videos]
+    transaction.on_commit(lambda: autocomplete.name_index.change(added=names), using=using)
+
+
+# Video counters (counters.py). Video.save() and deletes run these in the same transaction as the change.
+# A renamed video can move to another first letter, so the name before the save is looked up first
+# (with the video id, for queue_background_fetches(), in the same query)
+@receiver(pre_save, sender=Video)
+def remember_saved_fields(sender, instance, raw=False, using='default', **kwargs):
+    if instance.pk is not None and not raw:
+        saved = Video.objects.using(using).filter(pk=instance.pk).values_list('name', 'video_id').first()
+        instance._saved_name, instance._saved_video_id = saved or (None, None)
+
+
+@receiver(post_save, sender=Video)
+def count_saved_video(sender, instance, created, using='default', **kwargs):
+    saved_name = getattr(instance, '_saved_name', None)
+
+    if created:
+        counters.apply(counters.video_changes(instance.name, 1), using)
+    elif saved_name is not None and counters.letter_key(saved_name) != counters.letter_key(instance.name):
+        counters.apply({counters.letter_key(saved_name): -1, counters.letter_key(instance.name): 1}, using)
+
+
+@receiver(post_delete, sender=Video)
+def count_deleted_video(sender, instance, using='default', **kwargs):
+    counters.apply(counters.video_changes(instance.name, -1), using)
+
+
+@receiver(videos_bulk_created)
+def count_bulk_created_videos(sender, videos, using='default', **kwargs):
+    changes = Counter()
+    for video in videos:
+        changes.update(counters.video_changes(video.name, 1))
+
+    counters.apply(changes, using)
+
+
+# Per tag video counts (tagging.py). The related managers send these inside their own transaction.
+# instance is the video, or the tag when tags are changed from the tag's side (reverse), and pk_set the other side's pks
+@receiver(m2m_changed, sender=VideoTag)
+def count_tagged_videos(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action == 'post_add':
+        # add() only sends the pks that weren't linked already
+        change, pks = 1, pk_set
+    elif action in ('pre_remove', 'pre_clear'):
+        # remove() sends every pk it was given, only the ones that are linked now are removed
+        links = VideoTag.objects.using(using).filter(**{'tag' if reverse else 'video': instance})
+        if pk_set is not None:
+            links = links.filter(**{'video__in' if reverse else 'tag__in': pk_set})
+        change, pks = -1, set(links.values_list('video_id' if reverse else 'tag_id', flat=True))
+    else:
+        return
+
+    if reverse:
+        tagging.record_change([instance.pk], pks, change * len(pks), using)
+    else:
+        tagging.record_change(pks, [instance.pk], change, using)
+
+
+# Deleting a video deletes its links without m2m_changed, so its tags are counted down first
+@receiver(pre_delete, sender=Video)
+def count_deleted_video_tags(sender, instance, using='default', **kwargs):
+    tag_pks = list(VideoTag.objects.using(using).filter(video=instance).values_list('tag_id', flat=True))
+    tagging.record_change(tag_pks, [instance.pk], -1, using)
@@ -0,0 +1,60 @@
+// Suggestions for the video search box as users type, from the autocomplete API (api/videos/autocomplete).
+// The names go in the input's <datalist>, so the browser shows them as a dropdown.
+// Requests wait until typing pauses, and a newer request cancels the one still on its way.
+(function () {
+  var input = document.querySelector('input[data-autocomplete-url]');
+  if (!input) {
+    return;
+  }
+
+  var list = document.getElementById(input.getAttribute('list'));
+  var url = input.getAttribute('data-autocomplete-url');
+  var timer = null;
+  var lastQuery = null;
+  var controller = null;
+
+  function showSuggestions(suggestions) {
+    list.replaceChildren.apply(
+      list,
+      suggestions.map(function (name) {
+        var option = document.createElement('option');
+        option.value = name;
+        return option;
+      })
+    );
+  }
+
+  function update() {
+    var query = input.value;
+    if (query === lastQuery) {
+      return;
+    }
+    lastQuery = query;
+
+    if (controller) {
+      controller.abort();
+    }
+
+    if (!query.trim()) {
+      showSuggestions([]);
+      return;
+    }
+
+    controller = new AbortController();
+    fetch(url + '?q=' + encodeURIComponent(query), { signal: controller.signal })
+      .then(function (response) {
+        return response.json();
+      })
+      .then(function (data) {
+        showSuggestions(data.suggestions);
+      })
+      .catch(function () {
+        // Cancelled, or the API is down, the search box still works without suggestions
+      });
+  }
+
+  input.addEventListener('input', function () {
+    clearTimeout(timer);
+    timer = setTimeout(update, 150);
+  });
+})();
@@ -0,0 +1,61 @@
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+# Static files storage for production (settings.STORAGES picks it when DEBUG is off).
+# collectstatic copies every file under a name with a hash of its content e.g( css/style.css -> css/style.3c1a8e.css ),
+# rewrites the url()s in CSS to the hashed names, and writes staticfiles.json, which {% static %} reads the names from.
+# A hashed name never gets other content, so the files are served with a one year immutable cache header
+# (see the static_file view) and browsers don't ask for them again until a deploy changes them.
+#
+# Text files also get precompressed copies next to them, name.gz and (with the brotli package installed,
+# pip install brotli) name.br, so nothing is compressed while serving.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files worth compressing, images and fonts are compressed already
+COMPRESS_EXTENSIONS = getattr(settings, 'VIDEO_STATIC_COMPRESS_EXTENSIONS',
+                              ('.css', '.js', '.svg', '.txt', '.json', '.map', '.html', '.xml', '.ico'))
+# Smaller files aren't worth a second request path
+COMPRESS_MIN_SIZE = 256
+
+
+def compressed_variants(content):
+    variants = {'gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content, quality=11)
+
+    # Only the ones that are actually smaller
+    return {extension: data for extension, data in variants.items() if len(data) < len(content)}
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+
+        if dry_run:
+            return
+
+        # After the last pass the CSS has its final url()s, so the hashed files are compressed only now
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            if hashed_name.endswith(COMPRESS_EXTENSIONS):
+                yield from self._compress(hashed_name)
+
+    def _compress(self, name):
+        with self.open(name) as f:
+            content = f.read()
+
+        if len(content) < COMPRESS_MIN_SIZE:
+            return
+
+        for extension, data in compressed_variants(content).items():
+            compressed_name = f'{name}.{extension}'
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self._save(compressed_name, ContentFile(data))
+            yield compressed_name, compressed_name, True
@@ -0,0 +1,53 @@
+import base64
+import random
+
+from django.db import transaction
+
+from .models import Video
+from .signals import videos_bulk_created
+
+# Made up videos for benchmarks and load tests
+
+WORDS = ['blinding', 'lights', 'starboy', 'after', 'hours', 'save', 'your', 'tears', 'die', 'for', 'you', 'heartless',
+         'call', 'out', 'my', 'name', 'often', 'earned', 'it', 'hills', 'wicked', 'games', 'slowed', 'reverb', 'live',
+         'acoustic', 'remix', 'official', 'video', 'lyrics', 'night', 'drive', 'loft', 'never', 'there', 'moth']
+
+
+# An 11 character video id for every number, the 8 bytes of the number in url-safe base64 e.g( 1 -> AAAAAAAAAAE )
+def video_id_for(number):
+    return base64.urlsafe_b64encode(number.to_bytes(8, 'big')).decode('ascii').rstrip('=')
+
+
+def synthetic_video(number, rng):
+    video_id = video_id_for(number)
+    name = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))).title()
+    notes = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 40))) or None
+
+    return Video(name=f'{name} {number}', url=f'https://www.youtube.com/watch?v={video_id}', notes=notes,
+                 video_id=video_id)
+
+
+# Adds count videos numbered from start up, in batches, and tells the rest of the app about them.
+# The same numbers always give the same videos. Numbers whose video is already saved are skipped e.g( after a video
+# is deleted the table's count is lower than the highest number used, so start=count reaches saved ones )
+def generate_videos(count, start=0, batch_size=5000, seed=0, using='default'):
+    number = start
+    added = 0
+
+    while added < count:
+        batch_numbers = range(number, number + min(batch_size, count - added))
+        number = batch_numbers.stop
+        rng = random.Random(f'{seed}-{batch_numbers.start}')
+
+        videos = [synthetic_video(video_number, rng) for video_number in batch_numbers]
+        # The signal's receivers (counters...) are saved in the same transaction as the batch
+        with transaction.atomic(using=using):
+            saved = set(Video.objects.using(using).filter(
+                video_id__in=[video.video_id for video in videos]).values_list('video_id', flat=True))
+            videos = [video for video in videos if video.video_id not in saved]
+
+            if videos:
+                Video.objects.using(using).bulk_create(videos, batch_size=1000)
+                videos_bulk_created.send(sender=Video, videos=videos, using=using, synthetic=True)
+
+        added += len(videos)
@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Tag, Video, VideoTag
+from . import caching
+
+# Tags on videos, and the number of videos per tag (Tag.video_count).
+# Counts are changed by the m2m_changed and pre_delete receivers in signals.py, in the same transaction as the
+# link rows are added or removed, so the tag list and the tag filtered video list read a column instead of counting.
+# Every way of changing tags goes through them: video.tags.add/remove/set/clear, tag.videos..., and deleting a video.
+# Deleting or adding VideoTag rows directly doesn't, `python manage.py reconcile_counters` counts them again.
+
+MAX_TAG_LENGTH = Tag._meta.get_field('name').max_length
+
+
+class InvalidTag(ValueError):
+    pass
+
+
+# Tag names from what users typed, comma separated. Names with the same slug are one tag, the first spelling is kept
+# e.g( 'Pop, 80s,pop , ' -> ['Pop', '80s'] )
+def parse_tag_names(text):
+    names = {}
+
+    for name in (text or '').split(','):
+        name = ' '.join(name.split())
+        if not name:
+            continue
+
+        slug = slugify(name)
+        if not slug or len(name) > MAX_TAG_LENGTH:
+            raise InvalidTag(name)
+
+        names.setdefault(slug, name)
+
+    return list(names.values())
+
+
+# Tag rows for the names, the missing ones are added. Three queries however many names there are
+def get_or_create_tags(names, using='default'):
+    slugs = {slugify(name): name for name in names}
+    tags = Tag.objects.using(using)
+
+    missing = slugs.keys() - set(tags.filter(slug__in=slugs).values_list('slug', flat=True))
+    if missing:
+        # ignore_conflicts: another request can add the same tag at the same time
+        tags.bulk_create([Tag(name=slugs[slug], slug=slug) for slug in missing], ignore_conflicts=True)
+
+    return list(tags.filter(slug__in=slugs).order_by('name'))
+
+
+# Replace the video's tags with these names
+def set_tags(video, names, using='default'):
+    with transaction.atomic(using=using):
+        video.tags.set(get_or_create_tags(names, using))
+
+
+# Change the video count of the tags by change each, and mark the videos as changed.
+# The tagged videos' cards and the video list pages show their tags, a new updated_at gives the cards
+# new cache keys and the list a new ETag, and the list cache is invalidated
+def record_change(tag_pks, video_pks, change, using='default'):
+    if not tag_pks or not video_pks:
+        return
+
+    Tag.objects.using(using).filter(pk__in=tag_pks).update(video_count=F('video_count') + change)
+    Video.objects.using(using).filter(pk__in=video_pks).update(updated_at=timezone.now())
+    # The m2m signals come inside the related manager's transaction, see invalidate_video_list_cache()
+    transaction.on_commit(caching.bump_generation, using=using)
+
+
+# Video count of the tag with this slug, None if there's no such tag
+def tag_count(slug, using='default'):
+    return Tag.objects.using(using).filter(slug=slug).values_list('video_count', flat=True).first()
+
+
+async def atag_count(slug, using='default'):
+    return await Tag.objects.using(using).filter(slug=slug).values_list('video_count', flat=True).afirst()
+
+
+# Set every tag's video count from the link table, the slow way. Returns the counts that were wrong
+# as slug -> (was, now)
+def reconcile(using='default'):
+    with transaction.atomic(using=using):
+        correct = dict(VideoTag.objects.using(using).values_list('tag__slug').annotate(count=Count('id')))
+        tags = Tag.objects.using(using).select_for_update()
+
+        wrong = {slug: (count, correct.get(slug, 0))
+                 for slug, count in tags.values_list('slug', 'video_count') if count != correct.get(slug, 0)}
+
+        for slug, (_, count) in wrong.items():
+            tags.filter(slug=slug).update(video_count=count)
+
+    return wrong
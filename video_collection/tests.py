@@ -1,9 +1,50 @@
-from django.db import IntegrityError
+import csv
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipIf
+
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.test import (AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase as DjangoTestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 # Database
-from .models import Video
+from .forms import videoForm
+from .models import (NOTES_MAX_LENGTH, NOTES_PREVIEW_LENGTH, CatalogueCounter, Job, Tag, Thumbnail, Video,
+                     VideoMetadata)
+from . import (async_views, autocomplete, caching, counters, db, duplicates, exporters, importers, jobs, listing,
+               metadata, metrics, middleware, pagination, playlists, routers, search, synthetic, tagging, thumbnails, views,
+               youtube)
+from .signals import videos_bulk_created
+
+
+# Cached video list pages would outlive the test data that is rolled back after every test,
+# so each test starts with an empty cache.
+# Read replicas are turned off (when set up with VIDEO_DB_REPLICA_PATHS), they are mirrors of the test database
+# but can't see the test's own transaction
+@override_settings(VIDEO_DB_REPLICAS=[])
+class TestCase(DjangoTestCase):
+    def setUp(self):
+        cache.clear()
+        caching.stats.reset()
+        duplicates.known_ids.reset()
+        autocomplete.name_index.reset()
 
 
 class TestHomePageMessage(TestCase):
@@ -115,13 +156,13 @@ class TestVideoList(TestCase):
     def test_all_videos_displayed_in_correct_order(self):
         # these 4 dummy videos will be created and save to the db
         v1 = Video.objects.create(
-            name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
         v2 = Video.objects.create(
-            name='AAA', notes='example', url='https://www.youtube.com/watch?v=124')
+            name='AAA', notes='example', url='https://www.youtube.com/watch?v=124abcdefgh')
         v3 = Video.objects.create(
-            name='xcc', notes='example', url='https://www.youtube.com/watch?v=125')
+            name='xcc', notes='example', url='https://www.youtube.com/watch?v=125abcdefgh')
         v4 = Video.objects.create(
-            name='lmn', notes='example', url='https://www.youtube.com/watch?v=126')
+            name='lmn', notes='example', url='https://www.youtube.com/watch?v=126abcdefgh')
 
         expected_list_order = [v2, v1, v4, v3]
 
@@ -151,7 +192,7 @@ class TestVideoList(TestCase):
 
     def test_video_number_message_one_video(self):
         v1 = Video.objects.create(
-            name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
 
         # Req to the video_list html
         # Make a get req
@@ -167,9 +208,9 @@ class TestVideoList(TestCase):
     # Checking if '2 Videos' message is displayed
     def test_video_number_message_two_videos(self):
         v1 = Video.objects.create(
-            name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
         v2 = Video.objects.create(
-            name='AAA', notes='example', url='https://www.youtube.com/watch?v=124')
+            name='AAA', notes='example', url='https://www.youtube.com/watch?v=124abcdefgh')
 
         url = reverse('video_list')
         response = self.client.get(url)
@@ -178,19 +219,44 @@ class TestVideoList(TestCase):
         self.assertContains(response, '2 Videos')
 
 
+    def test_list_only_loads_a_preview_of_the_notes(self):
+        long_notes = 'word ' * 100
+        video = Video.objects.create(name='abc', notes=long_notes, url='https://www.youtube.com/watch?v=123abcdefgh')
+        Video.objects.create(name='def', url='https://www.youtube.com/watch?v=124abcdefgh')
+
+        response = self.client.get(reverse('video_list'))
+        first, second = response.context['videos']
+
+        self.assertEqual(long_notes[:NOTES_PREVIEW_LENGTH], first.notes_preview)
+        self.assertTrue(first.notes_truncated)
+        self.assertEqual({'notes'}, first.get_deferred_fields())
+        self.assertIsNone(second.notes_preview)
+        self.assertNotContains(response, long_notes)
+        self.assertContains(response, reverse('video_detail', args=[video.video_id]))
+
+    def test_video_detail_shows_full_notes(self):
+        long_notes = 'word ' * 100
+        Video.objects.create(name='abc', notes=long_notes, url='https://www.youtube.com/watch?v=123abcdefgh')
+
+        response = self.client.get(reverse('video_detail', args=['123abcdefgh']))
+
+        self.assertContains(response, long_notes)
+        self.assertEqual(404, self.client.get(reverse('video_detail', args=['nothinghere'])).status_code)
+
+
 class TestVideoSearch(TestCase):
     # Similar to your GH repo tests
 
     def test_video_search_matches(self):
         # these 4 dummy videos will be created and save to the db
         v1 = Video.objects.create(
-            name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
         v2 = Video.objects.create(
-            name='ABC', notes='example', url='https://www.youtube.com/watch?v=124')
+            name='ABC', notes='example', url='https://www.youtube.com/watch?v=124abcdefgh')
         v3 = Video.objects.create(
-            name='xcc', notes='example', url='https://www.youtube.com/watch?v=125')
+            name='xcc', notes='example', url='https://www.youtube.com/watch?v=125abcdefgh')
         v4 = Video.objects.create(
-            name='lmn', notes='example', url='https://www.youtube.com/watch?v=126')
+            name='lmn', notes='example', url='https://www.youtube.com/watch?v=126abcdefgh')
 
         # v1 will appear first when searched 'ABC'
         expected_list_order = [v1, v2]
@@ -207,13 +273,13 @@ class TestVideoSearch(TestCase):
     def test_video_no_match(self):
         # these 4 dummy videos will be created and save to the db
         v1 = Video.objects.create(
-            name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
         v2 = Video.objects.create(
-            name='ABC', notes='example', url='https://www.youtube.com/watch?v=124')
+            name='ABC', notes='example', url='https://www.youtube.com/watch?v=124abcdefgh')
         v3 = Video.objects.create(
-            name='xcc', notes='example', url='https://www.youtube.com/watch?v=125')
+            name='xcc', notes='example', url='https://www.youtube.com/watch?v=125abcdefgh')
         v4 = Video.objects.create(
-            name='lmn', notes='example', url='https://www.youtube.com/watch?v=126')
+            name='lmn', notes='example', url='https://www.youtube.com/watch?v=126abcdefgh')
 
         # No search order will appear for non existent search word
         expected_list_order = []
@@ -266,9 +332,1590 @@ class TestVideoModel(TestCase):
     # duplicate videos raises integrity error
     def test_duplicate_video_raises_integrity_error(self):
         v1 = Video.objects.create(
-            name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
 
         with self.assertRaises(IntegrityError):
             # Adding duplicate video to raise integrity error
             Video.objects.create(
-                name='abc', notes='example', url='https://www.youtube.com/watch?v=123')
+                name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+
+    def test_str_without_notes(self):
+        video = Video.objects.create(name='abc', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+        self.assertTrue(str(video).endswith('Notes: '))
+
+    def test_notes_longer_than_limit_are_invalid(self):
+        form = videoForm({'name': 'abc', 'url': 'https://www.youtube.com/watch?v=123abcdefgh',
+                          'notes': 'a' * (NOTES_MAX_LENGTH + 1)})
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('notes', form.errors)
+
+
+class TestVideoListPagination(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        # 5 dummy videos, the names are out of order and two are the same ignoring case
+        self.v1 = Video.objects.create(
+            name='ccc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+        self.v2 = Video.objects.create(
+            name='aaa', notes='example', url='https://www.youtube.com/watch?v=124abcdefgh')
+        self.v3 = Video.objects.create(
+            name='AAA', notes='example', url='https://www.youtube.com/watch?v=125abcdefgh')
+        self.v4 = Video.objects.create(
+            name='eee', notes='example', url='https://www.youtube.com/watch?v=126abcdefgh')
+        self.v5 = Video.objects.create(
+            name='bbb', notes='example', url='https://www.youtube.com/watch?v=127abcdefgh')
+
+    # Walk forward through every page 2 videos at a time, then back again with the previous links
+    def test_next_and_previous_pages(self):
+        url = reverse('video_list')
+
+        page_one = self.client.get(url + '?page_size=2')
+        self.assertEqual([self.v2, self.v3], list(page_one.context['videos']))
+        self.assertIsNone(page_one.context['previous_query'])
+
+        # The count in the header is still the count of all the videos, not just this page
+        self.assertContains(page_one, '5 Videos')
+
+        page_two = self.client.get(url + '?' + page_one.context['next_query'])
+        self.assertEqual([self.v5, self.v1], list(page_two.context['videos']))
+
+        page_three = self.client.get(url + '?' + page_two.context['next_query'])
+        self.assertEqual([self.v4], list(page_three.context['videos']))
+        self.assertIsNone(page_three.context['next_query'])
+
+        back_to_two = self.client.get(url + '?' + page_three.context['previous_query'])
+        self.assertEqual([self.v5, self.v1], list(back_to_two.context['videos']))
+
+        back_to_one = self.client.get(url + '?' + back_to_two.context['previous_query'])
+        self.assertEqual([self.v2, self.v3], list(back_to_one.context['videos']))
+        self.assertIsNone(back_to_one.context['previous_query'])
+
+    # Search term and page size are kept in the next page link
+    def test_next_page_keeps_search_term(self):
+        response = self.client.get(reverse('video_list') + '?search_term=aaa&page_size=1')
+
+        self.assertEqual([self.v2], list(response.context['videos']))
+        self.assertIn('search_term=aaa', response.context['next_query'])
+
+        response = self.client.get(reverse('video_list') + '?' + response.context['next_query'])
+        self.assertEqual([self.v3], list(response.context['videos']))
+        self.assertIsNone(response.context['next_query'])
+
+    # A made up cursor just shows the first page
+    def test_invalid_cursor_shows_first_page(self):
+        response = self.client.get(reverse('video_list') + '?page_size=2&cursor=not-a-cursor')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([self.v2, self.v3], list(response.context['videos']))
+
+
+class TestVideoFullTextSearch(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.v1 = Video.objects.create(
+            name='Blinding Lights', notes='synthwave', url='https://www.youtube.com/watch?v=123abcdefgh')
+        self.v2 = Video.objects.create(
+            name='Save Your Tears', notes='sounds like blinding lights', url='https://www.youtube.com/watch?v=124abcdefgh')
+        self.v3 = Video.objects.create(
+            name='Starboy', notes=None, url='https://www.youtube.com/watch?v=125abcdefgh')
+
+    # Search looks in the notes too, not only the name
+    def test_search_matches_notes(self):
+        response = self.client.get(reverse('video_list') + '?search_term=synthwave')
+
+        self.assertEqual([self.v1], list(response.context['videos']))
+
+    # Words match as prefixes, in any order
+    def test_search_prefix_match(self):
+        response = self.client.get(reverse('video_list') + '?search_term=ligh blind')
+
+        self.assertEqual([self.v1, self.v2], list(response.context['videos']))
+        self.assertContains(response, '2 Videos')
+
+    # Name matches rank higher than notes matches
+    def test_relevance_order(self):
+        self.v1.name = 'Zzz Blinding Lights'
+        self.v1.save()
+
+        response = self.client.get(reverse('video_list') + '?search_term=blinding&order=relevance')
+
+        self.assertEqual([self.v1, self.v2], list(response.context['videos']))
+
+    # The index follows edits and deletes of the videos
+    def test_index_updated_on_edit_and_delete(self):
+        self.v3.name = 'Die For You'
+        self.v3.save()
+        self.v1.delete()
+
+        self.assertEqual([], list(search.search(Video.objects.all(), 'starboy')))
+        self.assertEqual([self.v3], list(search.search(Video.objects.all(), 'die')))
+        self.assertEqual([self.v2], list(search.search(Video.objects.all(), 'blinding')))
+
+    # FTS query syntax typed by users is treated as plain words
+    def test_search_term_with_fts_syntax(self):
+        response = self.client.get(reverse('video_list') + '?search_term="star* (')
+
+        self.assertEqual([self.v3], list(response.context['videos']))
+
+    def test_rebuild_search_index_command(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        self.assertEqual([self.v3], list(search.search(Video.objects.all(), 'starboy')))
+
+
+class TestImportVideos(TestCase):
+    def write_file(self, name, content):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+
+        path = os.path.join(temp_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_import_csv(self):
+        path = self.write_file('videos.csv', (
+            'name,url,notes\n'
+            'abc,https://www.youtube.com/watch?v=123abcdefgh,example\n'
+            'def,https://www.youtube.com/watch?v=124abcdefgh,\n'
+            'bad,https://github.com,example\n'
+            ',https://www.youtube.com/watch?v=125abcdefgh,no name\n'
+            'dupe,https://www.youtube.com/watch?v=123abcdefgh,example\n'
+        ))
+
+        out, err = StringIO(), StringIO()
+        call_command('import_videos', path, '--batch-size', '2', stdout=out, stderr=err)
+
+        self.assertEqual(['123abcdefgh', '124abcdefgh'], list(Video.objects.order_by('video_id').values_list('video_id', flat=True)))
+        self.assertIsNone(Video.objects.get(video_id='124abcdefgh').notes)
+
+        self.assertIn('Created 2 videos, skipped 1 duplicates, 2 errors', out.getvalue())
+        self.assertIn('Line 4: Invalid YT Video URL', err.getvalue())
+        self.assertIn('Line 5: Missing name', err.getvalue())
+
+    def test_import_jsonl_skips_saved_videos(self):
+        Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+        path = self.write_file('videos.jsonl', (
+            '{"name": "abc", "url": "https://www.youtube.com/watch?v=123abcdefgh"}\n'
+            '{"name": "def", "url": "https://www.youtube.com/watch?v=124abcdefgh", "notes": "example"}\n'
+            'not json\n'
+        ))
+
+        with open(path, encoding='utf-8') as f:
+            report = importers.import_file(f, 'jsonl', batch_size=10)
+
+        self.assertEqual((1, 1, 1), (report.created, report.duplicates, report.error_count))
+        self.assertEqual(3, report.errors[0][0])
+
+        self.assertEqual(2, Video.objects.count())
+
+    def test_import_rejects_notes_over_limit(self):
+        rows = [(2, {'name': 'abc', 'url': 'https://www.youtube.com/watch?v=123abcdefgh',
+                     'notes': 'a' * (NOTES_MAX_LENGTH + 1)})]
+
+        report = importers.import_rows(rows)
+
+        self.assertEqual((0, 1), (report.created, report.error_count))
+        self.assertIn('Notes are longer than', report.errors[0][1])
+
+    def test_failing_receiver_rolls_back_the_batch(self):
+        def fail(**kwargs):
+            raise RuntimeError('Broken')
+
+        # Connected after the app's receivers, so the counters are updated before it fails
+        videos_bulk_created.connect(fail)
+        self.addCleanup(videos_bulk_created.disconnect, fail)
+
+        rows = [(2, {'name': 'abc', 'url': 'https://www.youtube.com/watch?v=123abcdefgh'})]
+        with self.assertRaises(RuntimeError):
+            importers.import_rows(rows)
+
+        self.assertEqual(0, Video.objects.count())
+        self.assertEqual(0, counters.total())
+        self.assertFalse(Job.objects.exists())
+
+    def test_dry_run_saves_nothing(self):
+        path = self.write_file('videos.csv', 'name,url\nabc,https://www.youtube.com/watch?v=123abcdefgh\n')
+
+        out = StringIO()
+        call_command('import_videos', path, '--dry-run', stdout=out)
+
+        self.assertIn('Would create 1 videos', out.getvalue())
+        self.assertEqual(0, Video.objects.count())
+
+    def test_upload_endpoint(self):
+        upload = SimpleUploadedFile('videos.jsonl', (
+            '{"name": "abc", "url": "https://www.youtube.com/watch?v=123abcdefgh"}\n'
+            '{"name": "def", "url": "https://github.com"}\n'
+        ).encode('utf-8'))
+
+        response = self.client.post(reverse('import_videos'), {'file': upload})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.json()['created'])
+        self.assertEqual(1, response.json()['error_count'])
+        self.assertEqual(1, Video.objects.count())
+
+    def test_upload_endpoint_missing_file(self):
+        response = self.client.post(reverse('import_videos'))
+
+        self.assertEqual(400, response.status_code)
+
+    def test_upload_endpoint_reports_non_utf8_file(self):
+        upload = SimpleUploadedFile('videos.csv', (
+            'name,url\n'
+            'abc,https://www.youtube.com/watch?v=123abcdefgh\n'
+            'Beyoncé,https://www.youtube.com/watch?v=124abcdefgh\n'
+        ).encode('latin-1'))
+
+        response = self.client.post(reverse('import_videos'), {'file': upload})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(0, response.json()['created'])
+        self.assertEqual([{'line': 1, 'message': 'File is not UTF-8 text, the rest of it was not imported'}],
+                         response.json()['errors'])
+
+    def test_json_values_that_are_not_text(self):
+        rows = [(1, {'name': 5, 'url': 'https://www.youtube.com/watch?v=123abcdefgh'}),
+                (2, {'name': 'abc', 'url': ['https://www.youtube.com/watch?v=123abcdefgh']})]
+
+        report = importers.import_rows(rows)
+
+        self.assertEqual((0, 2), (report.created, report.error_count))
+
+
+class TestYouTubeURLParser(TestCase):
+    def test_valid_url_shapes(self):
+        valid_video_urls = [
+            'https://www.youtube.com/watch?v=wtlN-eNmjzI',
+            'https://www.youtube.com/watch?v=wtlN-eNmjzI&t=30s&list=PL123',
+            'https://www.youtube.com/watch?feature=share&v=wtlN-eNmjzI',
+            'https://youtube.com/watch?v=wtlN-eNmjzI',
+            'https://m.youtube.com/watch?v=wtlN-eNmjzI',
+            'https://youtu.be/wtlN-eNmjzI',
+            'https://youtu.be/wtlN-eNmjzI?si=abc',
+            'https://www.youtube.com/shorts/wtlN-eNmjzI',
+            'https://www.youtube.com/embed/wtlN-eNmjzI/',
+        ]
+
+        for valid_url in valid_video_urls:
+            self.assertEqual('wtlN-eNmjzI', youtube.parse_video_id(valid_url))
+
+    def test_invalid_video_ids(self):
+        invalid_video_urls = [
+            'https://www.youtube.com/watch?v=wtlN-eNmjz',
+            'https://www.youtube.com/watch?v=wtlN-eNmjzI1',
+            'https://www.youtube.com/watch?v=wtlN-eNm%zI',
+            'https://youtu.be/',
+            'https://youtu.be/wtlN-eNmjzI/extra',
+            'https://www.youtube.com/shorts/',
+            'https://www.youtube.com/channel/wtlN-eNmjzI',
+            'https://www.youtube.com:8080/watch?v=wtlN-eNmjzI',
+            'https://user@www.youtube.com/watch?v=wtlN-eNmjzI',
+        ]
+
+        for invalid_url in invalid_video_urls:
+            with self.assertRaises(youtube.InvalidYouTubeURL):
+                youtube.parse_video_id(invalid_url)
+
+    def test_parse_many(self):
+        urls = ['https://youtu.be/wtlN-eNmjzI', 'https://github.com', None,
+                'https://www.youtube.com/watch?v=123abcdefgh']
+
+        self.assertEqual(['wtlN-eNmjzI', None, None, '123abcdefgh'], youtube.parse_many(urls))
+
+    def test_canonical_url(self):
+        self.assertEqual('https://www.youtube.com/watch?v=wtlN-eNmjzI',
+                         youtube.normalize_url('https://youtu.be/wtlN-eNmjzI?t=1'))
+
+    # Other url shapes work in the add form too
+    def test_add_short_url_video(self):
+        response = self.client.post(reverse('add_video'), data={
+            'name': 'example', 'url': 'https://youtu.be/wtlN-eNmjzI', 'notes': ''})
+
+        self.assertRedirects(response, reverse('video_list'))
+        self.assertEqual('wtlN-eNmjzI', Video.objects.get().video_id)
+
+
+class TestVideoListCache(TestCase):
+    def test_second_request_uses_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+        url = reverse('video_list') + '?search_term=abc'
+
+        self.client.get(url)
+
+        # Same search with different case and spaces is the same cached page.
+        # The only query is the catalogue version for the ETag, no videos are loaded
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('video_list') + '?search_term=  ABC ')
+
+        self.assertContains(response, '1 Video')
+        self.assertEqual({'hits': 1, 'misses': 1, 'invalidations': 1}, caching.stats.as_dict())
+
+    def test_saving_and_deleting_videos_invalidates_cache(self):
+        url = reverse('video_list')
+        self.assertContains(self.client.get(url), '0 Videos')
+
+        # The cached pages are out of date once the change is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+        self.assertContains(self.client.get(url), '1 Video')
+
+        video.name = 'def'
+        with self.captureOnCommitCallbacks(execute=True):
+            video.save()
+        self.assertContains(self.client.get(url), 'def')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            video.delete()
+        self.assertContains(self.client.get(url), '0 Videos')
+
+    def test_cache_is_invalidated_after_the_commit(self):
+        generation = caching.get_generation()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+            # A request now would still read the old rows, so it must not cache them under a new generation
+            self.assertEqual(generation, caching.get_generation())
+
+        self.assertEqual(generation + 1, caching.get_generation())
+
+    def test_bulk_import_invalidates_cache(self):
+        url = reverse('video_list')
+        self.assertContains(self.client.get(url), '0 Videos')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            importers.import_rows([(2, {'name': 'abc', 'url': 'https://www.youtube.com/watch?v=123abcdefgh'})])
+
+        self.assertContains(self.client.get(url), '1 Video')
+
+    def test_video_cards_are_cached_per_video(self):
+        video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+        cache.set(caching.card_key(video), '<div>cached card</div>')
+
+        response = self.client.get(reverse('video_list'))
+
+        self.assertContains(response, 'cached card')
+        self.assertNotContains(response, 'example')
+
+    def test_edited_video_gets_a_new_card(self):
+        video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+        self.client.get(reverse('video_list'))
+        old_key = caching.card_key(video)
+
+        video.notes = 'changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            video.save()
+        response = self.client.get(reverse('video_list'))
+
+        self.assertNotEqual(old_key, caching.card_key(video))
+        self.assertContains(response, 'changed')
+        self.assertIn('changed', cache.get(caching.card_key(video)))
+
+    def test_cards_are_rendered_once(self):
+        videos = [Video.objects.create(name=f'video {number}', notes='', url=f'https://youtu.be/{number}abcdefghij')
+                  for number in range(3)]
+        rendered = []
+
+        def render(video):
+            rendered.append(video)
+            return views.render_video_card(video)
+
+        self.assertEqual(3, len(caching.get_cards(videos, render)))
+        cards = caching.get_cards(videos, render)
+
+        self.assertEqual(videos, rendered)
+        self.assertIn('video 2', cards[2])
+
+    def test_cache_stats_view(self):
+        self.client.get(reverse('video_list'))
+
+        response = self.client.get(reverse('cache_stats'))
+
+        self.assertEqual(1, response.json()['misses'])
+
+
+class TestVideoListConditionalGet(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.video = Video.objects.create(
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+    def test_updated_at_changes_on_save(self):
+        first_updated_at = self.video.updated_at
+
+        self.video.notes = 'changed'
+        self.video.save()
+
+        self.assertGreater(self.video.updated_at, first_updated_at)
+
+    def test_not_modified_with_etag(self):
+        url = reverse('video_list')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        # Only the version query, no videos loaded and no template rendered
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.content)
+
+    def test_etag_changes_when_videos_change(self):
+        url = reverse('video_list')
+        etag = self.client.get(url)['ETag']
+
+        self.video.name = 'def'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.video.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.video.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, '0 Videos')
+
+    # Every search and page has its own ETag
+    def test_etag_depends_on_query_string(self):
+        url = reverse('video_list')
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url + '?search_term=abc', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(200, response.status_code)
+
+    def test_not_modified_with_last_modified(self):
+        url = reverse('video_list')
+        last_modified = self.client.get(url)['Last-Modified']
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(304, response.status_code)
+
+
+class TestVideoAPI(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.v1 = Video.objects.create(
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+        self.v2 = Video.objects.create(
+            name='AAA', notes='example', url='https://www.youtube.com/watch?v=124abcdefgh')
+        self.v3 = Video.objects.create(
+            name='xcc', notes='other', url='https://www.youtube.com/watch?v=125abcdefgh')
+
+    def test_list_pages(self):
+        response = self.client.get(reverse('api_videos') + '?page_size=2')
+        data = response.json()
+
+        self.assertEqual(3, data['count'])
+        self.assertEqual(['124abcdefgh', '123abcdefgh'], [video['video_id'] for video in data['results']])
+        self.assertIsNone(data['previous'])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual(['125abcdefgh'], [video['video_id'] for video in data['results']])
+        self.assertIsNone(data['next'])
+
+    def test_list_search(self):
+        data = self.client.get(reverse('api_videos') + '?search_term=other').json()
+
+        self.assertEqual(1, data['count'])
+        self.assertEqual('xcc', data['results'][0]['name'])
+
+    def test_detail(self):
+        response = self.client.get(reverse('api_video_detail', args=['123abcdefgh']))
+        self.assertEqual('abc', response.json()['name'])
+
+        response = self.client.get(reverse('api_video_detail', args=['missing1234']))
+        self.assertEqual(404, response.status_code)
+
+    def test_create(self):
+        response = self.client.post(reverse('api_videos'), content_type='application/json', data={
+            'name': 'new', 'url': 'https://youtu.be/wtlN-eNmjzI', 'notes': 'example'})
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual('wtlN-eNmjzI', response.json()['video_id'])
+        self.assertEqual(4, Video.objects.count())
+
+    def test_create_invalid_and_duplicate(self):
+        response = self.client.post(reverse('api_videos'), content_type='application/json', data={
+            'name': 'new', 'url': 'https://github.com'})
+        self.assertEqual(400, response.status_code)
+        self.assertIn('url', response.json()['errors'])
+
+        response = self.client.post(reverse('api_videos'), content_type='application/json', data={
+            'name': 'abc', 'url': 'https://youtu.be/123abcdefgh'})
+        self.assertEqual(409, response.status_code)
+
+    def test_bulk_create(self):
+        response = self.client.post(reverse('api_bulk_create_videos'), content_type='application/json', data=[
+            {'name': 'new', 'url': 'https://youtu.be/wtlN-eNmjzI'},
+            {'name': 'dupe', 'url': 'https://youtu.be/123abcdefgh'},
+            'not an object',
+        ])
+
+        self.assertEqual({'created': 1, 'duplicates': 1, 'error_count': 1}, {
+            key: value for key, value in response.json().items() if key != 'errors'})
+        self.assertEqual(3, response.json()['errors'][0]['line'])
+
+    def test_bulk_create_json_lines(self):
+        body = '{"name": "new", "url": "https://youtu.be/wtlN-eNmjzI"}\n{"name": "new2", "url": "https://youtu.be/wtlN-eNmjzJ"}\n'
+
+        response = self.client.post(reverse('api_bulk_create_videos'), content_type='application/x-ndjson', data=body)
+
+        self.assertEqual(2, response.json()['created'])
+
+    def test_bulk_create_json_lines_not_utf8(self):
+        body = ('{"name": "Beyoncé", "url": "https://youtu.be/wtlN-eNmjzI"}\n'.encode('latin-1')
+                + b'{"name": "new2", "url": "https://youtu.be/wtlN-eNmjzJ"}\n')
+
+        response = self.client.post(reverse('api_bulk_create_videos'), content_type='application/x-ndjson', data=body)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.json()['created'])
+        self.assertEqual([{'line': 1, 'message': 'Line is not UTF-8 text'}], response.json()['errors'])
+
+    def test_stream_all_videos(self):
+        response = self.client.get(reverse('api_all_videos'))
+
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(['123abcdefgh', '124abcdefgh', '125abcdefgh'], [video['video_id'] for video in data])
+
+        response = self.client.get(reverse('api_all_videos') + '?search_term=nothing')
+        self.assertEqual([], json.loads(b''.join(response.streaming_content)))
+
+
+class TestAsyncViews(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.factory = AsyncRequestFactory()
+        self.v1 = Video.objects.create(
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+        self.v2 = Video.objects.create(
+            name='AAA', notes='other', url='https://www.youtube.com/watch?v=124abcdefgh')
+
+    async def test_video_list(self):
+        response = await async_views.video_list(self.factory.get(reverse('video_list')))
+
+        self.assertContains(response, '2 Videos')
+        self.assertIn('ETag', response.headers)
+
+        # Same page as the sync view
+        sync_response = await sync_to_async(views.video_list)(RequestFactory().get(reverse('video_list')))
+        self.assertEqual(sync_response['ETag'], response['ETag'])
+        self.assertEqual(sync_response.render().content, response.content)
+
+    async def test_video_list_not_modified(self):
+        response = await async_views.video_list(self.factory.get(reverse('video_list')))
+
+        response = await async_views.video_list(
+            self.factory.get(reverse('video_list'), headers={'If-None-Match': response['ETag']}))
+
+        self.assertEqual(304, response.status_code)
+
+    async def test_api_list_search(self):
+        response = await async_views.api_videos(self.factory.get(reverse('api_videos') + '?search_term=other'))
+
+        data = json.loads(response.content)
+        self.assertEqual(1, data['count'])
+        self.assertEqual('AAA', data['results'][0]['name'])
+
+    async def test_api_detail(self):
+        response = await async_views.api_video_detail(self.factory.get('/'), '123abcdefgh')
+        self.assertEqual('abc', json.loads(response.content)['name'])
+
+        response = await async_views.api_video_detail(self.factory.get('/'), 'missing1234')
+        self.assertEqual(404, response.status_code)
+
+    async def test_api_stream_all(self):
+        response = await async_views.api_all_videos(self.factory.get(reverse('api_all_videos')))
+
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(['123abcdefgh', '124abcdefgh'], [video['video_id'] for video in json.loads(content)])
+
+    async def test_method_not_allowed(self):
+        response = await async_views.video_list(self.factory.post(reverse('video_list')))
+
+        self.assertEqual(405, response.status_code)
+
+
+class TestSQLiteTuning(TestCase):
+    def test_pragmas_applied_to_connections(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(1, cursor.fetchone()[0])  # 1 is NORMAL
+
+            # From the 'timeout' database option, the PRAGMAs don't change it
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(20000, cursor.fetchone()[0])
+
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(-64000, cursor.fetchone()[0])
+
+    def test_invalid_pragma_rejected(self):
+        with connection.cursor() as cursor:
+            with self.assertRaises(ValueError):
+                db.apply_pragmas(cursor, {'journal_mode': 'WAL; DROP TABLE video_collection_video'})
+
+
+class TestVideoQueryPlans(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN output is SQLite only')
+
+    def query_plan(self, queryset):
+        return queryset.explain()
+
+    # First page, next page and previous page all walk the (lower(name), id) index, no sorting of the table
+    def test_list_pages_use_name_index(self):
+        first_page, _ = pagination.keyset_query(Video.objects.all(), None, 25)
+        next_page, _ = pagination.keyset_query(
+            Video.objects.all(), pagination.encode_cursor(pagination.NEXT, 'abc', 3), 25)
+        previous_page, _ = pagination.keyset_query(
+            Video.objects.all(), pagination.encode_cursor(pagination.PREVIOUS, 'abc', 3), 25)
+
+        self.assertIn('SCAN video_collection_video USING INDEX video_name_lower_id_idx', self.query_plan(first_page))
+
+        for queryset in [next_page, previous_page]:
+            plan = self.query_plan(queryset)
+
+            # SEARCH means it jumps straight to the cursor in the index, instead of scanning from the start
+            self.assertIn('SEARCH video_collection_video USING INDEX video_name_lower_id_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    # A tag's pages walk the same index and check each video's tag, instead of sorting all the tag's videos
+    def test_tag_pages_use_name_index(self):
+        videos = listing.filtered_videos(preview=True, tag='pop')
+        first_page, _ = pagination.keyset_query(videos, None, 25)
+        next_page, _ = pagination.keyset_query(videos, pagination.encode_cursor(pagination.NEXT, 'abc', 3), 25)
+
+        self.assertIn('SCAN video_collection_video USING INDEX video_name_lower_id_idx', self.query_plan(first_page))
+        self.assertIn('SEARCH video_collection_video USING INDEX video_name_lower_id_idx', self.query_plan(next_page))
+
+        for queryset in [first_page, next_page]:
+            self.assertNotIn('TEMP B-TREE', self.query_plan(queryset))
+
+    # Searches find the matching ids in the full text index, and only those rows are read (by primary key).
+    # Only the matches are sorted, never the whole table
+    def test_search_uses_full_text_index(self):
+        queryset, _ = pagination.keyset_query(search.search(Video.objects.all(), 'abc'), None, 25)
+        plan = self.query_plan(queryset)
+
+        self.assertIn('video_collection_video_fts VIRTUAL TABLE INDEX', plan)
+        self.assertIn('SEARCH video_collection_video USING INTEGER PRIMARY KEY', plan)
+        self.assertNotIn('SCAN video_collection_video\n', plan + '\n')
+
+
+class TestBenchmarkSuite(TestCase):
+    def test_generate_videos_command(self):
+        call_command('generate_videos', '30', '--batch-size', '7', stdout=StringIO())
+        self.assertEqual(30, Video.objects.count())
+
+        # Asking for more only adds the missing ones, and every video id is a valid 11 character id
+        call_command('generate_videos', '45', stdout=StringIO())
+        self.assertEqual(45, Video.objects.count())
+        self.assertTrue(all(youtube.is_valid_video_id(video_id)
+                            for video_id in Video.objects.values_list('video_id', flat=True)))
+
+        # A deleted video makes the count lower than the highest number used, those numbers are skipped
+        Video.objects.filter(video_id=synthetic.video_id_for(3)).delete()
+        call_command('generate_videos', '50', '--batch-size', '4', stdout=StringIO())
+        self.assertEqual(50, Video.objects.count())
+
+    def test_bench_views_writes_results(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        output = os.path.join(temp_dir, 'bench.json')
+
+        call_command('bench_views', '--sizes', '20', '--requests', '2', '--output', output, stdout=StringIO())
+
+        with open(output, encoding='utf-8') as f:
+            results = json.load(f)['results']['20']
+
+        # Version, page of videos, their tags and the count
+        self.assertEqual(4, results['video_list']['queries'])
+        self.assertIn('p99_ms', results['video_list_search'])
+        self.assertIn('peak_memory_kb', results['add'])
+
+
+@override_settings(VIDEO_PERF_SAMPLE_RATE=1)
+class TestPerformanceMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_server_timing_header(self):
+        Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+        response = self.client.get(reverse('video_list'))
+
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="4 queries", tpl;dur=[\d.]+$')
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('video_list'))
+        self.client.get(reverse('home'))
+
+        response = self.client.get(reverse('metrics'))
+        text = response.content.decode()
+
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn('# TYPE video_request_duration_seconds histogram', text)
+        self.assertIn('video_request_duration_seconds_count{view="video_list"} 1', text)
+        self.assertIn('video_db_queries_bucket{view="home",le="0"} 1', text)
+        self.assertIn('video_request_duration_seconds_bucket{view="home",le="+Inf"} 1', text)
+        self.assertIn('video_list_cache_misses_total 1', text)
+
+    # Under ASGI the middleware awaits async views itself, their queries are still counted
+    async def test_async_views(self):
+        await sync_to_async(Video.objects.create)(
+            name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+        performance = middleware.PerformanceMiddleware(async_views.api_videos)
+        self.assertTrue(iscoroutinefunction(performance))
+
+        response = await performance(AsyncRequestFactory().get(reverse('api_videos')))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertIn('video_request_duration_seconds_count{view="unknown"} 1', metrics.prometheus_text())
+
+    @override_settings(VIDEO_PERF_SAMPLE_RATE=0)
+    def test_off_when_sample_rate_is_zero(self):
+        response = self.client.get(reverse('home'))
+
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertNotIn('view="home"', metrics.prometheus_text())
+
+
+@override_settings(VIDEO_METADATA_FETCHER='video_collection.metadata.StubFetcher')
+class TestVideoMetadata(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+    def test_detail_page_shows_fetched_metadata(self):
+        metadata.refresh(self.video)
+
+        # The video, its tags and the playlists to add it to, the metadata comes from the cache
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('video_detail', args=['123abcdefgh']))
+
+        self.assertContains(response, 'Video 123abcdefgh by Stub channel')
+
+    def test_old_metadata_is_shown_and_fetched_again(self):
+        row = metadata.refresh(self.video)
+        VideoMetadata.objects.filter(pk=row.pk).update(fetched_at=row.fetched_at - timedelta(days=30))
+        Job.objects.all().delete()
+        cache.clear()
+
+        shown = metadata.get_metadata(self.video)
+
+        self.assertEqual('Video 123abcdefgh', shown.title)
+        self.assertEqual(1, Job.objects.filter(task=metadata.FETCH_TASK).count())
+
+    @override_settings(VIDEO_METADATA_FETCHER='video_collection.tests.FailingFetcher')
+    def test_failed_fetch_is_saved(self):
+        row = metadata.refresh(self.video)
+
+        self.assertEqual('YouTube is down', row.error)
+        self.assertFalse(metadata.is_stale(row, self.video))
+        self.assertIsNone(metadata.get_metadata(self.video))
+
+    def test_changed_url_hides_old_metadata(self):
+        metadata.refresh(self.video)
+
+        self.video.url = 'https://youtu.be/124abcdefgh'
+        self.video.save()
+
+        self.assertIsNone(metadata.get_metadata(self.video))
+        self.assertEqual(1, Job.objects.filter(key=f'metadata:{self.video.pk}', status=Job.QUEUED).count())
+
+    def test_only_new_videos_and_changed_urls_are_fetched(self):
+        Job.objects.all().delete()
+
+        self.video.name = 'renamed'
+        self.video.notes = 'new notes'
+        self.video.save()
+        self.assertEqual(0, Job.objects.count())
+
+        self.video.url = 'https://youtu.be/124abcdefgh'
+        self.video.save()
+        self.assertEqual({f'metadata:{self.video.pk}', f'thumbnail:{self.video.pk}'},
+                         set(Job.objects.values_list('key', flat=True)))
+
+    def test_missing_metadata_is_looked_up_again_after_the_worker_saves_it(self):
+        Job.objects.all().delete()
+
+        self.assertIsNone(metadata.get_metadata(self.video))
+        # Missing is cached briefly, page views in the meantime don't query or queue anything
+        with self.assertNumQueries(0):
+            self.assertIsNone(metadata.get_metadata(self.video))
+
+        # The worker (another process, with its own cache) saves the row and finishes the job
+        VideoMetadata.objects.create(video=self.video, youtube_id='123abcdefgh', title='Fetched', fetched_at=timezone.now())
+        Job.objects.update(status=Job.DONE)
+        cache.delete(metadata.CACHE_KEY.format(pk=self.video.pk, video_id='123abcdefgh'))
+
+        self.assertEqual('Fetched', metadata.get_metadata(self.video).title)
+        self.assertEqual(0, Job.objects.filter(status=Job.QUEUED).count())
+
+    def test_parse_duration(self):
+        self.assertEqual(3723, metadata.parse_duration('PT1H2M3S'))
+        self.assertEqual(45, metadata.parse_duration('PT45S'))
+        self.assertEqual(86400, metadata.parse_duration('P1D'))
+        self.assertIsNone(metadata.parse_duration('P'))
+        self.assertIsNone(metadata.parse_duration('nonsense'))
+
+    def test_fetch_video_metadata_command(self):
+        out = StringIO()
+        call_command('fetch_video_metadata', stdout=out)
+        call_command('fetch_video_metadata', stdout=out)
+
+        self.assertIn('Fetched metadata for 1 videos, 0 failed', out.getvalue())
+        self.assertIn('Fetched metadata for 0 videos, 0 failed', out.getvalue())
+        self.assertEqual('6:54', VideoMetadata.objects.get().duration_display)
+
+
+class FailingFetcher:
+    def __call__(self, video_id):
+        raise metadata.MetadataError('YouTube is down')
+
+
+class TestJobQueue(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        jobs.registry['test_task'] = self.record
+        jobs.registry['test_failing_task'] = self.fail
+
+    def tearDown(self):
+        del jobs.registry['test_task'], jobs.registry['test_failing_task']
+
+    def record(self, **payload):
+        self.calls.append(payload)
+
+    def fail(self):
+        raise RuntimeError('Broken')
+
+    def test_same_key_is_queued_once(self):
+        self.assertIsNotNone(jobs.enqueue('test_task', key='thing:1'))
+        self.assertIsNone(jobs.enqueue('test_task', key='thing:1'))
+
+    def test_same_key_is_not_queued_while_running(self):
+        jobs.enqueue('test_task', key='thing:1')
+        token, claimed = jobs.claim('test-worker')
+
+        self.assertIsNone(jobs.enqueue('test_task', key='thing:1'))
+        jobs.enqueue_many('test_task', [{'number': 1}, {'number': 2}], key=lambda payload: f'thing:{payload["number"]}')
+        self.assertEqual(['thing:1', 'thing:2'], sorted(Job.objects.values_list('key', flat=True)))
+
+        # Once it's done the same work can be queued again
+        jobs.run(claimed[0])
+        self.assertIsNotNone(jobs.enqueue('test_task', key='thing:1'))
+        self.assertEqual(2, Job.objects.filter(key='thing:1').count())
+
+    def test_tasks_read_from_primary(self):
+        jobs.registry['test_task'] = lambda: self.calls.append(routers.is_pinned())
+        jobs.enqueue('test_task')
+
+        token, claimed = jobs.claim('test-worker')
+        jobs.run(claimed[0])
+
+        self.assertEqual([True], self.calls)
+
+    def test_unknown_task(self):
+        with self.assertRaises(jobs.UnknownTask):
+            jobs.enqueue('no_such_task')
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        job = jobs.enqueue('test_failing_task', max_attempts=2)
+
+        token, claimed = jobs.claim('test-worker')
+        self.assertFalse(jobs.run(claimed[0]))
+
+        job.refresh_from_db()
+        self.assertEqual((Job.QUEUED, 1), (job.status, job.attempts))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('RuntimeError: Broken', job.last_error)
+
+        # Not due until the backoff has passed
+        self.assertEqual([], jobs.claim('test-worker')[1])
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        token, claimed = jobs.claim('test-worker')
+        jobs.run(claimed[0])
+
+        job.refresh_from_db()
+        self.assertEqual((Job.FAILED, 2), (job.status, job.attempts))
+
+    def test_claimed_job_is_invisible_until_its_claim_runs_out(self):
+        job = jobs.enqueue('test_task')
+
+        self.assertEqual([job], jobs.claim('worker-1')[1])
+        self.assertEqual([], jobs.claim('worker-2')[1])
+
+        # worker-1 died, its claim runs out and another worker takes the job
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        token, claimed = jobs.claim('worker-2')
+
+        self.assertEqual([job], claimed)
+        self.assertTrue(jobs.run_claimed(job.pk, token))
+        self.assertEqual(2, Job.objects.get(pk=job.pk).attempts)
+
+    def test_backoff_grows(self):
+        self.assertLess(jobs.backoff(1), jobs.backoff(4))
+        self.assertLessEqual(jobs.backoff(50), jobs.BACKOFF_MAX * 1.2)
+
+
+# The worker runs jobs in threads with their own database connections, so the test data has to be committed.
+# One job at a time: the in-memory test database locks whole tables, jobs writing at once would fail each other
+@override_settings(VIDEO_METADATA_FETCHER='video_collection.metadata.StubFetcher',
+                   VIDEO_THUMBNAIL_SOURCE='video_collection.thumbnails.StubSource', VIDEO_DB_REPLICAS=[])
+class TestRunWorker(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        thumbnail_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, thumbnail_root)
+        self.enterContext(override_settings(VIDEO_THUMBNAIL_ROOT=thumbnail_root))
+        self.calls = []
+        jobs.registry['test_task'] = lambda **payload: self.calls.append(payload)
+
+    def tearDown(self):
+        del jobs.registry['test_task']
+
+    def test_run_worker(self):
+        jobs.enqueue('test_task', number=1)
+        jobs.enqueue_many('test_task', [{'number': 2}, {'number': 3}])
+
+        out = StringIO()
+        call_command('run_worker', '--once', '--concurrency', '2', stdout=out)
+
+        self.assertEqual([1, 2, 3], sorted(call['number'] for call in self.calls))
+        self.assertEqual(3, Job.objects.filter(status=Job.DONE).count())
+        self.assertIn('3 jobs done, 0 failed', out.getvalue())
+
+    def test_new_video_is_fetched_in_background(self):
+        Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+        response = self.client.get(reverse('video_detail', args=['123abcdefgh']))
+
+        # Nothing fetched yet, the page doesn't wait for it. The job was queued when the video was saved
+        self.assertIsNone(response.context['metadata'])
+        self.assertContains(response, 'https://www.youtube-nocookie.com/embed/123abcdefgh')
+        self.assertEqual(1, Job.objects.filter(task=metadata.FETCH_TASK, status=Job.QUEUED).count())
+
+        call_command('run_worker', '--once', stdout=StringIO())
+
+        response = self.client.get(reverse('video_detail', args=['123abcdefgh']))
+        self.assertContains(response, 'Video 123abcdefgh by Stub channel')
+
+
+@override_settings(VIDEO_THUMBNAIL_SOURCE='video_collection.thumbnails.StubSource')
+class TestThumbnails(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.enterContext(override_settings(VIDEO_THUMBNAIL_ROOT=self.root))
+
+        self.video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+    def test_saved_video_queues_thumbnail_job(self):
+        self.assertTrue(Job.objects.filter(task=thumbnails.GENERATE_TASK, key=f'thumbnail:{self.video.pk}').exists())
+
+    def test_generate_stores_files_named_by_hash(self):
+        thumbnail = thumbnails.generate(self.video)
+
+        for relative_path in thumbnail.files.values():
+            with open(os.path.join(self.root, relative_path), 'rb') as f:
+                content = f.read()
+            self.assertIn(hashlib.sha256(content).hexdigest(), relative_path)
+
+    def test_video_list_shows_lazy_thumbnail(self):
+        self.client.get(reverse('video_list'))
+        thumbnail = thumbnails.generate(self.video)
+
+        # The video's card and the cached page are replaced, the thumbnail shows straight away
+        response = self.client.get(reverse('video_list'))
+
+        self.assertContains(response, f'src="{thumbnail.jpeg_url}"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_thumbnail_file_served_with_long_cache(self):
+        thumbnail = thumbnails.generate(self.video)
+
+        response = self.client.get(thumbnail.jpeg_url)
+
+        self.assertEqual(200, response.status_code)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_job_skips_videos_with_a_thumbnail(self):
+        thumbnails.generate(self.video)
+        updated_at = Video.objects.get(pk=self.video.pk).updated_at
+
+        thumbnails.generate_thumbnail(self.video.pk)
+
+        self.assertEqual(updated_at, Video.objects.get(pk=self.video.pk).updated_at)
+        self.assertEqual(1, Thumbnail.objects.count())
+
+    @skipIf(thumbnails.Image is None, 'Pillow is not installed')
+    def test_resized_variants(self):
+        thumbnail = thumbnails.generate(self.video)
+
+        self.assertEqual(['160.jpg', '160.webp', '320.jpg', '320.webp'], sorted(thumbnail.files))
+        self.assertIn(' 320w', thumbnail.webp_srcset)
+
+
+class TestExportVideos(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.v1 = Video.objects.create(name='Blinding Lights', notes='synth, "80s"',
+                                       url='https://www.youtube.com/watch?v=123abcdefgh')
+        self.v2 = Video.objects.create(name='Save Your Tears', url='https://www.youtube.com/watch?v=124abcdefgh')
+
+    def test_export_csv(self):
+        response = self.client.get(reverse('export_videos'))
+
+        self.assertEqual('attachment; filename="videos.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(['123abcdefgh', '124abcdefgh'], [row['video_id'] for row in rows])
+        self.assertEqual('synth, "80s"', rows[0]['notes'])
+
+    def test_export_jsonl_with_search(self):
+        response = self.client.get(reverse('export_videos') + '?format=jsonl&search_term=tears')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(['Save Your Tears'], [json.loads(line)['name'] for line in lines])
+
+    def test_export_tag(self):
+        tagging.set_tags(self.v2, ['80s'])
+
+        response = self.client.get(reverse('export_videos') + '?format=jsonl&tag=80s')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(['Save Your Tears'], [json.loads(line)['name'] for line in lines])
+
+    def test_export_gzip(self):
+        plain = b''.join(self.client.get(reverse('export_videos') + '?format=jsonl').streaming_content)
+        response = self.client.get(reverse('export_videos') + '?format=jsonl&gzip=1')
+
+        self.assertEqual('application/gzip', response['Content-Type'])
+        self.assertEqual(plain, gzip.decompress(b''.join(response.streaming_content)))
+
+    def test_unknown_format(self):
+        self.assertEqual(400, self.client.get(reverse('export_videos') + '?format=xml').status_code)
+
+    def test_export_command_output_can_be_imported(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'videos.csv.gz')
+
+        call_command('export_videos', path, '--chunk-size', '1', stdout=StringIO())
+        Video.objects.all().delete()
+
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            report = importers.import_file(f, 'csv')
+
+        self.assertEqual(2, report.created)
+        self.assertEqual('synth, "80s"', Video.objects.get(video_id='123abcdefgh').notes)
+
+
+    def test_export_command_tag(self):
+        tagging.set_tags(self.v1, ['80s'])
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'videos.jsonl')
+
+        call_command('export_videos', path, '--tag', '80s', stdout=StringIO())
+
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(['123abcdefgh'], [json.loads(line)['video_id'] for line in f])
+
+class TestDuplicateDetection(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+    def test_duplicate_with_another_url_shape_is_rejected_before_saving(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('add_video'), {
+                'name': 'again', 'url': 'https://youtu.be/123abcdefgh?t=30', 'notes': ''})
+
+        messages = [message.message for message in response.context['messages']]
+        self.assertIn('Duplicate video, video was already added before', messages)
+        self.assertFalse(any(query['sql'].startswith('INSERT') for query in queries))
+        self.assertEqual(1, Video.objects.count())
+
+    def test_new_video_is_checked_without_a_query(self):
+        # The first check loads the filter from the table
+        self.assertFalse(duplicates.is_duplicate('124abcdefgh'))
+
+        with self.assertNumQueries(0):
+            self.assertFalse(duplicates.is_duplicate('125abcdefgh'))
+
+        # Saved videos are added to the filter straight away
+        Video.objects.create(name='def', url='https://youtu.be/125abcdefgh')
+        with self.assertNumQueries(1):
+            self.assertTrue(duplicates.is_duplicate('125abcdefgh'))
+
+    def test_editing_a_video_is_not_a_duplicate_of_itself(self):
+        form = videoForm({'name': 'new name', 'url': self.video.url, 'notes': ''}, instance=self.video)
+
+        self.assertTrue(form.is_valid())
+
+    def test_bulk_created_videos_are_known(self):
+        duplicates.is_duplicate('124abcdefgh')
+        importers.import_rows([(2, {'name': 'def', 'url': 'https://youtu.be/124abcdefgh'})])
+
+        self.assertTrue(duplicates.known_ids.might_exist('124abcdefgh'))
+
+    def test_bloom_filter(self):
+        bloom = duplicates.BloomFilter(1000, 0.01)
+        for number in range(1000):
+            bloom.add(f'video{number}')
+
+        self.assertTrue(all(f'video{number}' in bloom for number in range(1000)))
+        false_positives = sum(f'other{number}' in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TestCatalogueCounters(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.video = Video.objects.create(name='abc', notes='example', url='https://www.youtube.com/watch?v=123abcdefgh')
+
+    def test_counters_follow_saves_and_deletes(self):
+        Video.objects.create(name='Blinding Lights', url='https://youtu.be/124abcdefgh')
+        importers.import_rows([(2, {'name': '99 problems', 'url': 'https://youtu.be/125abcdefgh'})])
+        self.assertEqual(3, counters.total())
+        self.assertEqual({'a': 1, 'b': 1, '#': 1}, {k: v for k, v in counters.letter_counts().items() if v})
+
+        self.video.name = 'xyz'
+        self.video.save()
+        self.assertEqual({'x': 1, 'b': 1, '#': 1}, {k: v for k, v in counters.letter_counts().items() if v})
+
+        self.video.delete()
+        self.assertEqual(2, counters.total())
+        stored = dict(CatalogueCounter.objects.exclude(value=0).values_list('key', 'value'))
+        self.assertEqual(counters.compute(), stored)
+
+    def test_video_list_never_counts_the_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('video_list'))
+
+        self.assertContains(response, '1 Video')
+        self.assertFalse([query['sql'] for query in queries if 'COUNT(' in query['sql'].upper()])
+
+    def test_reconcile_command(self):
+        Video.objects.filter(pk=self.video.pk).update(name='zzz')
+        CatalogueCounter.objects.filter(key=counters.TOTAL).update(value=42)
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+
+        self.assertIn('videos: 42 -> 1', out.getvalue())
+        self.assertEqual(counters.compute(), dict(CatalogueCounter.objects.values_list('key', 'value')))
+
+    def test_stats_api(self):
+        response = self.client.get(reverse('api_video_stats'))
+
+        self.assertEqual(1, response.json()['count'])
+        self.assertEqual(1, response.json()['by_letter']['a'])
+
+
+class TestTagsAndPlaylists(TestCase):
+    def add_videos(self, count, tags='', start=0):
+        videos = []
+        for number in range(start, start + count):
+            response = self.client.post(reverse('add_video'), {
+                'name': f'video {number}', 'url': f'https://youtu.be/{number:03}abcdefgh', 'notes': '', 'tags': tags})
+            self.assertEqual(302, response.status_code)
+            videos.append(Video.objects.get(video_id=f'{number:03}abcdefgh'))
+        return videos
+
+    def test_tag_counts_follow_every_change(self):
+        first, second = self.add_videos(2, 'Pop, 80s, pop')
+        pop = Tag.objects.get(slug='pop')
+        self.assertEqual(['80s', 'Pop'], [tag.name for tag in first.tags.order_by('name')])
+        self.assertEqual(2, Tag.objects.get(slug='pop').video_count)
+
+        first.tags.remove(pop, pop)
+        self.assertEqual(1, Tag.objects.get(slug='pop').video_count)
+        pop.videos.add(first, second)
+        self.assertEqual(2, Tag.objects.get(slug='pop').video_count)
+        pop.videos.clear()
+        self.assertEqual(0, Tag.objects.get(slug='pop').video_count)
+
+        second.delete()
+        self.assertEqual(1, Tag.objects.get(slug='80s').video_count)
+        self.assertEqual({}, tagging.reconcile())
+
+    def test_rolled_back_tags_are_not_counted(self):
+        video, = self.add_videos(1)
+
+        with self.assertRaises(ValueError), transaction.atomic():
+            tagging.set_tags(video, ['pop'])
+            raise ValueError
+
+        self.assertEqual(0, Tag.objects.filter(video_count__gt=0).count())
+
+    def test_video_list_queries_do_not_grow_with_the_page(self):
+        self.add_videos(3, 'pop, rock')
+        self.client.get(reverse('video_list'))
+        cache.clear()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('video_list'))
+
+        self.add_videos(10, 'pop, rock, jazz', start=3)
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('video_list'))
+
+        self.assertEqual(len(few), len(many))
+        self.assertContains(response, '?tag=jazz')
+
+    def test_tag_filter_with_search(self):
+        self.add_videos(2, 'pop')
+        self.client.post(reverse('add_video'), {
+            'name': 'video rock', 'url': 'https://youtu.be/999abcdefgh', 'notes': '', 'tags': 'rock'})
+
+        response = self.client.get(reverse('video_list') + '?tag=pop')
+        self.assertEqual(['video 0', 'video 1'], [video.name for video in response.context['videos']])
+        self.assertContains(response, '2 Videos')
+
+        response = self.client.get(reverse('video_list') + '?tag=rock&search_term=video')
+        self.assertEqual(['video rock'], [video.name for video in response.context['videos']])
+
+        response = self.client.get(reverse('video_list') + '?tag=pop&search_term=video&order=relevance')
+        self.assertEqual(2, len(response.context['videos']))
+
+        response = self.client.get(reverse('api_videos') + '?tag=rock')
+        self.assertEqual([['rock']], [video['tags'] for video in response.json()['results']])
+
+    def test_api_tags_must_be_text_or_a_list_of_names(self):
+        for tags in (5, True, {}, ['pop', 1]):
+            response = self.client.post(reverse('api_videos'), content_type='application/json', data={
+                'name': 'new', 'url': 'https://youtu.be/wtlN-eNmjzI', 'tags': tags})
+            self.assertEqual(400, response.status_code)
+            self.assertIn('tags', response.json()['errors'])
+
+        response = self.client.post(reverse('api_videos'), content_type='application/json', data={
+            'name': 'new', 'url': 'https://youtu.be/wtlN-eNmjzI', 'tags': ['pop', 'Rock']})
+        self.assertEqual(201, response.status_code)
+        self.assertCountEqual(['pop', 'Rock'], response.json()['tags'])
+
+    def test_card_shows_new_tags(self):
+        video, = self.add_videos(1)
+        self.assertNotContains(self.client.get(reverse('video_list')), '#pop')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tagging.set_tags(video, ['pop'])
+
+        self.assertContains(self.client.get(reverse('video_list')), '#pop')
+        self.assertContains(self.client.get(reverse('tag_list')), '(1 video)')
+
+    def test_playlist_pages(self):
+        videos = self.add_videos(5, 'pop')
+        playlist = playlists.create('Road trip')
+        for video in reversed(videos):
+            playlists.add_video(playlist, video)
+        playlists.add_video(playlist, videos[0])
+        playlists.remove_video(playlist, videos[3])
+
+        response = self.client.get(reverse('playlist_detail', args=['road-trip']) + '?page_size=2')
+        self.assertEqual(['video 4', 'video 2'], [video.name for video in response.context['videos']])
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('playlist_detail', args=['road-trip']) +
+                                       f'?page_size=2&after={response.context["page"].next_after}')
+        self.assertEqual(['video 1', 'video 0'], [video.name for video in response.context['videos']])
+
+    def test_add_to_playlist_from_video_page(self):
+        video, = self.add_videos(1)
+        playlist = playlists.create('Road trip')
+
+        response = self.client.post(reverse('playlist_add_video', args=[playlist.slug]), {'video_id': video.video_id})
+
+        self.assertRedirects(response, reverse('video_detail', args=[video.video_id]))
+        self.assertEqual([video], [entry.video for entry in playlist.entries.all()])
+
+
+class TestVideoAdmin(TestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        self.videos = [Video.objects.create(name=f'video {number}', notes='example',
+                                            url=f'https://youtu.be/{number:03}abcdefgh') for number in range(5)]
+
+    def test_changelist_never_counts_the_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:video_collection_video_changelist'))
+
+        self.assertEqual(5, response.context['cl'].result_count)
+        self.assertFalse([query['sql'] for query in queries if 'COUNT(' in query['sql'].upper()])
+        self.assertEqual({'id', 'name', 'video_id', 'updated_at'},
+                         {'id', 'name', 'url', 'video_id', 'updated_at', 'notes'}
+                         - response.context['cl'].result_list[0].get_deferred_fields())
+
+    def test_search_uses_the_indexes(self):
+        response = self.client.get(reverse('admin:video_collection_video_changelist') + '?q=003abcdefgh')
+        self.assertEqual([self.videos[3]], list(response.context['cl'].result_list))
+
+        response = self.client.get(reverse('admin:video_collection_video_changelist') + '?q=video')
+        self.assertEqual(5, response.context['cl'].result_count)
+
+    def test_revalidate_and_delete_duplicates(self):
+        # Changed without save(), so the video ids are now wrong
+        Video.objects.filter(pk=self.videos[1].pk).update(url='https://youtu.be/099abcdefgh')
+        Video.objects.filter(pk=self.videos[2].pk).update(url='https://youtu.be/000abcdefgh')
+        Video.objects.filter(pk=self.videos[4].pk).update(url='https://example.com')
+        changelist = reverse('admin:video_collection_video_changelist')
+        selected = [video.pk for video in self.videos]
+
+        response = self.client.post(changelist, {'action': 'revalidate_urls', '_selected_action': selected},
+                                    follow=True)
+        self.assertContains(response, '1 video ids fixed, 1 invalid urls, 1 duplicates')
+        self.assertEqual('099abcdefgh', Video.objects.get(pk=self.videos[1].pk).video_id)
+
+        self.client.post(changelist, {'action': 'delete_duplicates', '_selected_action': selected})
+        self.assertFalse(Video.objects.filter(pk=self.videos[2].pk).exists())
+        self.assertEqual(4, counters.total())
+
+    def test_tags_are_saved_from_the_admin(self):
+        video = self.videos[0]
+
+        self.client.post(reverse('admin:video_collection_video_change', args=[video.pk]), {
+            'name': video.name, 'url': video.url, 'notes': '', 'tags': 'pop, rock'})
+
+        self.assertEqual(['pop', 'rock'], sorted(video.tags.values_list('slug', flat=True)))
+        self.assertEqual(1, Tag.objects.get(slug='pop').video_count)
+
+
+class TestStaticAssets(TestCase):
+    def setUp(self):
+        super().setUp()
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+
+        settings_override = override_settings(STATIC_ROOT=static_root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'video_collection.storage.PrecompressedManifestStaticFilesStorage'}})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.static_root = static_root
+
+    def test_pages_link_hashed_files_and_no_cdn(self):
+        response = self.client.get(reverse('home'))
+
+        self.assertNotContains(response, 'cdn.')
+        self.assertRegex(response.content.decode(), r'/static/css/base\.[0-9a-f]{12}\.css')
+
+    def test_hashed_files_are_precompressed_and_cached_for_a_year(self):
+        hashed_name = staticfiles_storage.stored_name('css/base.css')
+        with open(os.path.join(self.static_root, hashed_name), 'rb') as f:
+            original = f.read()
+
+        response = self.client.get(f'/static/{hashed_name}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertTrue(response['Content-Type'].startswith('text/css'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(original, gzip.decompress(b''.join(response.streaming_content)))
+
+        # Unhashed names can change, they are checked every time
+        response = self.client.get('/static/css/base.css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class TestAutocomplete(TestCase):
+    def test_prefix_index(self):
+        index = autocomplete.PrefixIndex(['Blinding Lights', 'blinding  lights', 'Blue', 'After Hours', 'Afterlife'])
+
+        self.assertEqual(['blinding lights', 'blue'], index.lookup('BL'))
+        self.assertEqual(['blinding lights'], index.lookup('blinding   l'))
+        self.assertEqual(['after hours'], index.lookup('after '))
+        self.assertEqual(['after hours'], index.lookup('after', limit=1))
+        self.assertEqual([], index.lookup('  '))
+
+        # Another video still has the name
+        index.remove('Blinding Lights')
+        self.assertEqual(['blinding lights', 'blue'], index.lookup('bl'))
+        index.remove('Blinding Lights')
+        self.assertEqual(['blue'], index.lookup('bl'))
+
+        full = autocomplete.PrefixIndex(['a'], max_names=1)
+        self.assertFalse(full.add('b'))
+
+    def test_endpoint_follows_saves_renames_and_deletes(self):
+        video = Video.objects.create(name='Starboy', url='https://youtu.be/123abcdefgh')
+        url = reverse('api_video_autocomplete')
+
+        response = self.client.get(url, {'q': 'sta'})
+        self.assertEqual(['starboy'], response.json()['suggestions'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(name='Save Your Tears', url='https://youtu.be/124abcdefgh')
+            video.name = 'Stargirl'
+            video.save()
+
+        # Answered from memory
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 's'})
+        self.assertEqual(['save your tears', 'stargirl'], response.json()['suggestions'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            video.delete()
+        self.assertEqual([], self.client.get(url, {'q': 'star'}).json()['suggestions'])
+
+    def test_search_box_uses_the_endpoint(self):
+        response = self.client.get(reverse('video_list'))
+
+        self.assertContains(response, f'data-autocomplete-url="{reverse("api_video_autocomplete")}"')
+        self.assertContains(response, 'js/autocomplete.js')
+
+    def test_bench_autocomplete_command(self):
+        out = StringIO()
+        call_command('bench_autocomplete', '--sizes', '2000', '--lookups', '50', stdout=out)
+
+        self.assertIn('2,000 names', out.getvalue())
+        self.assertIn('lookup', out.getvalue())
+
+
+# Routing only, no queries, replica1 isn't a real database here. SimpleTestCase because reads inside a
+# transaction (every Django TestCase) always go to the primary
+@override_settings(VIDEO_DB_REPLICAS=['replica1'])
+class TestReadReplicas(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        self.assertEqual('replica1', self.router.db_for_read(Video))
+        self.assertEqual('replica1', self.router.db_for_read(Tag))
+        self.assertEqual('default', self.router.db_for_write(Video))
+
+    def test_jobs_and_other_apps_read_from_primary(self):
+        self.assertEqual('default', self.router.db_for_read(Job))
+        self.assertEqual('default', self.router.db_for_read(User))
+
+    def test_pinned_reads_go_to_primary(self):
+        with routers.use_primary():
+            self.assertEqual('default', self.router.db_for_read(Video))
+
+        self.assertEqual('replica1', self.router.db_for_read(Video))
+
+    @override_settings(VIDEO_DB_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual('default', self.router.db_for_read(Video))
+
+    def test_replicas_are_not_migrated(self):
+        self.assertIs(False, self.router.allow_migrate('replica1', 'video_collection'))
+        self.assertIsNone(self.router.allow_migrate('default', 'video_collection'))
+
+    def read_database(self, request):
+        databases = []
+
+        def view(request):
+            databases.append(self.router.db_for_read(Video))
+            return HttpResponse()
+
+        response = middleware.ReplicaPinningMiddleware(view)(request)
+        return databases[0], response
+
+    def test_post_reads_from_primary_and_pins_the_browser(self):
+        database, response = self.read_database(self.factory.post('/add'))
+
+        self.assertEqual('default', database)
+        self.assertEqual(10, response.cookies[middleware.PIN_COOKIE]['max-age'])
+
+        request = self.factory.get('/')
+        request.COOKIES[middleware.PIN_COOKIE] = '1'
+        self.assertEqual('default', self.read_database(request)[0])
+
+    def test_get_reads_from_replica(self):
+        database, response = self.read_database(self.factory.get('/'))
+
+        self.assertEqual('replica1', database)
+        self.assertNotIn(middleware.PIN_COOKIE, response.cookies)
+
+    def test_export_reads_from_replica(self):
+        exports = []
+
+        def view(request):
+            exports.append(exporters.exported_videos())
+            return HttpResponse()
+
+        middleware.ReplicaPinningMiddleware(view)(self.factory.get('/export'))
+
+        request = self.factory.get('/export')
+        request.COOKIES[middleware.PIN_COOKIE] = '1'
+        middleware.ReplicaPinningMiddleware(view)(request)
+
+        # Still the request's database when the streamed rows are read, after the middleware is done
+        self.assertEqual(['replica1', 'default'], [videos.db for videos in exports])
+        self.assertEqual('default', exporters.exported_videos(using='default').db)
+
+    async def test_async_requests(self):
+        databases = []
+
+        async def view(request):
+            databases.append(await sync_to_async(self.router.db_for_read)(Video))
+            return HttpResponse()
+
+        pinning = middleware.ReplicaPinningMiddleware(view)
+        self.assertTrue(iscoroutinefunction(pinning))
+
+        await pinning(AsyncRequestFactory().get('/'))
+        response = await pinning(AsyncRequestFactory().post('/add'))
+
+        self.assertEqual(['replica1', 'default'], databases)
+        self.assertEqual(10, response.cookies[middleware.PIN_COOKIE]['max-age'])
+
+    @override_settings(VIDEO_DB_REPLICAS=['replica1', 'replica2', 'replica3'])
+    def test_one_replica_per_request(self):
+        for _ in range(10):
+            databases = []
+
+            def view(request):
+                databases.extend(self.router.db_for_read(model) for model in (Video, Tag, Video, CatalogueCounter) * 5)
+                return HttpResponse()
+
+            middleware.ReplicaPinningMiddleware(view)(self.factory.get('/'))
+            self.assertEqual(1, len(set(databases)))
+
+    def test_pages_read_from_replica_right_after_a_change_are_not_cached(self):
+        caching.bump_generation()
+
+        caching.get_or_compute(None, None, 10, None, lambda: 'stale?', from_replica=True)
+        self.assertEqual('fresh', caching.get_or_compute(None, None, 10, None, lambda: 'fresh', from_replica=True))
+
+        # Replicas have caught up
+        cache.set(caching.BUMPED_AT_KEY, time.time() - caching.REPLICA_LAG - 1, timeout=None)
+        caching.get_or_compute(None, None, 10, None, lambda: 'cached', from_replica=True)
+        self.assertEqual('cached', caching.get_or_compute(None, None, 10, None, lambda: 'new', from_replica=True))
+
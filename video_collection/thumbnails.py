@@ -0,0 +1,159 @@
+import base64
+import hashlib
+import io
+import os
+import tempfile
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Thumbnail, Video
+from . import caching, db, jobs
+
+# Video thumbnails for the video list, so the page doesn't load every image from YouTube.
+# The image is fetched once per video by a pluggable source (VIDEO_THUMBNAIL_SOURCE) in a background job,
+# resized to a few widths as WebP and JPEG, and written under VIDEO_THUMBNAIL_ROOT named by a hash of the bytes.
+# Names never get reused for other bytes, so the files are served with a one year immutable cache header.
+# Resizing needs Pillow (pip install Pillow). Without it the original JPEG is kept as it is.
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+GENERATE_TASK = 'generate_thumbnail'
+
+# Widths of the resized variants, the video cards show them 160 pixels wide (320 for high density screens)
+WIDTHS = (160, 320)
+# Pillow format name for each file extension
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+QUALITY = 80
+
+# A 1x1 grey JPEG, what the stub source gives when Pillow isn't there to draw one
+STUB_JPEG = base64.b64decode(
+    '/9j/4AAQSkZJRgABAQEASABIAAD/2wBDAP//////////////////////////////////////////////////////////////////'
+    '////////////////////wgALCAABAAEBAREA/8QAFBABAAAAAAAAAAAAAAAAAAAAAP/aAAgBAQABPxA=')
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+# Sources take the video id and return the image bytes, they raise ThumbnailError when there is no image
+
+# YouTube's own thumbnail, 480x360
+class YouTubeSource:
+    def __call__(self, video_id):
+        try:
+            with urlopen(f'https://i.ytimg.com/vi/{video_id}/hqdefault.jpg',
+                         timeout=getattr(settings, 'VIDEO_THUMBNAIL_TIMEOUT', 5)) as response:
+                return response.read()
+        except (URLError, OSError) as error:
+            raise ThumbnailError(str(error)) from error
+
+
+# Made up images without network calls, for tests and offline development
+class StubSource:
+    def __call__(self, video_id):
+        if Image is None:
+            return STUB_JPEG
+
+        shade = sum(map(ord, video_id)) % 256
+        output = io.BytesIO()
+        Image.new('RGB', (480, 360), (shade, 128, 255 - shade)).save(output, 'JPEG')
+        return output.getvalue()
+
+
+def get_source():
+    return import_string(getattr(settings, 'VIDEO_THUMBNAIL_SOURCE', 'video_collection.thumbnails.YouTubeSource'))()
+
+
+# Variant name -> bytes e.g( {'160.webp': ..., '160.jpg': ..., '320.webp': ..., '320.jpg': ...} )
+def make_variants(image_bytes):
+    if Image is None:
+        return {'original.jpg': image_bytes}
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except (OSError, ValueError) as error:
+        raise ThumbnailError(f'Not an image: {error}') from error
+
+    image = image.convert('RGB')
+    variants = {}
+
+    for width in WIDTHS:
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+
+        for extension, image_format in FORMATS.items():
+            output = io.BytesIO()
+            resized.save(output, image_format, quality=QUALITY)
+            variants[f'{width}.{extension}'] = output.getvalue()
+
+    return variants
+
+
+def get_root():
+    return settings.VIDEO_THUMBNAIL_ROOT
+
+
+# Write the bytes under a name made from their hash, returns the path relative to the thumbnail root.
+# Files that are already there are kept, they hold the same bytes
+def store(content, extension):
+    digest = hashlib.sha256(content).hexdigest()
+    relative_path = f'{digest[:2]}/{digest}.{extension}'
+    path = os.path.join(get_root(), relative_path)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Written to a temporary file first, so nobody is ever served half a file
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(content)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    return relative_path
+
+
+# Fetch, resize and store the video's thumbnail, returns the Thumbnail row
+def generate(video):
+    variants = make_variants(get_source()(video.video_id))
+
+    files = {name: store(content, name.rsplit('.', 1)[1]) for name, content in variants.items()}
+    thumbnail = db.update_or_create(Thumbnail, {'youtube_id': video.video_id, 'files': files}, video=video)
+
+    # The video's card and the video list pages show the thumbnail now. A new updated_at gives the card a new cache
+    # key and the video list a new ETag. update() doesn't send post_save, so the list cache is invalidated here
+    Video.objects.filter(pk=video.pk).update(updated_at=timezone.now())
+    caching.bump_generation()
+
+    return thumbnail
+
+
+def schedule(pk):
+    jobs.enqueue(GENERATE_TASK, key=f'thumbnail:{pk}', video_pk=pk)
+
+
+def schedule_many(pks, using='default'):
+    jobs.enqueue_many(GENERATE_TASK, [{'video_pk': pk} for pk in pks],
+                      key=lambda payload: f'thumbnail:{payload["video_pk"]}', using=using)
+
+
+@jobs.task(GENERATE_TASK)
+def generate_thumbnail(video_pk):
+    video = Video.objects.filter(pk=video_pk).first()
+
+    # Deleted since it was queued, or already has this video's thumbnail
+    if video is None or Thumbnail.objects.filter(video=video, youtube_id=video.video_id).exists():
+        return
+
+    generate(video)
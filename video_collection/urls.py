@@ -1,11 +1,43 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views # The file of all request functions that directs to the HTML pages
+from . import api # JSON API for other services
+from . import async_views # Async versions of the read views, for ASGI servers
+
+# Serve the read-heavy pages with the async views when running under ASGI
+if getattr(settings, 'VIDEO_ASYNC_VIEWS', False):
+    video_list_view = async_views.video_list
+    api_videos_view = async_views.api_videos
+    api_all_videos_view = async_views.api_all_videos
+    api_video_detail_view = async_views.api_video_detail
+else:
+    video_list_view = views.video_list
+    api_videos_view = api.videos
+    api_all_videos_view = api.all_videos
+    api_video_detail_view = api.video_detail
 
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('add', views.add, name='add_video'),
-    path('video_list',views.video_list, name='video_list')
+    path('video_list',video_list_view, name='video_list'),
+    path('video/<str:video_id>', views.video_detail, name='video_detail'),
+    path('tags', views.tag_list, name='tag_list'),
+    path('playlists', views.playlist_list, name='playlist_list'),
+    path('playlist/<slug:slug>', views.playlist_detail, name='playlist_detail'),
+    path('playlist/<slug:slug>/add', views.playlist_add_video, name='playlist_add_video'),
+    path('import', views.import_videos, name='import_videos'),
+    path('export', views.export_videos, name='export_videos'),
+    path('cache_stats', views.cache_stats, name='cache_stats'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
+    path(settings.VIDEO_THUMBNAIL_URL.strip('/') + '/<path:path>', views.thumbnail_file, name='thumbnail_file'),
+    # In DEBUG runserver serves static files from the app folders before this is reached
+    path(settings.STATIC_URL.strip('/') + '/<path:path>', views.static_file, name='static_file'),
+    path('api/videos', api_videos_view, name='api_videos'),
+    path('api/videos/all', api_all_videos_view, name='api_all_videos'),
+    path('api/videos/bulk', api.bulk_create_videos, name='api_bulk_create_videos'),
+    path('api/videos/stats', api.video_stats, name='api_video_stats'),
+    path('api/videos/autocomplete', api.video_autocomplete, name='api_video_autocomplete'),
+    path('api/videos/<str:video_id>', api_video_detail_view, name='api_video_detail'),
 ]
-
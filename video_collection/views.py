@@ -1,24 +1,44 @@
-from django.shortcuts import render, redirect
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.shortcuts import get_object_or_404, redirect
+
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
 
 from .forms import videoForm, SearchForm
 
 # Temp messages from django
 from django.contrib import messages
 
-from .models import Video
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+
+from django.views.decorators.csrf import csrf_exempt
+from django.views.static import serve
+
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.cache import cache_control
+
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from .models import Playlist, Tag, Video
 
 from django.core.exceptions import ValidationError
 
 from django.db import IntegrityError
 
-from django.db.models.functions import Lower  # Lowercase
+from .pagination import clean_page_size
+
+from . import caching, exporters, importers, listing, metadata, metrics, playlists, thumbnails
 
 # Create your views here.
+# Pages are TemplateResponses, rendered after the view returns, so the performance middleware can time the rendering
 
 
 def home(request):
     app_name = 'The Weeknd\'s mind'
-    return render(request, 'video_collection/home.html', {'app_name': app_name})
+    return TemplateResponse(request, 'video_collection/home.html', {'app_name': app_name})
 
 
 def add(request):
@@ -46,36 +66,234 @@ def add(request):
                 messages.warning(
                     request, 'Duplicate video, video was already added before')
 
+        # The url is checked when the form is validated, so an invalid YT url makes the form invalid
+        elif new_video_form.has_error('url', code='invalid_youtube_url'):
+            messages.warning(request, 'Invalid Youtube URL')
+
+        # Duplicates are found when the form is validated too, without trying to save them.
+        # The IntegrityError above only happens when another request saved the same video at the same time
+        elif new_video_form.has_error('url', code='duplicate_video'):
+            messages.warning(request, 'Duplicate video, video was already added before')
+
         # Warning messages if form is not valid and passes all the other except functions
         messages.warning(request, 'Please check data entered.')
         # Render and show the same page to them WITH their new added video information
-        return render(request, 'video_collection/add.html', {'new_video_form': new_video_form})
+        return TemplateResponse(request, 'video_collection/add.html', {'new_video_form': new_video_form})
 
     new_video_form = videoForm()
 
-    return render(request, 'video_collection/add.html',
+    return TemplateResponse(request, 'video_collection/add.html',
                   {'new_video_form': new_video_form})
 
 
+# The catalogue version for this request, worked out once and shared by the ETag and Last-Modified functions below
+def _catalogue_version(request):
+    if not hasattr(request, '_catalogue_version'):
+        request._catalogue_version = listing.catalogue_version()
+    return request._catalogue_version
+
+
+def _video_list_etag(request):
+    return _catalogue_version(request).etag(request.GET.urlencode())
+
+
+def _video_list_last_modified(request):
+    return _catalogue_version(request).last_modified
+
+
+# Conditional GET: when the client (or a proxy) already has this page and nothing changed, answer 304 Not Modified
+# right after the version query, without loading any videos or rendering the template.
+# no-cache tells proxies they can keep the page but need to check with us before using it
+@cache_control(no_cache=True)
+@condition(etag_func=_video_list_etag, last_modified_func=_video_list_last_modified)
 def video_list(request):
+    search_form, search_term, order, cursor, page_size, tag = read_video_list_request(request)
+
+    # Comes from the cache when the same page was asked for before and no videos have changed since
+    video_page = listing.load_page(search_term, order, cursor, page_size, preview=True, tag=tag)
+    cards = caching.get_cards(video_page.page.items, render_video_card)
+
+    return render_video_list(request, search_form, video_page, cards, tag)
+
+
+# Search form, search term, order, cursor, page size and tag from the users' request (also used by the async video list)
+def read_video_list_request(request):
     # Build form from data users has sent to app
     search_form = SearchForm(request.GET)
+    search_term = order = None
+
+    # Tag links on the video cards filter the list by a tag e.g( video_list?tag=hip-hop ), with or without a search
+    tag = request.GET.get('tag') or None
 
     if search_form.is_valid():
         # Searching the key word in the db
         # example: 'slowed'
         search_term = search_form.cleaned_data['search_term']
-
-        videos = Video.objects.filter(name__icontains=search_term).order_by(
-            Lower('name'))  # Match all that contains that search word case insensitive
+        order = search_form.cleaned_data['order']
 
     else:  # Form is not filled in or this is te first time the users see's this page
-        search_form = SearchForm()
-        videos = Video.objects.order_by(Lower('name'))
+        search_form = SearchForm(initial={'tag': tag})
+
+    # Only load one page of videos, ordered by name. The cursor comes from the next/previous links
+    page_size = clean_page_size(request.GET.get('page_size'))
+
+    return search_form, search_term, order, request.GET.get('cursor'), page_size, tag
 
-    # # Grab all videos from the object
-    # videos = Video.objects.all()
+
+def render_video_list(request, search_form, video_page, cards, tag=None):
+    page = video_page.page
 
     # Render to video_list.html page
-    return render(request, 'video_collection/video_list.html',
-                  {'videos': videos, 'search_form': search_form})
+    return TemplateResponse(request, 'video_collection/video_list.html',
+                  {'videos': page.items, 'cards': cards, 'page': page, 'video_count': video_page.video_count,
+                   'search_form': search_form, 'tag': tag,
+                   'next_query': _page_query(request, page.next_cursor),
+                   'previous_query': _page_query(request, page.previous_cursor)})
+
+
+# One video with its full notes (the video list only loads the start of them) and its YouTube metadata.
+# The metadata comes from our own table or cache, if it's missing or old it's fetched in the background
+def video_detail(request, video_id):
+    video = get_object_or_404(Video.objects.prefetch_related('tags'), video_id=video_id)
+
+    return TemplateResponse(request, 'video_collection/video_detail.html',
+                            {'video': video, 'metadata': metadata.get_metadata(video),
+                             'playlists': Playlist.objects.order_by('name')})
+
+
+# Every tag that's on a video, most used first. The counts are kept on the tags, nothing is counted here
+def tag_list(request):
+    tags = Tag.objects.filter(video_count__gt=0).order_by('-video_count', 'name')
+
+    return TemplateResponse(request, 'video_collection/tag_list.html', {'tags': tags})
+
+
+def playlist_list(request):
+    return TemplateResponse(request, 'video_collection/playlist_list.html',
+                            {'playlists': Playlist.objects.order_by('name')})
+
+
+# One page of a playlist's videos in playlist order, ?after= is the position the page starts after
+def playlist_detail(request, slug):
+    playlist = get_object_or_404(Playlist, slug=slug)
+
+    try:
+        after = max(0, int(request.GET.get('after', 0)))
+    except ValueError:
+        after = 0
+
+    page = playlists.load_page(playlist, after, clean_page_size(request.GET.get('page_size')))
+    cards = caching.get_cards(page.videos, render_video_card)
+
+    return TemplateResponse(request, 'video_collection/playlist_detail.html',
+                            {'playlist': playlist, 'page': page, 'videos': page.videos, 'cards': cards})
+
+
+# Add a video to the end of a playlist, from the form on the video's page
+@require_POST
+def playlist_add_video(request, slug):
+    playlist = get_object_or_404(Playlist, slug=slug)
+    video = get_object_or_404(Video, video_id=request.POST.get('video_id'))
+
+    playlists.add_video(playlist, video)
+    messages.info(request, f'Added to {playlist.name}')
+
+    return redirect('video_detail', video_id=video.video_id)
+
+
+# HTML for one video on the video list, cached per video by caching.get_cards()
+def render_video_card(video):
+    return render_to_string('video_collection/_video_card.html', {'video': video})
+
+
+# Query string for a next/previous link, keeping the search term and page size the users already picked
+def _page_query(request, cursor):
+    if cursor is None:
+        return None
+
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return query.urlencode()
+
+
+# Bulk import endpoint for other services, POST a CSV or JSONL file as the 'file' field of a multipart form
+# e.g( curl -F file=@videos.jsonl http://localhost:8000/import )
+# The upload is read as a stream, the same way as the import_videos command reads files
+@csrf_exempt
+@require_POST
+def import_videos(request):
+    upload = request.FILES.get('file')
+
+    if upload is None:
+        return JsonResponse({'error': 'Missing file'}, status=400)
+
+    file_format = request.POST.get('format') or importers.guess_format(upload.name)
+
+    if file_format not in importers.FORMATS:
+        return JsonResponse({'error': f'Unknown format {file_format}'}, status=400)
+
+    report = importers.import_file(importers.open_text(upload), file_format)
+
+    return JsonResponse(report.as_dict())
+
+
+# Download every video (or the ones matching search_term, same as the video list search) as CSV or JSONL
+# e.g( curl -o videos.csv.gz 'http://localhost:8000/export?format=csv&gzip=1' )
+# The file is written while the rows are read from the database, so it can be any size
+@require_GET
+def export_videos(request):
+    file_format = request.GET.get('format', 'csv')
+
+    if file_format not in exporters.FORMATS:
+        return JsonResponse({'error': f'Unknown format {file_format}'}, status=400)
+
+    compress = request.GET.get('gzip') == '1'
+    chunks = exporters.export(file_format, request.GET.get('search_term') or None, compress,
+                              tag=request.GET.get('tag') or None)
+
+    response = StreamingHttpResponse(
+        chunks, content_type='application/gzip' if compress else f'{exporters.CONTENT_TYPES[file_format]}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{exporters.filename(file_format, compress)}"'
+    return response
+
+
+# Thumbnail files, for when the web server doesn't serve VIDEO_THUMBNAIL_ROOT itself.
+# File names are hashes of their bytes, so browsers and proxies can keep them for a year without checking again
+def thumbnail_file(request, path):
+    response = serve(request, path, document_root=thumbnails.get_root())
+    patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+    return response
+
+
+# Collected static files (python manage.py collectstatic), for when the web server doesn't serve STATIC_ROOT itself.
+# Content hashed names (from the manifest) are cached for a year, other names must be checked every time.
+# Browsers that take brotli or gzip get the precompressed copy made by collectstatic (see storage.py)
+def static_file(request, path):
+    accepted = request.headers.get('Accept-Encoding', '')
+    served_path = path
+
+    for encoding, extension in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accepted and os.path.isfile(os.path.join(settings.STATIC_ROOT, path + extension)):
+            served_path = path + extension
+            break
+
+    # serve() sets Content-Type from the original name, and Content-Encoding from the .br/.gz
+    response = serve(request, served_path, document_root=settings.STATIC_ROOT)
+    patch_vary_headers(response, ['Accept-Encoding'])
+
+    if path in getattr(staticfiles_storage, 'hashed_files', {}).values():
+        patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+
+    return response
+
+
+# Hit and miss counts of the video list result cache in this process, for monitoring to scrape
+def cache_stats(request):
+    return JsonResponse(caching.stats.as_dict())
+
+
+# Request timing histograms and cache counters in the Prometheus text format, for Prometheus to scrape
+def prometheus_metrics(request):
+    return HttpResponse(metrics.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,116 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+# YouTube url parsing, shared by the Video model, the add form and the bulk importer.
+# Accepted urls (https only), all giving back the 11 character video id:
+#   https://www.youtube.com/watch?v=ID   (also youtube.com and m.youtube.com, extra query params are fine)
+#   https://youtu.be/ID
+#   https://www.youtube.com/shorts/ID
+#   https://www.youtube.com/embed/ID
+# Recent results are remembered in an LRU cache, so the same url is only parsed once
+
+# Video ids are 11 characters of letters, numbers, - and _
+VIDEO_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{11}')
+
+WATCH_HOSTS = frozenset(['www.youtube.com', 'youtube.com', 'm.youtube.com'])
+SHORT_HOST = 'youtu.be'
+
+# Paths where the video id is the next part of the path e.g( /shorts/ID )
+ID_PATH_PREFIXES = ('/shorts/', '/embed/')
+
+CACHE_SIZE = getattr(settings, 'VIDEO_URL_CACHE_SIZE', 4096)
+
+
+class InvalidYouTubeURL(ValidationError):
+    def __init__(self, url):
+        super().__init__(f'Invalid YT Video URL {url}', code='invalid_youtube_url')
+
+
+def is_valid_video_id(video_id):
+    return VIDEO_ID_PATTERN.fullmatch(video_id) is not None
+
+
+# Video id for the url, or None if it's not a YouTube video url we accept.
+# None is cached too, so a bad url repeated through a big import is only parsed once
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse(url):
+    # Cheap checks first, most bad urls stop here before any real parsing
+    if not isinstance(url, str) or not url.startswith('https://'):
+        return None
+
+    try:
+        url_components = urlsplit(url)
+    except ValueError:  # e.g( an invalid IPv6 host )
+        return None
+
+    host = url_components.netloc
+    path = url_components.path
+
+    if host == SHORT_HOST:
+        # https://youtu.be/ID
+        video_id = path[1:]
+
+    elif host in WATCH_HOSTS:
+        if path == '/watch':
+            # https://www.youtube.com/watch?v=ID&t=30, the first v= is the video id
+            video_id = None
+            for parameter in url_components.query.split('&'):
+                if parameter.startswith('v='):
+                    video_id = parameter[2:]
+                    break
+            if video_id is None:
+                return None
+
+        else:
+            for prefix in ID_PATH_PREFIXES:
+                if path.startswith(prefix):
+                    # https://www.youtube.com/shorts/ID or /shorts/ID/
+                    video_id = path[len(prefix):].rstrip('/')
+                    break
+            else:
+                return None
+
+    else:
+        return None
+
+    if not is_valid_video_id(video_id):
+        return None
+
+    return video_id
+
+
+# Video id for the url, raises InvalidYouTubeURL (a ValidationError) for anything else
+def parse_video_id(url):
+    video_id = _parse(url)
+
+    if video_id is None:
+        raise InvalidYouTubeURL(url)
+
+    return video_id
+
+
+# Batch version for importers, a list of video ids in the same order as the urls, with None for invalid urls
+def parse_many(urls):
+    parse = _parse
+    return [parse(url) for url in urls]
+
+
+# The one url we use for a video id, whatever shape of url it came from
+def canonical_url(video_id):
+    return f'https://www.youtube.com/watch?v={video_id}'
+
+
+def normalize_url(url):
+    return canonical_url(parse_video_id(url))
+
+
+def cache_info():
+    return _parse.cache_info()
+
+
+def clear_cache():
+    _parse.cache_clear()